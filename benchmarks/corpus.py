@@ -0,0 +1,69 @@
+import os
+import random
+import sqlite3
+
+from langchain_core.messages import AIMessage, HumanMessage, ToolMessage
+from langgraph.checkpoint.base import empty_checkpoint
+
+# Synthetic chatbot.db files. Checkpoints are written through the real
+# checkpointer (same serializer, same thread_index maintenance) but without
+# running the graph, so a 100k-thread database builds in reasonable time.
+
+WORDS = (
+    "graph state node tool stock price search news python model token cache "
+    "thread memory latency sqlite stream answer question roadmap explain"
+).split()
+
+def _sentence(rng, words):
+    return " ".join(rng.choice(WORDS) for _ in range(words)).capitalize()
+
+def synthetic_messages(rng, length):
+    """A plausible thread of `length` messages, with occasional tool calls"""
+    messages = []
+    while len(messages) < length:
+        messages.append(HumanMessage(content=_sentence(rng, rng.randint(4, 30)) + "?"))
+        if len(messages) < length - 2 and rng.random() < 0.2:
+            call_id = f"call-{len(messages)}"
+            messages.append(AIMessage(content="", tool_calls=[
+                {"name": "stock", "args": {"symbols": "AAPL"}, "id": call_id}
+            ]))
+            messages.append(ToolMessage(
+                content='{"Global Quote": {"01. symbol": "AAPL", "05. price": "190.55"}}',
+                tool_call_id=call_id, name="stock",
+            ))
+        messages.append(AIMessage(content=_sentence(rng, rng.randint(20, 200)) + "."))
+    return messages[:length]
+
+def generate_db(path, threads, min_len=2, max_len=40, checkpoints_per_thread=1, seed=0):
+    """Create a fresh database at `path` with `threads` synthetic threads"""
+    from chatbot_backend_fixed import IndexedSqliteSaver
+
+    for suffix in ("", "-wal", "-shm"):
+        if os.path.exists(path + suffix):
+            os.remove(path + suffix)
+
+    rng = random.Random(seed)
+    conn = sqlite3.connect(path, check_same_thread=False)
+    # Bulk load: durability is irrelevant for a throwaway corpus
+    conn.execute("PRAGMA synchronous = OFF")
+    saver = IndexedSqliteSaver(conn=conn)
+
+    for n in range(threads):
+        thread_id = f"bench-{n:06d}"
+        messages = synthetic_messages(rng, rng.randint(min_len, max_len))
+        parent = None
+        version = None
+        for step in range(checkpoints_per_thread):
+            version = saver.get_next_version(version, None)
+            visible = messages[: max(1, len(messages) * (step + 1) // checkpoints_per_thread)]
+            checkpoint = empty_checkpoint()
+            checkpoint["channel_values"] = {"messages": visible}
+            checkpoint["channel_versions"] = {"messages": version}
+            config = {"configurable": {"thread_id": thread_id, "checkpoint_ns": ""}}
+            if parent:
+                config["configurable"]["checkpoint_id"] = parent
+            saver.put(config, checkpoint, {"source": "loop", "step": step}, {})
+            parent = checkpoint["id"]
+
+    conn.close()
+    return path
@@ -0,0 +1,163 @@
+import json
+import re
+import threading
+import time
+from collections import deque
+
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, AIMessageChunk
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+from langchain_core.tools import tool
+from pydantic import PrivateAttr
+
+# Deterministic stand-ins for Gemini, DuckDuckGo and AlphaVantage so the
+# workflow can be exercised (and timed) without network access.
+
+TICKER_RE = re.compile(r"\b([A-Z]{2,5})\b")
+
+class FakeChatModel(BaseChatModel):
+    """Chat model with scripted, input-dependent replies.
+
+    - A human message mentioning a ticker ("stock", "price") gets a `stock`
+      tool call, "news"/"latest" gets a search tool call.
+    - After tool results it answers with a short summary.
+    - Anything else gets a fixed-length answer of `answer_words` words.
+    `latency` seconds of simulated model time are added to every call.
+    """
+
+    answer_words: int = 60
+    latency: float = 0.0
+    search_tool_name: str = "duckduckgo_results_json"
+    calls: int = 0
+
+    @property
+    def _llm_type(self):
+        return "fake-chat"
+
+    def bind_tools(self, tools, **kwargs):
+        return self
+
+    def _reply(self, messages):
+        last = messages[-1]
+        if last.type == "tool":
+            return AIMessage(content="Here is what the tools returned: " + str(last.content)[:200])
+        text = last.content if isinstance(last.content, str) else str(last.content)
+        lowered = text.lower()
+        ticker = TICKER_RE.search(text)
+        if ticker and ("stock" in lowered or "price" in lowered):
+            return AIMessage(content="", tool_calls=[{
+                "name": "stock", "args": {"symbols": ticker.group(1)}, "id": f"call-{self.calls}",
+            }])
+        if "news" in lowered or "latest" in lowered:
+            return AIMessage(content="", tool_calls=[{
+                "name": self.search_tool_name, "args": {"query": text}, "id": f"call-{self.calls}",
+            }])
+        words = " ".join(f"word{i}" for i in range(self.answer_words))
+        return AIMessage(content=f"Answer: {words}")
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs):
+        self.calls += 1
+        if self.latency:
+            time.sleep(self.latency)
+        return ChatResult(generations=[ChatGeneration(message=self._reply(messages))])
+
+    def _stream(self, messages, stop=None, run_manager=None, **kwargs):
+        self.calls += 1
+        if self.latency:
+            time.sleep(self.latency)
+        reply = self._reply(messages)
+        if reply.tool_calls:
+            chunk = ChatGenerationChunk(message=AIMessageChunk(content="", tool_call_chunks=[
+                {"name": c["name"], "args": json.dumps(c["args"]), "id": c["id"], "index": i}
+                for i, c in enumerate(reply.tool_calls)
+            ]))
+            yield chunk
+            return
+        for token in reply.content.split(" "):
+            chunk = ChatGenerationChunk(message=AIMessageChunk(content=token + " "))
+            if run_manager:
+                run_manager.on_llm_new_token(chunk.text, chunk=chunk)
+            yield chunk
+
+class FakeRateLimitError(Exception):
+    """What a provider quota error looks like to the scheduler"""
+
+    status_code = 429
+
+class RateLimitedChatModel(FakeChatModel):
+    """FakeChatModel behind a provider-style quota.
+
+    A call is refused with FakeRateLimitError (HTTP 429) when `rpm` calls were
+    already accepted in the last `window` seconds or `max_concurrent` calls
+    are in flight (0 disables either limit).
+    """
+
+    rpm: int = 0
+    max_concurrent: int = 0
+    window: float = 60.0
+    rejected: int = 0
+    _accepted = PrivateAttr(default_factory=deque)
+    _in_flight = PrivateAttr(default=0)
+    _quota_lock = PrivateAttr(default_factory=threading.Lock)
+
+    def _admit(self):
+        with self._quota_lock:
+            now = time.monotonic()
+            while self._accepted and now - self._accepted[0] >= self.window:
+                self._accepted.popleft()
+            if ((self.rpm and len(self._accepted) >= self.rpm)
+                    or (self.max_concurrent and self._in_flight >= self.max_concurrent)):
+                self.rejected += 1
+                raise FakeRateLimitError("429 RESOURCE_EXHAUSTED: quota exceeded")
+            self._accepted.append(now)
+            self._in_flight += 1
+
+    def _done(self):
+        with self._quota_lock:
+            self._in_flight -= 1
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs):
+        self._admit()
+        try:
+            return super()._generate(messages, stop, run_manager, **kwargs)
+        finally:
+            self._done()
+
+    def _stream(self, messages, stop=None, run_manager=None, **kwargs):
+        self._admit()
+        try:
+            yield from super()._stream(messages, stop, run_manager, **kwargs)
+        finally:
+            self._done()
+
+# -----------------------------
+# Stub tools
+# -----------------------------
+
+QUOTE = {
+    "Global Quote": {
+        "01. symbol": "AAPL",
+        "02. open": "189.0000",
+        "03. high": "191.2000",
+        "04. low": "188.1000",
+        "05. price": "190.5500",
+        "06. volume": "51234567",
+        "07. latest trading day": "2024-05-03",
+        "08. previous close": "188.9000",
+        "09. change": "1.6500",
+        "10. change percent": "0.8735%",
+    }
+}
+
+@tool
+def stock(symbols: str) -> dict:
+    """Fetch latest stock price for a given symbol (e.g. AAPL, TSLA)."""
+    return {"Global Quote": dict(QUOTE["Global Quote"], **{"01. symbol": symbols.upper()})}
+
+@tool("duckduckgo_results_json")
+def search(query: str) -> str:
+    """Search the web for current events."""
+    return ", ".join(
+        f"snippet: Result {i} about {query}, title: Result {i}, link: https://example.com/{i}"
+        for i in range(4)
+    )
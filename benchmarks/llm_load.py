@@ -0,0 +1,93 @@
+import argparse
+import json
+import statistics
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from langchain_core.messages import AIMessage, HumanMessage, ToolMessage
+
+from benchmarks.fakes import RateLimitedChatModel
+from llm_scheduler import LLMScheduler
+
+# Spike test for llm_scheduler against a fake provider that answers 429 when
+# its quota is exceeded. Every simulated user sends a first turn and then a
+# follow-up after a tool result, all at once; the report compares calling the
+# model directly with going through the scheduler.
+#
+# Usage (from the repository root):
+#     python -m benchmarks.llm_load --users 40 --provider-rpm 60 --provider-concurrency 4
+
+FIRST_TURN = [HumanMessage(content="Explain how a state graph works")]
+FOLLOW_UP = [
+    HumanMessage(content="What is the stock price of AAPL today?"),
+    AIMessage(content="", tool_calls=[{"name": "stock", "args": {"symbols": "AAPL"}, "id": "call-0"}]),
+    ToolMessage(content='{"price": "190.55"}', tool_call_id="call-0", name="stock"),
+]
+
+def percentile(samples, q):
+    if not samples:
+        return None
+    return statistics.quantiles(samples, n=100, method="inclusive")[q - 1] if len(samples) > 1 else samples[0]
+
+def run(call, users):
+    """Run every user's two calls concurrently; per-kind latencies and failures"""
+    def one(messages, kind):
+        started = time.perf_counter()
+        try:
+            call(messages)
+            return kind, time.perf_counter() - started, None
+        except Exception as e:
+            return kind, time.perf_counter() - started, type(e).__name__
+
+    jobs = [(FIRST_TURN, "first_turn"), (FOLLOW_UP, "follow_up")] * users
+    with ThreadPoolExecutor(max_workers=len(jobs)) as pool:
+        results = list(pool.map(lambda job: one(*job), jobs))
+
+    report = {}
+    for kind in ("first_turn", "follow_up"):
+        ok = [seconds for k, seconds, error in results if k == kind and error is None]
+        report[kind] = {
+            "ok": len(ok),
+            "failed": sum(1 for k, _, error in results if k == kind and error is not None),
+            "p50_seconds": percentile(ok, 50),
+            "p95_seconds": percentile(ok, 95),
+        }
+    return report
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="LLM scheduler spike test")
+    parser.add_argument("--users", type=int, default=40, help="concurrent users")
+    parser.add_argument("--provider-rpm", type=int, default=60, help="fake provider request quota")
+    parser.add_argument("--provider-window", type=float, default=10.0,
+                        help="seconds the request quota applies to")
+    parser.add_argument("--provider-concurrency", type=int, default=4,
+                        help="fake provider in-flight limit")
+    parser.add_argument("--latency", type=float, default=0.2, help="simulated model seconds")
+    args = parser.parse_args(argv)
+
+    def provider():
+        return RateLimitedChatModel(
+            latency=args.latency, rpm=args.provider_rpm, window=args.provider_window,
+            max_concurrent=args.provider_concurrency,
+        )
+
+    direct_model = provider()
+    direct = run(direct_model.invoke, args.users)
+
+    scheduled_model = provider()
+    scheduler = LLMScheduler(
+        max_concurrency=args.provider_concurrency,
+        rpm=args.provider_rpm * 60 / args.provider_window,
+        max_retries=8, backoff_base=0.1, backoff_max=2, queue_timeout=120,
+    )
+    scheduled = run(lambda messages: scheduler.invoke(scheduled_model, messages), args.users)
+
+    print(json.dumps({
+        "params": vars(args),
+        "direct": dict(direct, provider_429s=direct_model.rejected),
+        "scheduled": dict(scheduled, provider_429s=scheduled_model.rejected,
+                          scheduler=scheduler.stats()),
+    }, indent=2))
+
+if __name__ == "__main__":
+    main()
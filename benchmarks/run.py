@@ -0,0 +1,213 @@
+import argparse
+import json
+import os
+import platform
+import random
+import sqlite3
+import statistics
+import subprocess
+import tempfile
+import time
+
+# Offline performance benchmarks for the chatbot backend.
+#
+# Builds synthetic databases (benchmarks/corpus.py), runs the real graph with
+# a fake chat model and stub tools (benchmarks/fakes.py) and reports:
+#   turn latency, checkpoint write time, sidebar load time,
+#   state-restore time and database size.
+#
+# Usage (from the repository root):
+#     python -m benchmarks.run --sizes 100,10000 --output bench.json
+#     python -m benchmarks.run --compare bench.json     # diff against a baseline
+
+from langchain_core.messages import HumanMessage
+from langgraph.checkpoint.base import empty_checkpoint
+
+import db
+from benchmarks import corpus, fakes
+from chatbot_backend_fixed import (
+    IndexedSqliteSaver,
+    build_graph,
+    calculator,
+    make_chat_node,
+)
+from fast_path import FastPathRouter
+from history import HistorySummarizer
+from thread_index import load_thread_index
+from tool_executor import ConcurrentToolNode
+
+DEFAULT_SIZES = "100,10000,100000"
+TURN_PROMPTS = [
+    "Explain how a state graph works",
+    "What is the stock price of AAPL today?",
+    "Give me the latest news on AI",
+    "What is 234*19",
+    "Tell me more about that",
+]
+
+def build_offline_workflow(conn, llm):
+    """The production graph wired to a fake model, stub tools and `conn`"""
+    tools = [fakes.stock, fakes.search, calculator]
+    return build_graph(
+        make_chat_node(llm.bind_tools(tools)),
+        ConcurrentToolNode(tools).node,
+        HistorySummarizer(llm).node,
+        FastPathRouter(calculator, fakes.stock).node,
+        IndexedSqliteSaver(conn=conn),
+    )
+
+def summarize(samples):
+    """Latency summary in milliseconds"""
+    samples = sorted(samples)
+    if not samples:
+        return {}
+    def pct(p):
+        return samples[min(len(samples) - 1, int(p * len(samples)))] * 1000
+    return {
+        "n": len(samples),
+        "mean_ms": statistics.fmean(samples) * 1000,
+        "p50_ms": pct(0.50),
+        "p95_ms": pct(0.95),
+        "max_ms": samples[-1] * 1000,
+    }
+
+def timed(fn, *args, **kwargs):
+    started = time.perf_counter()
+    fn(*args, **kwargs)
+    return time.perf_counter() - started
+
+# -----------------------------
+# Measurements
+# -----------------------------
+
+def bench_sidebar(db_path, repeats):
+    """Time the sidebar query on a pooled connection, as the frontend does"""
+    pool = db.get_pool(db_path)
+    def load():
+        with pool.connection() as conn:
+            load_thread_index(conn)
+    return summarize([timed(load) for _ in range(repeats)])
+
+def bench_state_restore(workflow, thread_ids, rng, repeats):
+    samples = []
+    for _ in range(repeats):
+        config = {"configurable": {"thread_id": rng.choice(thread_ids)}}
+        samples.append(timed(workflow.get_state, config))
+    return summarize(samples)
+
+def bench_checkpoint_write(saver, rng, repeats):
+    """Time raw checkpointer puts of a typical-size thread state"""
+    samples = []
+    for n in range(repeats):
+        checkpoint = empty_checkpoint()
+        checkpoint["channel_values"] = {"messages": corpus.synthetic_messages(rng, 20)}
+        checkpoint["channel_versions"] = {"messages": saver.get_next_version(None, None)}
+        config = {"configurable": {"thread_id": f"write-{n}", "checkpoint_ns": ""}}
+        samples.append(timed(saver.put, config, checkpoint, {"source": "loop", "step": 0}, {}))
+    return summarize(samples)
+
+def bench_turns(workflow, thread_ids, rng, repeats):
+    samples = []
+    for n in range(repeats):
+        config = {"configurable": {"thread_id": rng.choice(thread_ids)}}
+        prompt = TURN_PROMPTS[n % len(TURN_PROMPTS)]
+        samples.append(timed(
+            workflow.invoke, {"messages": [HumanMessage(content=prompt)]}, config
+        ))
+    return summarize(samples)
+
+def bench_size(threads, workdir, args):
+    db_path = os.path.join(workdir, f"bench-{threads}.db")
+    started = time.perf_counter()
+    corpus.generate_db(
+        db_path, threads,
+        min_len=args.min_len, max_len=args.max_len,
+        checkpoints_per_thread=args.checkpoints, seed=args.seed,
+    )
+    build_seconds = time.perf_counter() - started
+    size_bytes = os.path.getsize(db_path)
+
+    rng = random.Random(args.seed)
+    conn = db.connect(db_path)
+    workflow = build_offline_workflow(conn, fakes.FakeChatModel(latency=args.llm_latency))
+    thread_ids = [row[0] for row in conn.execute("SELECT thread_id FROM thread_index")]
+
+    result = {
+        "threads": threads,
+        "db_bytes": size_bytes,
+        "build_seconds": build_seconds,
+        "sidebar_load": bench_sidebar(db_path, args.repeats),
+        "state_restore": bench_state_restore(workflow, thread_ids, rng, args.repeats),
+        "checkpoint_write": bench_checkpoint_write(workflow.checkpointer, rng, args.repeats),
+        "turn": bench_turns(workflow, thread_ids, rng, args.repeats),
+    }
+    conn.close()
+    return result
+
+# -----------------------------
+# Reporting
+# -----------------------------
+
+def git_revision():
+    try:
+        return subprocess.check_output(
+            ["git", "rev-parse", "--short", "HEAD"], stderr=subprocess.DEVNULL, text=True
+        ).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def compare(baseline, current):
+    """Print p50 deltas per size and metric against a baseline report"""
+    base_by_size = {r["threads"]: r for r in baseline["results"]}
+    for result in current["results"]:
+        base = base_by_size.get(result["threads"])
+        if base is None:
+            continue
+        print(f"threads={result['threads']} (vs {baseline.get('revision')})")
+        for metric in ("sidebar_load", "state_restore", "checkpoint_write", "turn"):
+            old, new = base[metric].get("p50_ms"), result[metric].get("p50_ms")
+            if old:
+                print(f"  {metric:17s} p50 {old:9.3f} -> {new:9.3f} ms ({(new - old) / old:+.1%})")
+        old, new = base["db_bytes"], result["db_bytes"]
+        print(f"  {'db_bytes':17s}     {old:9d} -> {new:9d}    ({(new - old) / old:+.1%})")
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Offline chatbot benchmarks")
+    parser.add_argument("--sizes", default=DEFAULT_SIZES, help="comma separated thread counts")
+    parser.add_argument("--repeats", type=int, default=50, help="samples per metric")
+    parser.add_argument("--min-len", type=int, default=2, help="shortest thread (messages)")
+    parser.add_argument("--max-len", type=int, default=40, help="longest thread (messages)")
+    parser.add_argument("--checkpoints", type=int, default=1, help="checkpoints per thread")
+    parser.add_argument("--llm-latency", type=float, default=0.0, help="simulated model seconds")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--workdir", default=None, help="where to build databases")
+    parser.add_argument("--output", default=None, help="write JSON report here")
+    parser.add_argument("--compare", default=None, help="baseline JSON report to diff against")
+    args = parser.parse_args(argv)
+
+    workdir = args.workdir or tempfile.mkdtemp(prefix="chatbot-bench-")
+    os.makedirs(workdir, exist_ok=True)
+    report = {
+        "revision": git_revision(),
+        "python": platform.python_version(),
+        "sqlite": sqlite3.sqlite_version,
+        "params": {k: v for k, v in vars(args).items() if k not in ("output", "compare")},
+        "results": [],
+    }
+    for size in [int(s) for s in args.sizes.split(",") if s.strip()]:
+        print(f"Benchmarking {size} threads...", flush=True)
+        report["results"].append(bench_size(size, workdir, args))
+
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(text)
+    else:
+        print(text)
+
+    if args.compare:
+        with open(args.compare) as f:
+            compare(json.load(f), report)
+
+if __name__ == "__main__":
+    main()
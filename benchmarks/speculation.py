@@ -0,0 +1,87 @@
+import argparse
+import json
+import time
+
+from langchain_core.messages import HumanMessage
+from langchain_core.tools import tool
+
+import db
+from benchmarks import fakes
+from benchmarks.run import summarize
+from chatbot_backend_fixed import IndexedSqliteSaver, build_graph, calculator, make_chat_node
+from fast_path import FastPathRouter
+from history import HistorySummarizer
+from speculation import SpeculativePrefetcher
+from tool_executor import ConcurrentToolNode
+
+# Turn latency with and without speculative tool prefetch (speculation.py).
+# The fake model and stub tools get simulated latency; tool-heavy prompts
+# should save up to min(model latency, tool latency) per turn, and prompts
+# that need no tool should cost the same either way.
+#
+# Usage (from the repository root):
+#     python -m benchmarks.speculation --llm-latency 0.5 --tool-latency 0.3
+
+PROMPTS = {
+    "stock": "What is the $AAPL stock price today?",
+    "news": "Give me the latest news on AI",
+    "plain": "Explain how a state graph works",
+}
+
+def slow_tools(latency):
+    """fakes.stock / fakes.search with `latency` seconds added"""
+
+    @tool("stock")
+    def stock(symbols: str) -> dict:
+        """Fetch latest stock price for a given symbol (e.g. AAPL, TSLA)."""
+        time.sleep(latency)
+        return fakes.stock.invoke({"symbols": symbols})
+
+    @tool("duckduckgo_results_json")
+    def search(query: str) -> str:
+        """Search the web for current events."""
+        time.sleep(latency)
+        return fakes.search.invoke({"query": query})
+
+    return [stock, search, calculator]
+
+def run(args, speculative):
+    tools = slow_tools(args.tool_latency)
+    prefetcher = SpeculativePrefetcher(tools) if speculative else None
+    llm = fakes.FakeChatModel(latency=args.llm_latency)
+    conn = db.connect(":memory:")
+    workflow = build_graph(
+        make_chat_node(llm.bind_tools(tools), prefetcher=prefetcher),
+        ConcurrentToolNode(tools, prefetcher=prefetcher).node,
+        HistorySummarizer(llm).node,
+        FastPathRouter(calculator, tools[0]).node,
+        IndexedSqliteSaver(conn=conn),
+    )
+    samples = {kind: [] for kind in PROMPTS}
+    for n in range(args.repeats):
+        for kind, prompt in PROMPTS.items():
+            config = {"configurable": {"thread_id": f"{kind}-{n}"}}
+            started = time.perf_counter()
+            workflow.invoke({"messages": [HumanMessage(content=prompt)]}, config)
+            samples[kind].append(time.perf_counter() - started)
+    conn.close()
+    return {
+        "turn": {kind: summarize(s) for kind, s in samples.items()},
+        "speculation": prefetcher.stats() if prefetcher is not None else None,
+    }
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Speculative tool prefetch benchmark")
+    parser.add_argument("--llm-latency", type=float, default=0.5, help="simulated model seconds")
+    parser.add_argument("--tool-latency", type=float, default=0.3, help="simulated tool seconds")
+    parser.add_argument("--repeats", type=int, default=10, help="turns per prompt")
+    args = parser.parse_args(argv)
+
+    print(json.dumps({
+        "params": vars(args),
+        "sequential": run(args, speculative=False),
+        "speculative": run(args, speculative=True),
+    }, indent=2))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,89 @@
+import argparse
+import json
+import statistics
+import tempfile
+import time
+
+import numpy as np
+
+from vector_index import HashingEmbedder, VectorIndex, normalize, top_k
+
+# Search latency and recall of vector_index at a given size. Synthetic
+# clustered unit vectors are bulk-loaded into a throwaway index directory;
+# queries are perturbed copies of indexed rows, and recall@k is measured
+# against an exact scan of the same vectors.
+#
+# Usage (from the repository root):
+#     python -m benchmarks.vector_search --rows 1000000 --queries 200
+
+def synthetic(rows, dim, clusters, rng, spread=0.5):
+    """Unit vectors scattered around `clusters` random topics"""
+    centers = rng.standard_normal((clusters, dim), dtype=np.float32)
+    labels = rng.integers(0, clusters, rows)
+    return normalize(centers[labels] + spread * rng.standard_normal((rows, dim), dtype=np.float32))
+
+def percentile(samples, q):
+    return statistics.quantiles(samples, n=100, method="inclusive")[q - 1]
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Vector index search benchmark")
+    parser.add_argument("--rows", type=int, default=1_000_000, help="indexed vectors")
+    parser.add_argument("--dim", type=int, default=256, help="vector dimension")
+    parser.add_argument("--queries", type=int, default=200, help="timed queries")
+    parser.add_argument("--batch", type=int, default=16, help="queries per batched search")
+    parser.add_argument("--tail", type=int, default=10_000, help="rows appended after the merge")
+    parser.add_argument("--probes", type=int, default=None, help="lists probed per query")
+    parser.add_argument("-k", type=int, default=10, help="results per query")
+    args = parser.parse_args(argv)
+
+    rng = np.random.default_rng(0)
+    vectors = synthetic(args.rows, args.dim, 4096, rng)
+    with tempfile.TemporaryDirectory() as path:
+        index = VectorIndex(path, embedder=HashingEmbedder(args.dim))
+        started = time.perf_counter()
+        main_rows = args.rows - args.tail
+        for start in range(0, main_rows, 100_000):
+            stop = min(start + 100_000, main_rows)
+            index.add(vectors[start:stop], [("bench", i) for i in range(start, stop)], merge=False)
+        index.merge(force=True)
+        index.add(vectors[main_rows:], [("bench", i) for i in range(main_rows, args.rows)], merge=False)
+        build_seconds = time.perf_counter() - started
+
+        targets = rng.choice(args.rows, args.queries, replace=False)
+        queries = normalize(vectors[targets] + 0.5 * rng.standard_normal(
+            (args.queries, args.dim), dtype=np.float32) / np.sqrt(args.dim))
+
+        latencies, recall, found = [], [], []
+        for target, query in zip(targets, queries):
+            started = time.perf_counter()
+            (rows, _), = index.search_vectors(query, args.k, args.probes)
+            latencies.append(time.perf_counter() - started)
+            exact = set(top_k(vectors @ query, args.k).tolist())
+            recall.append(len(exact & set(rows.tolist())) / args.k)
+            found.append(int(target) in rows.tolist())
+
+        started = time.perf_counter()
+        for start in range(0, args.queries, args.batch):
+            index.search_vectors(queries[start:start + args.batch], args.k, args.probes)
+        batched = (time.perf_counter() - started) / args.queries
+
+        started = time.perf_counter()
+        for query in queries[:20]:
+            top_k(vectors @ query, args.k)
+        exact_seconds = (time.perf_counter() - started) / 20
+
+        print(json.dumps({
+            "params": vars(args),
+            "index": index.stats(),
+            "build_seconds": round(build_seconds, 1),
+            "search_ms_p50": round(percentile(latencies, 50) * 1000, 2),
+            "search_ms_p95": round(percentile(latencies, 95) * 1000, 2),
+            "batched_ms_per_query": round(batched * 1000, 2),
+            "exact_scan_ms": round(exact_seconds * 1000, 2),
+            "recall_at_k": round(float(np.mean(recall)), 3),
+            "source_row_found": round(float(np.mean(found)), 3),
+        }, indent=2))
+        index.close()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,160 @@
+import asyncio
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future
+
+# -----------------------------
+# TTL + LRU cache
+# -----------------------------
+
+class TTLCache:
+    """Thread-safe LRU cache whose entries expire after `ttl` seconds.
+
+    `get_or_load` de-duplicates concurrent misses: the first caller for a key
+    runs the loader, everyone else waiting on that key shares its result.
+    `aget_or_load` does the same for coroutine loaders, sharing the in-flight
+    loads with sync callers.
+    """
+
+    def __init__(self, ttl=60.0, maxsize=256, should_cache=None):
+        self.ttl = ttl
+        self.maxsize = maxsize
+        # Predicate deciding whether a loaded value is stored (e.g. skip errors)
+        self.should_cache = should_cache or (lambda value: True)
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self._data = OrderedDict()
+        self._inflight = {}
+        self._load_tasks = set()   # async loads, referenced until done
+        self._lock = threading.Lock()
+
+    def _lookup(self, key, now):
+        """Return (found, value); caller must hold the lock"""
+        entry = self._data.get(key)
+        if entry is None:
+            return False, None
+        expires_at, value = entry
+        if expires_at <= now:
+            del self._data[key]
+            return False, None
+        self._data.move_to_end(key)
+        return True, value
+
+    def _store(self, key, value, now):
+        """Insert and evict the least recently used entry; caller holds the lock"""
+        self._data[key] = (now + self.ttl, value)
+        self._data.move_to_end(key)
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+
+    def get(self, key):
+        """Return (found, value) and update hit/miss counters"""
+        with self._lock:
+            found, value = self._lookup(key, time.monotonic())
+            if found:
+                self.hits += 1
+            else:
+                self.misses += 1
+            return found, value
+
+    def set(self, key, value):
+        """Store a value if `should_cache` accepts it"""
+        if not self.should_cache(value):
+            return
+        with self._lock:
+            self._store(key, value, time.monotonic())
+
+    def _begin_load(self, key):
+        """(True, value, None, False) on a hit, else (False, None, in-flight Future, owner)"""
+        with self._lock:
+            found, value = self._lookup(key, time.monotonic())
+            if found:
+                self.hits += 1
+                return True, value, None, False
+            pending = self._inflight.get(key)
+            if pending is None:
+                self.misses += 1
+                pending = Future()
+                self._inflight[key] = pending
+                return False, None, pending, True
+            # Shares the in-flight load, so it costs no upstream call
+            self.coalesced += 1
+            return False, None, pending, False
+
+    def _end_load(self, key, pending, value=None, error=None):
+        """Publish the owner's result (or error) to every waiter"""
+        with self._lock:
+            del self._inflight[key]
+            if error is None and self.should_cache(value):
+                self._store(key, value, time.monotonic())
+        if error is None:
+            pending.set_result(value)
+        else:
+            pending.set_exception(error)
+
+    def get_or_load(self, key, loader):
+        """Return the cached value for key, loading it at most once at a time"""
+        found, value, pending, owner = self._begin_load(key)
+        if found:
+            return value
+        if not owner:
+            return pending.result()
+
+        try:
+            value = loader()
+        except BaseException as e:
+            self._end_load(key, pending, error=e)
+            raise
+        self._end_load(key, pending, value)
+        return value
+
+    async def aget_or_load(self, key, loader):
+        """get_or_load() for a coroutine function `loader`.
+
+        The load runs as its own task, so a caller that is cancelled while
+        waiting never cancels it for the others sharing it.
+        """
+        found, value, pending, owner = self._begin_load(key)
+        if found:
+            return value
+        if owner:
+            def finish(task):
+                self._load_tasks.discard(task)
+                if task.cancelled():
+                    self._end_load(key, pending, error=asyncio.CancelledError())
+                elif task.exception() is not None:
+                    self._end_load(key, pending, error=task.exception())
+                else:
+                    self._end_load(key, pending, task.result())
+            task = asyncio.ensure_future(loader())
+            self._load_tasks.add(task)
+            task.add_done_callback(finish)
+        return await asyncio.shield(asyncio.wrap_future(pending))
+
+    def clear(self):
+        """Drop every entry (counters are kept)"""
+        with self._lock:
+            self._data.clear()
+
+    def __contains__(self, key):
+        """True if key holds a live entry; touches neither the counters nor the LRU order"""
+        with self._lock:
+            entry = self._data.get(key)
+            return entry is not None and entry[0] > time.monotonic()
+
+    def __len__(self):
+        return len(self._data)
+
+    def stats(self):
+        """Counters for dashboards and tests"""
+        with self._lock:
+            lookups = self.hits + self.coalesced + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "coalesced": self.coalesced,
+                "size": len(self._data),
+                "hit_rate": (self.hits + self.coalesced) / lookups if lookups else 0.0,
+            }
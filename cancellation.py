@@ -0,0 +1,226 @@
+import asyncio
+import inspect
+import os
+import threading
+import time
+
+from langchain_core.callbacks import BaseCallbackHandler
+from langchain_core.runnables.config import merge_configs
+
+from metrics import registry
+
+# Per-turn cancellation and deadlines. Each turn carries a CancelToken in
+# config["configurable"]["cancel_token"]; it fires when the turn is
+# superseded (a new message on the same thread), abandoned (the user switched
+# threads, the client disconnected), explicitly stopped, or when its
+# TURN_DEADLINE runs out. Every stage checks it:
+#
+#   summarize / chat_node  refuse to start (guard_node), so the run stops at
+#                          the last completed step's checkpoint
+#   LLM calls              stop waiting for a scheduler slot, rate-limit or
+#                          backoff sleep; a streaming call is interrupted at
+#                          the next token (CancelCallback), an async one is
+#                          cancelled outright
+#   tools                  unfinished calls become error ToolMessages, so the
+#                          AI message's tool calls are always answered and
+#                          the checkpointed thread stays valid for the model
+#
+# Nothing after the stopping point runs, so no further checkpoints are
+# written. Each cancelled turn is counted once, by reason and by the stage
+# that noticed.
+
+# Constants
+# Seconds a turn may take end to end (0 = no deadline)
+TURN_DEADLINE = float(os.getenv('TURN_DEADLINE', '120'))
+# How often blocking waits look at the token
+CANCEL_POLL_SECONDS = 0.05
+CANCEL_TOKEN_KEY = "cancel_token"
+
+class TurnCancelled(Exception):
+    """The turn was cancelled or ran past its deadline"""
+
+    def __init__(self, reason):
+        super().__init__("Turn deadline exceeded" if reason == "deadline" else f"Turn cancelled ({reason})")
+        self.reason = reason
+
+class CancelToken:
+    """Cancellation flag with an optional deadline on time.monotonic()"""
+
+    def __init__(self, deadline=None):
+        self.deadline = deadline
+        self.reason = None
+        self._event = threading.Event()
+        self._lock = threading.Lock()
+        self._counted = False
+
+    @classmethod
+    def with_timeout(cls, seconds=TURN_DEADLINE):
+        return cls(time.monotonic() + seconds if seconds > 0 else None)
+
+    def cancel(self, reason="cancelled"):
+        with self._lock:
+            if self.reason is None:
+                self.reason = reason
+        self._event.set()
+
+    @property
+    def cancelled(self):
+        if not self._event.is_set() and self.deadline is not None and time.monotonic() >= self.deadline:
+            self.cancel("deadline")
+        return self._event.is_set()
+
+    def remaining(self):
+        """Seconds left before the deadline, or None without one"""
+        if self.deadline is None:
+            return None
+        return max(0.0, self.deadline - time.monotonic())
+
+    def error(self, stage):
+        """TurnCancelled to raise; the first stage to notice counts the turn"""
+        with self._lock:
+            first, self._counted = not self._counted, True
+        if first:
+            registry.inc("chatbot_turns_cancelled_total", 1, "Turns stopped by cancellation or deadline",
+                         reason=self.reason or "cancelled", stage=stage)
+        return TurnCancelled(self.reason)
+
+    def check(self, stage):
+        if self.cancelled:
+            raise self.error(stage)
+
+    def sleep(self, seconds):
+        """time.sleep() that returns early; True if the token fired"""
+        remaining = self.remaining()
+        if remaining is not None and remaining < seconds:
+            self._event.wait(remaining)
+        elif self._event.wait(seconds):
+            return True
+        return self.cancelled
+
+    async def asleep(self, seconds):
+        """asyncio.sleep() that returns early; True if the token fired"""
+        until = time.monotonic() + seconds
+        while not self.cancelled:
+            left = until - time.monotonic()
+            if left <= 0:
+                return False
+            await asyncio.sleep(min(left, CANCEL_POLL_SECONDS))
+        return True
+
+def token_for(config):
+    """The turn's CancelToken from a node or tool config, or None"""
+    return ((config or {}).get("configurable") or {}).get(CANCEL_TOKEN_KEY)
+
+# -----------------------------
+# LLM calls
+# -----------------------------
+
+class CancelCallback(BaseCallbackHandler):
+    """Raises TurnCancelled from inside a streaming LLM call at the next token"""
+
+    raise_error = True
+
+    def __init__(self, token, stage="llm"):
+        self.cancel_token = token
+        self.stage = stage
+
+    def on_llm_new_token(self, token, **kwargs):
+        self.cancel_token.check(self.stage)
+
+def cancellable_config(config, token, stage="llm"):
+    """`config` plus a CancelCallback for `token` (unchanged without a token)"""
+    if token is None:
+        return config
+    return merge_configs(config, {"callbacks": [CancelCallback(token, stage)]})
+
+async def race(awaitable, token, stage):
+    """Await `awaitable`, cancelling it as soon as the token fires"""
+    if token is None:
+        return await awaitable
+    task = asyncio.ensure_future(awaitable)
+    try:
+        while True:
+            done, _ = await asyncio.wait({task}, timeout=CANCEL_POLL_SECONDS)
+            if done:
+                return task.result()
+            if token.cancelled:
+                task.cancel()
+                raise token.error(stage)
+    except asyncio.CancelledError:
+        task.cancel()
+        raise
+
+# -----------------------------
+# Nodes and streams
+# -----------------------------
+
+def guard_node(fn, stage):
+    """Graph node that refuses to start once the turn is cancelled"""
+    wants_config = "config" in inspect.signature(fn).parameters
+
+    if inspect.iscoroutinefunction(fn):
+        async def async_node(state, config):
+            token = token_for(config)
+            if token is not None:
+                token.check(stage)
+            return await (fn(state, config) if wants_config else fn(state))
+        return async_node
+
+    def node(state, config):
+        token = token_for(config)
+        if token is not None:
+            token.check(stage)
+        return fn(state, config) if wants_config else fn(state)
+    return node
+
+def guarded_stream(stream, token, reason="abandoned"):
+    """Iterate a workflow stream; a consumer that stops early cancels the turn.
+
+    The token fires before the stream is closed: closing a sync LangGraph
+    stream waits for the running step, which now stops at its next check
+    instead of finishing its LLM or tool calls.
+    """
+    try:
+        for item in stream:
+            yield item
+    finally:
+        token.cancel(reason)
+        stream.close()
+
+class ActiveTurns:
+    """The running turn of each thread, so a new turn or a stop request can cancel it"""
+
+    def __init__(self):
+        self._tokens = {}
+        self._lock = threading.Lock()
+
+    def start(self, thread_id, deadline=TURN_DEADLINE):
+        """Token for a new turn; an unfinished turn of the thread is superseded"""
+        token = CancelToken.with_timeout(deadline)
+        with self._lock:
+            previous = self._tokens.get(thread_id)
+            self._tokens[thread_id] = token
+        if previous is not None:
+            previous.cancel("superseded")
+        return token
+
+    def cancel(self, thread_id, reason="stopped"):
+        """Cancel the thread's running turn; False if there is none"""
+        with self._lock:
+            token = self._tokens.get(thread_id)
+        if token is None:
+            return False
+        token.cancel(reason)
+        return True
+
+    def finish(self, thread_id, token):
+        with self._lock:
+            if self._tokens.get(thread_id) is token:
+                del self._tokens[thread_id]
+
+    def stats(self):
+        with self._lock:
+            return {"running": len(self._tokens)}
+
+# Shared by the Streamlit sessions (or the server) of one process
+active_turns = ActiveTurns()
@@ -0,0 +1,160 @@
+import heapq
+import sqlite3
+import time
+import uuid
+
+from db import delete_thread
+from search_index import SEARCH_PAGE_SIZE, search_threads
+from storage import get_storage
+from thread_index import (
+    load_messages,
+    load_thread_index,
+    set_pinned,
+    set_title,
+)
+
+# Thread metadata helpers shared by the Streamlit frontend and the HTTP
+# server (server.py). Both read and write the same tables: thread_index for
+# listing, chat_titles / chat_pins for user edits, thread_messages for history
+# and message_search for full-text search.
+# Connections come from the storage backend (storage.py): helpers for one
+# thread use that thread's shard, listings query every shard and merge.
+
+def get_current_timestamp():
+    """Get current timestamp as float"""
+    return time.time()
+
+def load_threads_from_db():
+    """Load all threads from the materialized thread index"""
+    threads = {}
+
+    try:
+        shards = []
+        for pool in get_storage().pools():
+            with pool.connection() as conn:
+                shards.append(load_thread_index(conn))
+
+        # Each shard is already in sidebar order: pinned first, most recent first
+        rows = heapq.merge(*shards, key=lambda row: (-row[3], -(row[2] or 0)))
+        for thread_id, title, last_active, pinned in rows:
+            threads[thread_id] = {
+                "title": title or "New Chat",
+                "last": last_active or get_current_timestamp(),
+                "pinned": bool(pinned)
+            }
+
+    except sqlite3.Error as e:
+        print(f"Database error: {e}")
+    except Exception as e:
+        print(f"Unexpected error loading threads: {e}")
+
+    return threads
+
+def delete_thread_from_db(thread_id):
+    """Delete a thread (checkpoints, writes and metadata) from database"""
+    try:
+        with get_storage().pool_for(thread_id).connection() as conn:
+            delete_thread(conn, thread_id)
+        return True
+    except sqlite3.Error as e:
+        print(f"Error deleting thread: {e}")
+        return False
+
+def write_title(conn, thread_id, title):
+    """Store a title (chat_titles and the index) in the caller's transaction"""
+    conn.execute("""
+        INSERT OR REPLACE INTO chat_titles (thread_id, title)
+        VALUES (?, ?)
+    """, (thread_id, title))
+    set_title(conn, thread_id, title)
+
+def write_pin(conn, thread_id, pinned):
+    """Store a pin state (chat_pins and the index) in the caller's transaction"""
+    conn.execute("""
+        INSERT OR REPLACE INTO chat_pins (thread_id, pinned)
+        VALUES (?, ?)
+    """, (thread_id, int(pinned)))
+    set_pinned(conn, thread_id, pinned)
+
+def save_thread_title(thread_id, title):
+    """Save thread title persistently"""
+    try:
+        with get_storage().pool_for(thread_id).transaction() as conn:
+            write_title(conn, thread_id, title)
+        return True
+    except sqlite3.Error as e:
+        print(f"Error saving title: {e}")
+        return False
+
+def save_thread_pin(thread_id, pinned):
+    """Save pinned state persistently"""
+    try:
+        with get_storage().pool_for(thread_id).transaction() as conn:
+            write_pin(conn, thread_id, pinned)
+        return True
+    except sqlite3.Error as e:
+        print(f"Error saving pin state: {e}")
+        return False
+
+def load_thread_pins():
+    """Load pinned states"""
+    pins = {}
+    try:
+        for pool in get_storage().pools():
+            with pool.connection() as conn:
+                for thread_id, pinned in conn.execute("SELECT thread_id, pinned FROM chat_pins"):
+                    pins[thread_id] = bool(pinned)
+    except sqlite3.Error as e:
+        print(f"Error loading pins: {e}")
+
+    return pins
+
+def load_thread_titles():
+    """Load thread titles from persistent storage"""
+    titles = {}
+    try:
+        for pool in get_storage().pools():
+            with pool.connection() as conn:
+                for thread_id, title in conn.execute("SELECT thread_id, title FROM chat_titles"):
+                    titles[thread_id] = title
+    except sqlite3.Error as e:
+        print(f"Error loading titles: {e}")
+
+    return titles
+
+def create_thread(title="New Chat"):
+    """Register a new, empty thread so it is listed before its first message"""
+    thread_id = str(uuid.uuid4())
+    now = get_current_timestamp()
+    try:
+        with get_storage().pool_for(thread_id).transaction() as conn:
+            conn.execute("""
+                INSERT OR IGNORE INTO thread_index (thread_id, title, created_at, last_active)
+                VALUES (?, ?, ?, ?)
+            """, (thread_id, title, now, now))
+    except sqlite3.Error as e:
+        print(f"Error creating thread: {e}")
+        return None
+    return {"thread_id": thread_id, "title": title, "last": now, "pinned": False}
+
+def load_thread_messages(thread_id, limit, before=None):
+    """One page of a thread's displayable messages: (rows, has_more)"""
+    try:
+        with get_storage().pool_for(thread_id).connection() as conn:
+            return load_messages(conn, thread_id, limit, before)
+    except sqlite3.Error as e:
+        print(f"Error loading messages: {e}")
+        return [], False
+
+def search_chats(query, limit=SEARCH_PAGE_SIZE):
+    """Threads matching a full-text query, best first, with snippets"""
+    results = []
+    try:
+        for pool in get_storage().pools():
+            with pool.connection() as conn:
+                results.extend(search_threads(conn, query, limit))
+    except sqlite3.Error as e:
+        print(f"Error searching chats: {e}")
+    # bm25 ranks (lower is better) are comparable across similar shards
+    results.sort(key=lambda result: result["rank"])
+    return results[:limit]
@@ -0,0 +1,261 @@
+import asyncio
+import time
+
+import aiosqlite
+import httpx
+from langchain_core.messages import HumanMessage
+from langchain_core.tools import tool
+from langgraph.checkpoint.sqlite.aio import AsyncSqliteSaver
+
+from chatbot_backend_fixed import (
+    VECTOR_INDEX_ENABLED,
+    ChatState,
+    SYSTEM_PROMPT,
+    build_graph,
+    calculator,
+    get_llm_with_tools,
+    get_response_cache,
+    get_summarizer,
+    get_vector_index,
+    past_conversations,
+    search_tools,
+)
+from cancellation import active_turns, token_for
+from checkpoint_serde import make_serializer
+from fast_path import FastPathRouter
+from history import build_context
+from llm_scheduler import llm_scheduler
+from metrics import record_checkpoint_op, record_llm_call, registry
+from quotes import (
+    MAX_SYMBOLS_PER_CALL,
+    check_quote_payload,
+    normalize_symbol,
+    parse_symbols,
+    quote_cache,
+    quote_url,
+)
+from response_cache import ReplayChatModel, first_turn_question
+from search_index import SEARCH_INDEX_EXISTS_SQL, SEARCH_INDEX_SCRIPT
+from speculation import SPECULATION_ENABLED, SpeculativePrefetcher
+from storage import get_storage, shard_savers
+from tool_compaction import tool_compactor
+from tool_executor import ConcurrentToolNode
+from thread_index import (
+    SCHEMA,
+    TABLE_INFO_SQL,
+    abackfill_thread_index,
+    arecord_checkpoint,
+    column_migrations,
+)
+
+# Async build of the chatbot graph. Same topology, prompt and tool schemas as
+# the sync `workflow` in chatbot_backend_fixed.py, but nothing in a turn blocks
+# the event loop, so one loop can drive many conversations concurrently.
+
+# --------------------- Tools -------------------------
+
+_http_client = None
+
+def _get_http_client():
+    """Shared AsyncClient so quote lookups reuse pooled connections"""
+    global _http_client
+    if _http_client is None:
+        _http_client = httpx.AsyncClient(timeout=10)
+    return _http_client
+
+async def _afetch_quote_uncached(symbol):
+    """One HTTP round trip for one symbol"""
+    try:
+        r = await _get_http_client().get(quote_url(symbol))
+        r.raise_for_status()
+        return check_quote_payload(r.json())
+    except httpx.HTTPError as e:
+        return {"error": f"API request failed: {str(e)}"}
+
+async def _afetch_quote(symbol):
+    """Cached quote for one symbol; concurrent lookups share one request"""
+    symbol = normalize_symbol(symbol)
+    if symbol is None:
+        return {"error": "Invalid stock symbol"}
+    return await quote_cache.aget_or_load(symbol, lambda: _afetch_quote_uncached(symbol))
+
+@tool
+async def stock(symbols: str) -> dict:
+    """Fetch latest stock price for a given symbol (e.g. AAPL, TSLA).
+    Several symbols can be requested at once, comma separated (e.g. "AAPL, MSFT").
+    Uses AlphaVantage API."""
+
+    requested = parse_symbols(symbols)[:MAX_SYMBOLS_PER_CALL]
+    if not requested:
+        return {"error": "Invalid stock symbol"}
+
+    if len(requested) == 1:
+        return await _afetch_quote(requested[0])
+    results = await asyncio.gather(*(_afetch_quote(s) for s in requested))
+    return dict(zip(requested, results))
+
+# DuckDuckGoSearchResults has no native async client; its ainvoke runs the
+# sync search in the loop's default executor, which keeps the loop free.
+async_tools_list = [stock, search_tools, calculator]
+# The vector search is a few ms of numpy; its sync tool runs in the executor too
+if VECTOR_INDEX_ENABLED:
+    async_tools_list.append(past_conversations)
+
+async_prefetcher = SpeculativePrefetcher(async_tools_list) if SPECULATION_ENABLED else None
+async_tool_node = ConcurrentToolNode(async_tools_list, prefetcher=async_prefetcher)
+if async_prefetcher is not None:
+    registry.register_collector("chatbot_async_speculation", async_prefetcher.stats)
+
+async_fast_path = FastPathRouter(calculator, stock)
+
+# -------------------- Node Functions ----------------
+
+async def chat_node(state: ChatState, config):
+    """Main chat node that processes messages with LLM"""
+    messages = build_context(SYSTEM_PROMPT, state)
+
+    cache = get_response_cache()
+    question = first_turn_question(state) if cache is not None else None
+    cached = await asyncio.to_thread(cache.get, question) if question is not None else None
+    if cached is not None:
+        return {'messages': [await ReplayChatModel(text=cached).ainvoke(messages)]}
+
+    if async_prefetcher is not None:
+        async_prefetcher.astart(state, config)
+    response = None
+    started = time.perf_counter()
+    try:
+        response = await llm_scheduler.ainvoke(
+            get_llm_with_tools(), messages, config=config, cancel=token_for(config)
+        )
+    finally:
+        # Prefetches the tools node will not ask for
+        if async_prefetcher is not None and not getattr(response, 'tool_calls', None):
+            async_prefetcher.discard(config)
+    record_llm_call(response, time.perf_counter() - started)
+
+    if question is not None:
+        await asyncio.to_thread(cache.put, question, response)
+
+    return {'messages': [response]}
+
+# ----------------------- Database -----------------------
+
+class IndexedAsyncSqliteSaver(AsyncSqliteSaver):
+    """AsyncSqliteSaver that keeps the thread_index table in sync on every write"""
+
+    def __init__(self, conn, *, serde=None):
+        super().__init__(conn, serde=serde or make_serializer())
+
+    async def setup(self):
+        if self.is_setup:
+            return
+        await super().setup()
+        async with self.lock:
+            await self.conn.executescript(SCHEMA)
+            async with self.conn.execute(TABLE_INFO_SQL) as cursor:
+                existing = {row[1] for row in await cursor.fetchall()}
+            for statement in column_migrations(existing):
+                await self.conn.execute(statement)
+            await self.conn.commit()
+            # Triggers keep message_search current on every aput below
+            async with self.conn.execute(SEARCH_INDEX_EXISTS_SQL) as cursor:
+                indexed = await cursor.fetchone()
+            if not indexed:
+                try:
+                    await self.conn.executescript(SEARCH_INDEX_SCRIPT)
+                except aiosqlite.OperationalError as e:
+                    if self.conn.in_transaction:
+                        await self.conn.rollback()
+                    print(f"Full-text search disabled: {e}")
+        # Index threads written before thread_index existed (no-op afterwards),
+        # as the sync checkpointer does
+        await abackfill_thread_index(self)
+
+    async def aget_tuple(self, config):
+        started = time.perf_counter()
+        try:
+            return await super().aget_tuple(config)
+        finally:
+            record_checkpoint_op("get_tuple", time.perf_counter() - started)
+
+    async def aput_writes(self, config, writes, task_id, task_path=""):
+        started = time.perf_counter()
+        try:
+            return await super().aput_writes(config, writes, task_id, task_path)
+        finally:
+            record_checkpoint_op("put_writes", time.perf_counter() - started)
+
+    async def aput(self, config, checkpoint, metadata, new_versions):
+        started = time.perf_counter()
+        saved = await super().aput(config, checkpoint, metadata, new_versions)
+        messages = checkpoint.get("channel_values", {}).get("messages")
+        if messages is not None:
+            thread_id = str(config["configurable"]["thread_id"])
+            try:
+                async with self.lock:
+                    await arecord_checkpoint(self.conn, thread_id, messages, checkpoint.get("ts"))
+                    await self.conn.commit()
+            except aiosqlite.Error as e:
+                print(f"Error updating thread index: {e}")
+        record_checkpoint_op("put", time.perf_counter() - started)
+        return saved
+
+# ---------------- Graph ----------------
+
+_async_workflow = None
+_init_lock = asyncio.Lock()
+
+async def get_async_workflow():
+    """Build the async workflow once, inside the running event loop"""
+    global _async_workflow
+    if _async_workflow is None:
+        async with _init_lock:
+            if _async_workflow is None:
+                # One IndexedAsyncSqliteSaver per shard (see storage.py)
+                checkpointer = await get_storage().async_checkpointer()
+                _async_workflow = build_graph(
+                    chat_node,
+                    async_tool_node.anode,
+                    get_summarizer().anode,
+                    async_fast_path.anode,
+                    checkpointer,
+                    tool_compactor.anode,
+                )
+                if VECTOR_INDEX_ENABLED:
+                    get_vector_index()
+    return _async_workflow
+
+async def astream(user_input, thread_id, stream_mode="messages"):
+    """Async entry point: stream one turn of a thread.
+
+    The turn gets a cancel token with the TURN_DEADLINE budget; a newer turn
+    of the thread, active_turns.cancel(thread_id) or closing this generator
+    (client gone) cancels it.
+    """
+    workflow = await get_async_workflow()
+    token = active_turns.start(thread_id)
+    stream = workflow.astream(
+        {"messages": [HumanMessage(content=user_input)]},
+        config={"configurable": {"thread_id": thread_id, "cancel_token": token}},
+        stream_mode=stream_mode,
+    )
+    try:
+        async for item in stream:
+            yield item
+    finally:
+        # Cancel before closing: the running step stops at its next check
+        token.cancel("abandoned")
+        await stream.aclose()
+        active_turns.finish(thread_id, token)
+
+async def aclose():
+    """Release the checkpoint connections and HTTP client"""
+    global _async_workflow, _http_client
+    if _async_workflow is not None:
+        for saver in shard_savers(_async_workflow.checkpointer):
+            await saver.conn.close()
+        _async_workflow = None
+    if _http_client is not None:
+        await _http_client.aclose()
+        _http_client = None
@@ -1,16 +1,37 @@
 from langgraph.graph import StateGraph, START, END
-from langchain_google_genai import ChatGoogleGenerativeAI
 from typing import TypedDict, Annotated
 from langgraph.checkpoint.sqlite import SqliteSaver
 # from langchain_core.messages import HumanMessage, BaseMessage
 from langgraph.graph.message import add_messages
-from langgraph.prebuilt import ToolNode, tools_condition
+from langgraph.prebuilt import tools_condition
 from langchain_core.messages import HumanMessage, BaseMessage, SystemMessage
-from langchain_community.tools import DuckDuckGoSearchResults
+from langchain_core.runnables import RunnableConfig
 from langchain_core.tools import tool
 import sqlite3
-import requests
 import os
+import threading
+import time
+
+from cancellation import active_turns, cancellable_config, guard_node, token_for
+from checkpoint_serde import make_serializer
+from fast_path import FastPathRouter, route_after_fast_path
+from history import HistorySummarizer, build_context
+from llm_scheduler import llm_scheduler
+from metrics import instrument_node, record_checkpoint_op, record_llm_call, registry, start_http_server
+from quotes import fetch_quote, fetch_quotes, parse_symbols, quote_cache
+from response_cache import (
+    RESPONSE_CACHE_ENABLED,
+    ReplayChatModel,
+    ResponseCache,
+    first_turn_question,
+    model_name,
+)
+from search_cache import CachedDuckDuckGoSearchResults, search_cache
+from speculation import SPECULATION_ENABLED, SpeculativePrefetcher
+from storage import get_storage, shard_savers
+from thread_index import ensure_thread_index, record_checkpoint
+from tool_compaction import tool_compactor
+from tool_executor import ConcurrentToolNode
 
 from dotenv import load_dotenv
 load_dotenv()
@@ -19,10 +40,48 @@ load_dotenv()
 
 class ChatState(TypedDict):
     messages: Annotated[list[BaseMessage], add_messages]
-    
-llm = ChatGoogleGenerativeAI(model="models/gemini-2.5-flash-lite")
+    # Rolling summary of messages[:summarized_count], maintained by `summarize`
+    summary: str
+    summarized_count: int
+
+# ------------------- Lazy resources ---------------------
+
+# Nothing expensive happens at import: the Gemini client, the SQLite
+# connection and the compiled graph are built on first use, once per process,
+# and shared by every caller (Streamlit sessions and reruns, the async build).
+# The old module attributes (`workflow`, `llm`, ...) still
+# work through the module-level __getattr__ at the bottom of this file.
+
+_resources = {}
+_init_lock = threading.RLock()
+
+def _once(name, build):
+    """Process-wide resource, built by `build()` the first time it is asked for"""
+    if name in _resources:
+        return _resources[name]
+    with _init_lock:
+        if name not in _resources:
+            _resources[name] = build()
+        return _resources[name]
+
+def get_llm():
+    """Shared Gemini chat model (langchain_google_genai is imported here).
 
-search_tools = DuckDuckGoSearchResults(region='us-en')
+    CHATBOT_FAKE_LLM=<seconds> swaps in the offline fake model with that much
+    simulated latency per call, for local load tests.
+    """
+    def build():
+        fake_latency = os.getenv('CHATBOT_FAKE_LLM')
+        if fake_latency:
+            from benchmarks.fakes import FakeChatModel
+            return FakeChatModel(latency=float(fake_latency))
+        from langchain_google_genai import ChatGoogleGenerativeAI
+        # Retries are scheduled by llm_scheduler (1 = no SDK-level retries)
+        return ChatGoogleGenerativeAI(model="models/gemini-2.5-flash-lite", max_retries=1)
+    return _once("llm", build)
+
+# The DuckDuckGo client behind this tool is only created on the first search
+search_tools = CachedDuckDuckGoSearchResults(region='us-en')
 
 # --------------------- Tools -------------------------
 
@@ -58,43 +117,57 @@ def calculator(first_num: float, second_num: float, operator: str) -> dict:
 @tool
 def stock(symbols: str) -> dict:
     """Fetch latest stock price for a given symbol (e.g. AAPL, TSLA).
+    Several symbols can be requested at once, comma separated (e.g. "AAPL, MSFT").
     Uses AlphaVantage API."""
     
-    # Validate input
-    if not symbols or not symbols.replace('.', '').isalnum() or len(symbols) > 10:
+    requested = parse_symbols(symbols)
+    if not requested:
         return {"error": "Invalid stock symbol"}
     
-    # Get API key from environment
-    api_key = os.getenv('ALPHAVANTAGE_API_KEY', 'KSN55W3NLCMWS51O')
-    
-    url = f'https://www.alphavantage.co/query?function=GLOBAL_QUOTE&symbol={symbols.upper()}&apikey={api_key}'
-    
-    try:
-        r = requests.get(url, timeout=10)
-        r.raise_for_status()
-        data = r.json()
-        
-        # Check for API errors
-        if "Error Message" in data:
-            return {"error": data["Error Message"]}
-        
-        return data
-    except requests.RequestException as e:
-        return {"error": f"API request failed: {str(e)}"}
+    # Single symbol keeps the raw GLOBAL_QUOTE shape; several are keyed by symbol
+    if len(requested) == 1:
+        return fetch_quote(requested[0])
+    return fetch_quotes(requested)
+
+# VECTOR_INDEX=1 adds retrieval over earlier chats (vector_index.py, needs numpy)
+VECTOR_INDEX_ENABLED = os.getenv('VECTOR_INDEX', '') not in ('', '0', 'false')
+
+def get_vector_index():
+    """Shared local vector index, kept in sync by a background thread"""
+    def build():
+        from vector_index import VECTOR_SYNC_INTERVAL, VectorIndex, start_background_sync
+        index = VectorIndex()
+        registry.register_collector("chatbot_vector_index", index.stats)
+        if VECTOR_SYNC_INTERVAL > 0:
+            start_background_sync(index, VECTOR_SYNC_INTERVAL)
+        return index
+    return _once("vector_index", build)
+
+# Past conversations retriever
+@tool
+def past_conversations(query: str, config: RunnableConfig) -> list:
+    """Find messages from the user's earlier chats that are related to the query.
+    Use when the user refers to something discussed in a previous conversation."""
+    thread_id = config.get("configurable", {}).get("thread_id")
+    return get_vector_index().related(query, exclude_thread=str(thread_id) if thread_id else None)
 
 # Create tools list
 tools_list = [stock, search_tools, calculator]
+if VECTOR_INDEX_ENABLED:
+    tools_list.append(past_conversations)
 
-# Bind tools to LLM
-llm_with_tools = llm.bind_tools(tools_list)
+def get_llm_with_tools():
+    """Shared chat model with the tool schemas bound"""
+    return _once("llm_with_tools", lambda: get_llm().bind_tools(tools_list))
 
 # -------------------- Node Functions ----------------
 
-def chat_node(state: ChatState):
-    """Main chat node that processes messages with LLM"""
-    messages = state['messages']
-    
-    system_prompt = SystemMessage(content="""You are a helpful AI assistant with access to tools.
+PAST_CONVERSATIONS_RULE = (
+    "  - Something the user discussed in an earlier chat → use `past_conversations` tool\n"
+    if VECTOR_INDEX_ENABLED else ""
+)
+
+SYSTEM_PROMPT = SystemMessage(content=f"""You are a helpful AI assistant with access to tools.
 
 IMPORTANT RULES:
 - Answer general knowledge questions, roadmaps, explanations, advice, and conversational questions DIRECTLY from your own knowledge. Do NOT use tools for these.
@@ -102,43 +175,241 @@ IMPORTANT RULES:
   - Real-time stock prices → use `stock` tool
   - Live web search for current news/events → use `search` tool
   - Math calculations → use `calculator` tool
-- For questions like "give me a roadmap", "explain X", "what is Y", "how does Z work" → answer DIRECTLY without tools.
+{PAST_CONVERSATIONS_RULE}- For questions like "give me a roadmap", "explain X", "what is Y", "how does Z work" → answer DIRECTLY without tools.
 - Never ask the user "would you like me to search for that?" for questions you can answer yourself.
 """)
-    
-    response = llm_with_tools.invoke([system_prompt] + messages)
-    
-    return {'messages': [response]}
+
+def make_chat_node(llm_with_tools, scheduler=None, cache=None, prefetcher=None):
+    """Chat node bound to a tool-enabled chat model (swappable in benchmarks).
+
+    With a `scheduler` (llm_scheduler.LLMScheduler) the call is queued,
+    rate limited and retried by it; with a `cache`
+    (response_cache.ResponseCache) first-turn answers are served from and
+    stored in it; with a `prefetcher` (speculation.SpeculativePrefetcher)
+    likely tool calls start while the model is still thinking.
+    """
+
+    def chat_node(state: ChatState, config: RunnableConfig):
+        """Main chat node that processes messages with LLM"""
+        messages = build_context(SYSTEM_PROMPT, state)
+
+        question = first_turn_question(state) if cache is not None else None
+        cached = cache.get(question) if question is not None else None
+        if cached is not None:
+            # Replayed as a streamed model call so the UI sees normal tokens
+            return {'messages': [ReplayChatModel(text=cached).invoke(messages)]}
+        
+        # A cancelled turn interrupts a streaming call at its next token
+        token = token_for(config)
+        call_config = cancellable_config(config, token)
+        if prefetcher is not None:
+            prefetcher.start(state, config)
+        response = None
+        started = time.perf_counter()
+        try:
+            if scheduler is not None:
+                response = scheduler.invoke(llm_with_tools, messages, config=call_config, cancel=token)
+            else:
+                response = llm_with_tools.invoke(messages, call_config)
+        finally:
+            # Prefetches the tools node will not ask for
+            if prefetcher is not None and not getattr(response, 'tool_calls', None):
+                prefetcher.discard(config)
+        record_llm_call(response, time.perf_counter() - started)
+
+        if question is not None:
+            cache.put(question, response)
+        
+        return {'messages': [response]}
+
+    return chat_node
+
+def get_response_cache():
+    """Shared answer cache for first turns (RESPONSE_CACHE=1), or None when off"""
+    def build():
+        if not RESPONSE_CACHE_ENABLED:
+            return None
+        cache = ResponseCache(model_name(get_llm()), SYSTEM_PROMPT.content)
+        registry.register_collector("chatbot_response_cache", cache.stats)
+        return cache
+    return _once("response_cache", build)
+
+def get_chat_node():
+    return _once("chat_node", lambda: make_chat_node(
+        get_llm_with_tools(), llm_scheduler, get_response_cache(), prefetcher
+    ))
+
+# Answers pure arithmetic and ticker lookups without calling the LLM
+fast_path = FastPathRouter(calculator, stock)
+
+def get_summarizer():
+    """Folds turns that no longer fit the context budget into the rolling summary"""
+    return _once("summarizer", lambda: HistorySummarizer(get_llm(), scheduler=llm_scheduler))
 
 # ------------------- Tool Node ------------------
 
-tool_node = ToolNode(tools_list)
+# SPECULATIVE_TOOLS=1 starts obvious stock / news lookups next to the first
+# LLM call of a turn (speculation.py)
+prefetcher = SpeculativePrefetcher(tools_list) if SPECULATION_ENABLED else None
+
+# Tool calls of one AI message run concurrently, each with its own deadline
+tool_node = ConcurrentToolNode(tools_list, prefetcher=prefetcher)
 
 # ----------------------- Database -----------------------
 
-conn = sqlite3.connect(database='chatbot.db', check_same_thread=False)
+class IndexedSqliteSaver(SqliteSaver):
+    """SqliteSaver that keeps the thread_index table in sync on every write.
+
+    Checkpoints are stored compressed (see checkpoint_serde.py) unless another
+    serializer is passed.
+    """
+
+    def __init__(self, conn, *, serde=None):
+        super().__init__(conn, serde=serde or make_serializer())
+
+    def setup(self):
+        if self.is_setup:
+            return
+        super().setup()
+        ensure_thread_index(self.conn)
+
+    def get_tuple(self, config):
+        started = time.perf_counter()
+        try:
+            return super().get_tuple(config)
+        finally:
+            record_checkpoint_op("get_tuple", time.perf_counter() - started)
+
+    def put_writes(self, config, writes, task_id, task_path=""):
+        started = time.perf_counter()
+        try:
+            return super().put_writes(config, writes, task_id, task_path)
+        finally:
+            record_checkpoint_op("put_writes", time.perf_counter() - started)
+
+    def put(self, config, checkpoint, metadata, new_versions):
+        started = time.perf_counter()
+        saved = super().put(config, checkpoint, metadata, new_versions)
+        messages = checkpoint.get("channel_values", {}).get("messages")
+        if messages is not None:
+            try:
+                with self.cursor() as cursor:
+                    record_checkpoint(
+                        cursor,
+                        str(config["configurable"]["thread_id"]),
+                        messages,
+                        checkpoint.get("ts"),
+                    )
+            except sqlite3.Error as e:
+                print(f"Error updating thread index: {e}")
+        record_checkpoint_op("put", time.perf_counter() - started)
+        return saved
 
-# Create checkpointer
-checkpointer = SqliteSaver(conn=conn)
+def _build_checkpointer():
+    # One saver per shard (a plain IndexedSqliteSaver with the default single
+    # chatbot.db); see storage.py
+    storage = get_storage()
+    checkpointer = storage.checkpointer()
+
+    # Optional retention job: CHECKPOINT_COMPACTION_INTERVAL=<seconds> to enable
+    compaction_interval = float(os.getenv('CHECKPOINT_COMPACTION_INTERVAL', '0'))
+    if compaction_interval > 0:
+        storage.start_compaction(compaction_interval)
+
+    return checkpointer
+
+def get_checkpointer():
+    """Shared checkpointer on the configured storage backend"""
+    return _once("checkpointer", _build_checkpointer)
 
 # ---------------- Graph ----------------
 
-graph = StateGraph(ChatState)
+def build_graph(chat_node, tool_node, summarize_node, fast_path_node, checkpointer,
+                compact_node=tool_compactor.node):
+    """Wire the chat/tools loop and compile it with the given checkpointer.
+
+    Shared by the sync workflow below and the async build in
+    chatbot_backend_async.py so both always have the same topology.
+    """
+    graph = StateGraph(ChatState)
+
+    # ----------------- Nodes ------------------
+
+    graph.add_node('fast_path', instrument_node('fast_path', fast_path_node))
+    # A cancelled turn stops before these; `tools` answers its calls itself
+    graph.add_node('summarize', instrument_node('summarize', guard_node(summarize_node, 'summarize')))
+    graph.add_node('chat_node', instrument_node('chat_node', guard_node(chat_node, 'chat_node')))
+    graph.add_node('tools', instrument_node('tools', tool_node))
+    graph.add_node('compact_tools', instrument_node('compact_tools', compact_node))
+
+    # ----------------- Edges -------------------
+
+    graph.add_edge(START, 'fast_path')
+    graph.add_conditional_edges('fast_path', route_after_fast_path, ['summarize', END])
+    graph.add_edge('summarize', 'chat_node')
+    graph.add_conditional_edges('chat_node', tools_condition)
+    # Tool results are shrunk before the model (and every later turn) sees them
+    graph.add_edge('tools', 'compact_tools')
+    graph.add_edge('compact_tools', 'chat_node')
+    # Note: No direct edge to END - tools_condition handles routing to END
+
+    return graph.compile(checkpointer=checkpointer)
+
+def _build_workflow():
+    workflow = build_graph(
+        get_chat_node(),
+        tool_node.node,
+        get_summarizer().node,
+        fast_path.node,
+        get_checkpointer(),
+    )
+    # Index earlier chats from startup, not from the first past_conversations call
+    if VECTOR_INDEX_ENABLED:
+        get_vector_index()
+
+    # METRICS_PORT=<port> serves /metrics (Prometheus) and /metrics.json
+    metrics_port = int(os.getenv('METRICS_PORT', '0'))
+    if metrics_port:
+        start_http_server(metrics_port)
+
+    return workflow
+
+def get_workflow():
+    """The compiled sync workflow, built on first call and shared process-wide"""
+    return _once("workflow", _build_workflow)
 
-# ----------------- Nodes ------------------
+# ---------------- Metrics ----------------
 
-graph.add_node('chat_node', chat_node)
-graph.add_node('tools', tool_node)
+# Existing stats objects are exported as gauges next to the histograms
+registry.register_collector("chatbot_quote_cache", quote_cache.stats)
+registry.register_collector("chatbot_search_cache", search_cache.stats)
+registry.register_collector("chatbot_fast_path", fast_path.stats)
+registry.register_collector("chatbot_llm_scheduler", llm_scheduler.stats)
+registry.register_collector("chatbot_tool_compaction", tool_compactor.stats)
+registry.register_collector("chatbot_turns", active_turns.stats)
+if prefetcher is not None:
+    registry.register_collector("chatbot_speculation", prefetcher.stats)
 
-# ----------------- Edges -------------------
+# ---------------- Module attributes ----------------
 
-graph.add_edge(START, 'chat_node')
-graph.add_conditional_edges('chat_node', tools_condition)
-graph.add_edge('tools', 'chat_node')
-# Note: No direct edge to END - tools_condition handles routing to END
+# Kept for existing `from chatbot_backend_fixed import workflow` callers;
+# each name builds its resource on first access.
+_LAZY_ATTRIBUTES = {
+    'llm': get_llm,
+    'llm_with_tools': get_llm_with_tools,
+    'summarizer': get_summarizer,
+    'checkpointer': get_checkpointer,
+    # First shard's connection only when DB_SHARDS > 1 (see storage.py)
+    'conn': lambda: shard_savers(get_checkpointer())[0].conn,
+    'chat_node': get_chat_node,
+    'workflow': get_workflow,
+}
 
-# Compile workflow
-workflow = graph.compile(checkpointer=checkpointer)
+def __getattr__(name):
+    build = _LAZY_ATTRIBUTES.get(name)
+    if build is None:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    return build()
 
 # Test (commented out)
 # if __name__ == "__main__":
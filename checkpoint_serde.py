@@ -0,0 +1,210 @@
+import argparse
+import os
+import zlib
+
+from langgraph.checkpoint.serde.base import SerializerProtocol
+from langgraph.checkpoint.serde.jsonplus import JsonPlusSerializer
+
+from compaction import connect, db_size, enable_incremental_vacuum, incremental_vacuum, DB_PATH
+
+try:
+    import zstandard
+except ImportError:  # zlib is always available
+    zstandard = None
+
+# Compressed checkpoint serialization.
+#
+# Checkpoints are encoded with LangGraph's msgpack serializer as before, then
+# compressed (zstd when installed, else zlib) and wrapped in a small versioned
+# header. Rows are stored with type "compressed":
+#
+#     b"CK" | format version (1 byte) | codec (1 byte) | len(inner type) (1 byte)
+#     | inner type (e.g. b"msgpack") | compressed payload
+#
+# Values smaller than CHECKPOINT_COMPRESS_MIN_BYTES are stored uncompressed in
+# the original format, and rows written before this existed are read as-is,
+# so old and new databases both load. migrate() rewrites existing rows in
+# place without decoding them.
+#
+# Usage:
+#     python checkpoint_serde.py --db chatbot.db                  # compress existing rows
+#     python checkpoint_serde.py --db chatbot.db --decompress     # back to the plain format
+
+# Constants
+COMPRESSED_TYPE = "compressed"
+MAGIC = b"CK"
+FORMAT_VERSION = 1
+CODEC_IDS = {"zlib": 1, "zstd": 2}
+CODEC_NAMES = {v: k for k, v in CODEC_IDS.items()}
+ZLIB_LEVEL = 6
+ZSTD_LEVEL = 3
+# "auto" (zstd if installed, else zlib), "zstd", "zlib" or "none"
+CHECKPOINT_COMPRESSION = os.getenv('CHECKPOINT_COMPRESSION', 'auto')
+CHECKPOINT_COMPRESS_MIN_BYTES = int(os.getenv('CHECKPOINT_COMPRESS_MIN_BYTES', '256'))
+MIGRATE_BATCH = 500
+# (table, blob column) pairs holding serialized values
+SERIALIZED_COLUMNS = (("checkpoints", "checkpoint"), ("writes", "value"))
+
+def resolve_codec(codec):
+    """Concrete codec name for a setting, or None for no compression"""
+    if codec in (None, "", "none"):
+        return None
+    if codec == "auto":
+        return "zstd" if zstandard is not None else "zlib"
+    if codec not in CODEC_IDS:
+        raise ValueError(f"Unknown compression codec: {codec}")
+    if codec == "zstd" and zstandard is None:
+        raise ValueError("zstd compression needs the zstandard package")
+    return codec
+
+def compress(type_, data, codec):
+    """Wrap an inner (type, bytes) pair in the compressed format"""
+    if codec == "zstd":
+        payload = zstandard.ZstdCompressor(level=ZSTD_LEVEL).compress(data)
+    else:
+        payload = zlib.compress(data, ZLIB_LEVEL)
+    inner = type_.encode()
+    header = MAGIC + bytes((FORMAT_VERSION, CODEC_IDS[codec], len(inner)))
+    return COMPRESSED_TYPE, header + inner + payload
+
+def decompress(blob):
+    """Inner (type, bytes) pair of a compressed blob"""
+    blob = bytes(blob)
+    if blob[:2] != MAGIC:
+        raise ValueError("Not a compressed checkpoint blob")
+    version, codec_id, type_len = blob[2], blob[3], blob[4]
+    if version != FORMAT_VERSION:
+        raise ValueError(f"Unsupported checkpoint format version: {version}")
+    type_ = blob[5:5 + type_len].decode()
+    payload = blob[5 + type_len:]
+    codec = CODEC_NAMES.get(codec_id)
+    if codec == "zstd":
+        if zstandard is None:
+            raise ValueError("Checkpoint is zstd-compressed but zstandard is not installed")
+        return type_, zstandard.ZstdDecompressor().decompress(payload)
+    if codec == "zlib":
+        return type_, zlib.decompress(payload)
+    raise ValueError(f"Unknown checkpoint codec id: {codec_id}")
+
+# -----------------------------
+# Serializer
+# -----------------------------
+
+class CompressedSerializer(SerializerProtocol):
+    """JsonPlusSerializer output, compressed behind a versioned header.
+
+    Reads both compressed rows and plain rows written by the default
+    serializer, whatever `codec` is set to.
+    """
+
+    def __init__(self, codec=CHECKPOINT_COMPRESSION, min_bytes=CHECKPOINT_COMPRESS_MIN_BYTES, inner=None):
+        self.codec = resolve_codec(codec)
+        self.min_bytes = min_bytes
+        self.inner = inner or JsonPlusSerializer()
+
+    def dumps(self, obj):
+        return self.inner.dumps(obj)
+
+    def loads(self, data):
+        return self.inner.loads(data)
+
+    def dumps_typed(self, obj):
+        type_, data = self.inner.dumps_typed(obj)
+        if self.codec is None or len(data) < self.min_bytes:
+            return type_, data
+        return compress(type_, data, self.codec)
+
+    def loads_typed(self, data):
+        type_, blob = data
+        if type_ == COMPRESSED_TYPE:
+            return self.inner.loads_typed(decompress(blob))
+        return self.inner.loads_typed(data)
+
+def make_serializer():
+    """Checkpoint serializer configured by CHECKPOINT_COMPRESSION"""
+    return CompressedSerializer()
+
+# -----------------------------
+# Migration
+# -----------------------------
+
+def _rewrite_table(conn, table, column, convert, batch):
+    """Apply `convert(type, blob)` to every row; returns (rows, bytes_before, bytes_after)"""
+    rows = before = after = 0
+    last_rowid = 0
+    while True:
+        chunk = conn.execute(
+            f"SELECT rowid, type, {column} FROM {table} WHERE rowid > ? ORDER BY rowid LIMIT ?",
+            (last_rowid, batch),
+        ).fetchall()
+        if not chunk:
+            break
+        updates = []
+        for rowid, type_, blob in chunk:
+            converted = convert(type_, blob)
+            if converted is not None:
+                updates.append((converted[0], converted[1], rowid))
+                before += len(blob)
+                after += len(converted[1])
+        with conn:
+            conn.executemany(f"UPDATE {table} SET type = ?, {column} = ? WHERE rowid = ?", updates)
+        rows += len(updates)
+        last_rowid = chunk[-1][0]
+    return rows, before, after
+
+def migrate(db_path=DB_PATH, codec="auto", decompress_rows=False,
+            min_bytes=CHECKPOINT_COMPRESS_MIN_BYTES, batch=MIGRATE_BATCH):
+    """Rewrite serialized rows in the compressed format (or back); returns a report.
+
+    Payloads are only recompressed, never decoded, so this is safe to run on
+    rows written by any serializer version.
+    """
+    codec = resolve_codec(codec)
+
+    def convert(type_, blob):
+        if blob is None:
+            return None
+        if decompress_rows:
+            return decompress(blob) if type_ == COMPRESSED_TYPE else None
+        if type_ == COMPRESSED_TYPE or codec is None or len(blob) < min_bytes:
+            return None
+        return compress(type_, bytes(blob), codec)
+
+    conn = connect(db_path)
+    try:
+        tables = {row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE type='table'")}
+        enable_incremental_vacuum(conn)
+        size_before = db_size(conn)
+        report = {}
+        for table, column in SERIALIZED_COLUMNS:
+            if table in tables:
+                rows, before, after = _rewrite_table(conn, table, column, convert, batch)
+                report[table] = {"rows": rows, "payload_before": before, "payload_after": after}
+        incremental_vacuum(conn)
+        report["bytes_before"] = size_before
+        report["bytes_after"] = db_size(conn)
+    finally:
+        conn.close()
+    return report
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Compress checkpoint blobs in place")
+    parser.add_argument("--db", default=None, help="database path (default: every shard)")
+    parser.add_argument("--codec", default="auto", choices=["auto", "zstd", "zlib"])
+    parser.add_argument("--decompress", action="store_true",
+                        help="rewrite compressed rows back to the plain format")
+    args = parser.parse_args(argv)
+
+    from storage import shard_paths
+
+    for db_path in [args.db] if args.db else shard_paths():
+        report = migrate(db_path, args.codec, args.decompress)
+        for table, column in SERIALIZED_COLUMNS:
+            if table in report:
+                stats = report[table]
+                print(f"{db_path} {table}: rewrote {stats['rows']} rows "
+                      f"({stats['payload_before']} -> {stats['payload_after']} payload bytes)")
+        print(f"{db_path}: size {report['bytes_before']} -> {report['bytes_after']} bytes")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,196 @@
+import argparse
+import os
+import sqlite3
+import threading
+
+import db
+from db import DB_PATH
+
+# Checkpoint retention and garbage collection for chatbot.db.
+#
+# SqliteSaver writes a full-state checkpoint for every graph step and never
+# removes old ones. Only the latest checkpoint of a thread is needed to resume
+# or display it, so older rows (and their pending `writes`) can be dropped.
+#
+# Databases created before auto_vacuum=INCREMENTAL was the default need one
+# full VACUUM to switch over. That rewrites the whole file under the write
+# lock, so only the command line does it; the background job just prunes and
+# lets SQLite reuse the freed pages until then.
+#
+# Usage:
+#     python compaction.py --keep 5                   # every shard (storage.py)
+#     python compaction.py --db chatbot.db --keep 5
+#     python compaction.py --thread <thread_id>       # compact one thread
+#     python compaction.py --no-convert               # never run the full VACUUM
+
+# Constants
+CHECKPOINT_KEEP_LATEST = int(os.getenv('CHECKPOINT_KEEP_LATEST', '5'))
+# Pages released per incremental_vacuum call (0 = all free pages)
+VACUUM_PAGES = 0
+BUSY_TIMEOUT = 30
+
+def connect(db_path=DB_PATH):
+    """Connection for maintenance work; waits for writers instead of failing"""
+    return db.connect(db_path, timeout=BUSY_TIMEOUT)
+
+def _existing_tables(conn):
+    return {row[0] for row in conn.execute(
+        "SELECT name FROM sqlite_master WHERE type='table'"
+    )}
+
+def db_size(conn):
+    """Allocated database size in bytes (page_count * page_size)"""
+    page_count = conn.execute("PRAGMA page_count").fetchone()[0]
+    page_size = conn.execute("PRAGMA page_size").fetchone()[0]
+    return page_count * page_size
+
+# -----------------------------
+# Retention
+# -----------------------------
+
+def prune_checkpoints(conn, keep=CHECKPOINT_KEEP_LATEST, thread_id=None):
+    """Keep only the newest `keep` checkpoints per thread (and namespace).
+
+    checkpoint_id is a time-ordered uuid6, the same ordering SqliteSaver uses
+    to find the latest checkpoint. Returns the number of checkpoints removed.
+    """
+    if keep < 1:
+        raise ValueError("keep must be at least 1; use delete_thread to drop a thread")
+    if "checkpoints" not in _existing_tables(conn):
+        return 0
+
+    where = "WHERE thread_id = ?" if thread_id is not None else ""
+    params = (thread_id, keep) if thread_id is not None else (keep,)
+    with conn:
+        return conn.execute(f"""
+            DELETE FROM checkpoints WHERE rowid IN (
+                SELECT rowid FROM (
+                    SELECT rowid, ROW_NUMBER() OVER (
+                        PARTITION BY thread_id, checkpoint_ns
+                        ORDER BY checkpoint_id DESC
+                    ) AS rn
+                    FROM checkpoints {where}
+                ) WHERE rn > ?
+            )
+        """, params).rowcount
+
+def prune_orphaned_writes(conn):
+    """Remove `writes` rows whose checkpoint no longer exists"""
+    tables = _existing_tables(conn)
+    if "writes" not in tables or "checkpoints" not in tables:
+        return 0
+    with conn:
+        return conn.execute("""
+            DELETE FROM writes WHERE NOT EXISTS (
+                SELECT 1 FROM checkpoints c
+                WHERE c.thread_id = writes.thread_id
+                  AND c.checkpoint_ns = writes.checkpoint_ns
+                  AND c.checkpoint_id = writes.checkpoint_id
+            )
+        """).rowcount
+
+# -----------------------------
+# Vacuum
+# -----------------------------
+
+def incremental_vacuum_enabled(conn):
+    return conn.execute("PRAGMA auto_vacuum").fetchone()[0] == 2
+
+def enable_incremental_vacuum(conn):
+    """Switch the database to auto_vacuum=INCREMENTAL (one full VACUUM, once).
+
+    The VACUUM holds the write lock for as long as it takes to rewrite the
+    file; run it from maintenance, not on a database serving chats.
+    """
+    if not incremental_vacuum_enabled(conn):
+        conn.execute("PRAGMA auto_vacuum = INCREMENTAL")
+        conn.execute("VACUUM")
+
+def incremental_vacuum(conn, pages=VACUUM_PAGES):
+    """Return free pages to the filesystem without rewriting the database"""
+    # executescript steps the pragma to completion; execute() frees one page
+    if pages:
+        conn.executescript(f"PRAGMA incremental_vacuum({int(pages)});")
+    else:
+        conn.executescript("PRAGMA incremental_vacuum;")
+    # Fold the WAL back so the freed pages actually leave the main file
+    conn.execute("PRAGMA wal_checkpoint(TRUNCATE)").fetchall()
+
+# -----------------------------
+# Entry points
+# -----------------------------
+
+def compact(db_path=DB_PATH, keep=CHECKPOINT_KEEP_LATEST, thread_id=None,
+            vacuum_pages=VACUUM_PAGES, convert=False):
+    """Apply the retention policy, drop orphans and vacuum; returns a report.
+
+    With `convert`, a database still on auto_vacuum=NONE is first switched
+    over with a full VACUUM; without it such a database is only pruned.
+    """
+    conn = connect(db_path)
+    try:
+        size_before = db_size(conn)
+        if convert:
+            enable_incremental_vacuum(conn)
+        checkpoints_removed = prune_checkpoints(conn, keep, thread_id)
+        writes_removed = prune_orphaned_writes(conn)
+        vacuumed = incremental_vacuum_enabled(conn)
+        if vacuumed:
+            incremental_vacuum(conn, vacuum_pages)
+        size_after = db_size(conn)
+    finally:
+        conn.close()
+
+    return {
+        "checkpoints_removed": checkpoints_removed,
+        "writes_removed": writes_removed,
+        "vacuumed": vacuumed,
+        "bytes_before": size_before,
+        "bytes_after": size_after,
+        "bytes_reclaimed": size_before - size_after,
+    }
+
+def start_background_compaction(db_path=DB_PATH, interval=3600, keep=CHECKPOINT_KEEP_LATEST):
+    """Run compact() every `interval` seconds on a daemon thread.
+
+    The job never runs the one-time full VACUUM (see compact). Returns a
+    threading.Event; set it to stop the job.
+    """
+    stop = threading.Event()
+
+    def run():
+        while not stop.wait(interval):
+            try:
+                report = compact(db_path, keep)
+                print(f"Compaction: {report}")
+            except sqlite3.Error as e:
+                print(f"Error compacting database: {e}")
+
+    threading.Thread(target=run, name="checkpoint-compaction", daemon=True).start()
+    return stop
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Compact chatbot checkpoints")
+    parser.add_argument("--db", default=None, help="database path (default: every shard)")
+    parser.add_argument("--keep", type=int, default=CHECKPOINT_KEEP_LATEST,
+                        help="checkpoints to keep per thread")
+    parser.add_argument("--thread", default=None, help="only compact this thread")
+    parser.add_argument("--vacuum-pages", type=int, default=VACUUM_PAGES,
+                        help="max pages to release (0 = all)")
+    parser.add_argument("--no-convert", action="store_true",
+                        help="do not switch an old database to incremental vacuum (full VACUUM)")
+    args = parser.parse_args(argv)
+
+    from storage import shard_paths
+
+    for db_path in [args.db] if args.db else shard_paths():
+        report = compact(db_path, args.keep, args.thread, args.vacuum_pages, convert=not args.no_convert)
+        print(f"{db_path}: removed {report['checkpoints_removed']} checkpoints and "
+              f"{report['writes_removed']} writes")
+        if not report["vacuumed"]:
+            print(f"{db_path}: not vacuumed (auto_vacuum is off; run without --no-convert once)")
+        print(f"{db_path}: reclaimed {report['bytes_reclaimed']} bytes "
+              f"({report['bytes_before']} -> {report['bytes_after']})")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,161 @@
+import os
+import queue
+import sqlite3
+import threading
+from contextlib import contextmanager
+
+from search_index import ensure_search_index
+from thread_index import ensure_thread_index
+
+# Shared SQLite access for chatbot.db. Every connection, pooled or dedicated
+# (the checkpointer's), runs in WAL mode with the same pragmas, so readers
+# never block the writer and short write bursts wait on busy_timeout instead
+# of failing with "database is locked". The metadata schema is created once
+# per database per process, not on every helper call, together with the
+# full-text search index (search_index.py).
+
+# Constants
+DB_PATH = os.getenv('DB_PATH', 'chatbot.db')
+DB_POOL_SIZE = int(os.getenv('DB_POOL_SIZE', '4'))
+# Seconds a connection waits for a lock before raising (sqlite3 busy timeout)
+DB_BUSY_TIMEOUT = float(os.getenv('DB_BUSY_TIMEOUT', '5'))
+PRAGMAS = (
+    # Only takes effect on a new, empty database; older files are converted
+    # once with `python compaction.py` (see enable_incremental_vacuum)
+    "PRAGMA auto_vacuum = INCREMENTAL",
+    "PRAGMA journal_mode = WAL",
+    # Durable at WAL checkpoints; a power loss can only drop the last commits
+    "PRAGMA synchronous = NORMAL",
+    "PRAGMA temp_store = MEMORY",
+    "PRAGMA cache_size = -16000",
+    "PRAGMA mmap_size = 134217728",
+)
+
+# Every table keyed by thread_id that belongs to a conversation
+THREAD_TABLES = (
+    "checkpoints", "writes", "thread_index", "thread_messages", "chat_titles", "chat_pins",
+)
+
+_schema_ready = set()
+_schema_lock = threading.Lock()
+
+def configure(conn):
+    """Apply the shared pragmas to a connection"""
+    for pragma in PRAGMAS:
+        conn.execute(pragma).fetchall()
+    return conn
+
+def ensure_schema(conn, db_path):
+    """Create the metadata tables once per database and process"""
+    if db_path in _schema_ready:
+        return
+    with _schema_lock:
+        if db_path not in _schema_ready:
+            ensure_thread_index(conn)
+            ensure_search_index(conn)
+            _schema_ready.add(db_path)
+
+def connect(db_path=DB_PATH, timeout=DB_BUSY_TIMEOUT):
+    """Dedicated, configured connection usable from any thread"""
+    conn = configure(sqlite3.connect(db_path, timeout=timeout, check_same_thread=False))
+    ensure_schema(conn, db_path)
+    return conn
+
+# -----------------------------
+# Pool
+# -----------------------------
+
+class ConnectionPool:
+    """Up to `size` configured connections, each used by one thread at a time.
+
+    A checkout waits up to `timeout` seconds for a free connection, then
+    fails with sqlite3.OperationalError like a busy database would.
+    """
+
+    def __init__(self, db_path=DB_PATH, size=DB_POOL_SIZE, timeout=DB_BUSY_TIMEOUT):
+        self.db_path = db_path
+        self.size = size
+        self.timeout = timeout
+        self._idle = queue.LifoQueue()
+        self._created = 0
+        self._lock = threading.Lock()
+
+    def _checkout(self):
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            pass
+        with self._lock:
+            if self._created < self.size:
+                self._created += 1
+                try:
+                    return connect(self.db_path)
+                except sqlite3.Error:
+                    self._created -= 1
+                    raise
+        try:
+            return self._idle.get(timeout=self.timeout)
+        except queue.Empty:
+            # Callers handle sqlite3.Error, not queue.Empty
+            raise sqlite3.OperationalError("connection pool exhausted") from None
+
+    @contextmanager
+    def connection(self):
+        """Borrow a connection for reads or self-managed writes"""
+        conn = self._checkout()
+        try:
+            yield conn
+        finally:
+            if conn.in_transaction:
+                conn.rollback()
+            self._idle.put(conn)
+
+    @contextmanager
+    def transaction(self):
+        """Borrow a connection inside BEGIN IMMEDIATE ... COMMIT (rollback on error)"""
+        with self.connection() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                yield conn
+            except BaseException:
+                conn.rollback()
+                raise
+            conn.commit()
+
+    def close(self):
+        while True:
+            try:
+                self._idle.get_nowait().close()
+            except queue.Empty:
+                break
+        with self._lock:
+            self._created = 0
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+def get_pool(db_path=DB_PATH):
+    """Process-wide pool for a database file"""
+    with _pools_lock:
+        pool = _pools.get(db_path)
+        if pool is None:
+            pool = _pools[db_path] = ConnectionPool(db_path)
+        return pool
+
+# -----------------------------
+# Deletion
+# -----------------------------
+
+def delete_thread_rows(conn, thread_id):
+    """Delete a thread from every related table, in the caller's transaction"""
+    tables = {row[0] for row in conn.execute(
+        "SELECT name FROM sqlite_master WHERE type='table'"
+    )}
+    for table in THREAD_TABLES:
+        if table in tables:
+            conn.execute(f"DELETE FROM {table} WHERE thread_id = ?", (thread_id,))
+
+def delete_thread(conn, thread_id):
+    """Delete a thread from every related table in a single transaction"""
+    with conn:
+        delete_thread_rows(conn, thread_id)
@@ -0,0 +1,175 @@
+import re
+import threading
+
+from langchain_core.messages import AIMessage
+from langgraph.graph import END
+
+# Deterministic pre-router in front of the LLM. Unambiguous two-operand
+# arithmetic ("what is 234*19") and ticker lookups ("AAPL price") are answered
+# by calling the calculator / stock tools directly and filling a template,
+# which saves both Gemini round trips. Anything else, or any tool error, falls
+# through to the normal summarize -> chat_node path.
+
+NUMBER = r"(-?\d+(?:\.\d+)?)"
+OPERATORS = {
+    "+": "add", "plus": "add",
+    "-": "sub", "minus": "sub",
+    "*": "mul", "x": "mul", "×": "mul", "times": "mul", "multiplied by": "mul",
+    "/": "div", "÷": "div", "divided by": "div",
+}
+SYMBOLS = {"add": "+", "sub": "-", "mul": "×", "div": "÷"}
+
+ARITHMETIC_RE = re.compile(
+    r"^(?:what(?:'s| is)|calculate|compute|evaluate)?\s*"
+    + NUMBER
+    + r"\s*(\+|-|\*|x|×|/|÷|plus|minus|times|multiplied by|divided by)\s*"
+    + NUMBER
+    + r"\s*[?=.!]*$",
+    re.IGNORECASE,
+)
+
+# Tickers must be written in capitals so ordinary words never match
+TICKER = r"\$?([A-Z]{1,5}(?:\.[A-Z])?)"
+QUOTE_RES = [
+    re.compile(r"^" + TICKER + r"\s+(?i:(?:stock\s+|share\s+)?(?:price|quote))\s*\??$"),
+    re.compile(
+        r"^(?i:(?:what(?:'s| is)\s+)?(?:the\s+)?(?:current\s+|latest\s+)?"
+        r"(?:stock\s+|share\s+)?(?:price|quote)\s+(?:of|for)\s+)"
+        + TICKER + r"\s*\??$"
+    ),
+]
+
+def _format_number(value):
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return f"{value:,.6g}" if isinstance(value, float) else str(value)
+
+def match_arithmetic(text):
+    """(first_num, second_num, operator) for "12 * 4"-style input, else None"""
+    match = ARITHMETIC_RE.match(text.strip())
+    if not match:
+        return None
+    first, op, second = match.groups()
+    return float(first), float(second), OPERATORS[op.lower()]
+
+def match_quote(text):
+    """Ticker symbol for "AAPL price"-style input, else None"""
+    text = text.strip()
+    for pattern in QUOTE_RES:
+        match = pattern.match(text)
+        if match:
+            return match.group(1)
+    return None
+
+def format_calculation(result):
+    """Templated answer for a calculator result, or None on error"""
+    if "error" in result:
+        return None
+    return (
+        f"{_format_number(result['first_num'])} {SYMBOLS[result['operator']]} "
+        f"{_format_number(result['second_num'])} = **{_format_number(result['result'])}**"
+    )
+
+def format_quote(symbol, data):
+    """Templated answer for a GLOBAL_QUOTE payload, or None if unusable"""
+    quote = data.get("Global Quote") if isinstance(data, dict) else None
+    if not quote or "05. price" not in quote:
+        return None
+    try:
+        # AlphaVantage sends "" for some fields of some symbols
+        price = float(quote["05. price"])
+        change = float(quote["09. change"]) if quote.get("09. change") else None
+    except (TypeError, ValueError):
+        return None
+    answer = f"**{symbol}** is trading at **${price:,.2f}**"
+    if change is not None and quote.get("10. change percent"):
+        answer += f" ({change:+,.2f}, {quote['10. change percent']})"
+    if quote.get("07. latest trading day"):
+        answer += f" as of {quote['07. latest trading day']}"
+    return answer + "."
+
+# -----------------------------
+# Router
+# -----------------------------
+
+class FastPathRouter:
+    """Graph node answering trivial requests without the LLM"""
+
+    def __init__(self, calculator, stock):
+        self.calculator = calculator
+        self.stock = stock
+        self.hits = {"calculator": 0, "stock": 0}
+        self.fallthroughs = 0
+        self._lock = threading.Lock()
+
+    def _count(self, kind):
+        with self._lock:
+            if kind is None:
+                self.fallthroughs += 1
+            else:
+                self.hits[kind] += 1
+
+    def _user_text(self, state):
+        last = state['messages'][-1]
+        if last.type != "human" or not isinstance(last.content, str):
+            return None
+        return last.content
+
+    def _reply(self, kind, answer):
+        self._count(kind)
+        return {'messages': [AIMessage(content=answer, response_metadata={"fast_path": kind})]}
+
+    def node(self, state):
+        """Sync node: answer directly or return no update"""
+        text = self._user_text(state)
+        if text is not None:
+            calc = match_arithmetic(text)
+            if calc:
+                first, second, op = calc
+                answer = format_calculation(self.calculator.invoke(
+                    {"first_num": first, "second_num": second, "operator": op}
+                ))
+                if answer:
+                    return self._reply("calculator", answer)
+            symbol = match_quote(text)
+            if symbol:
+                answer = format_quote(symbol, self.stock.invoke({"symbols": symbol}))
+                if answer:
+                    return self._reply("stock", answer)
+        self._count(None)
+        return {}
+
+    async def anode(self, state):
+        """Async node: answer directly or return no update"""
+        text = self._user_text(state)
+        if text is not None:
+            calc = match_arithmetic(text)
+            if calc:
+                first, second, op = calc
+                answer = format_calculation(await self.calculator.ainvoke(
+                    {"first_num": first, "second_num": second, "operator": op}
+                ))
+                if answer:
+                    return self._reply("calculator", answer)
+            symbol = match_quote(text)
+            if symbol:
+                answer = format_quote(symbol, await self.stock.ainvoke({"symbols": symbol}))
+                if answer:
+                    return self._reply("stock", answer)
+        self._count(None)
+        return {}
+
+    def stats(self):
+        """Hit counts and the share of turns that skipped the LLM"""
+        with self._lock:
+            hits = sum(self.hits.values())
+            total = hits + self.fallthroughs
+            return {
+                **{f"{kind}_hits": count for kind, count in self.hits.items()},
+                "fallthroughs": self.fallthroughs,
+                "hit_rate": hits / total if total else 0.0,
+            }
+
+def route_after_fast_path(state):
+    """END when the fast path answered, otherwise continue to the LLM"""
+    return END if state['messages'][-1].type == "ai" else "summarize"
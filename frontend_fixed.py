@@ -1,262 +1,55 @@
 import streamlit as st
-from chatbot_backend_fixed import workflow
-from langchain_core.messages import HumanMessage, messages_from_dict
-import uuid
-import sqlite3
-import json
-import time
+from cancellation import TurnCancelled, active_turns, guarded_stream
+from chatbot_backend_fixed import get_workflow
+from langchain_core.messages import HumanMessage
+from chat_store import (
+    get_current_timestamp,
+    load_threads_from_db,
+    search_chats,
+)
+from metadata_writer import metadata_writer
+from metrics import timer
+from storage import get_storage
+from stream_render import StreamRenderer
+from thread_index import generate_title, load_messages, thread_version
 import os
-from datetime import datetime
+import uuid
+from contextlib import closing
 
 # Constants
-DB_PATH = "chatbot.db"
-MAX_TITLE_LENGTH = 30
+# Messages shown per page of chat history ("Load earlier" adds another page)
+HISTORY_PAGE_SIZE = 50
+# SHOW_STREAM_STATS=1 prints time-to-first-token and tokens/s under each answer
+SHOW_STREAM_STATS = os.getenv('SHOW_STREAM_STATS', '') not in ('', '0', 'false')
 
 # -----------------------------
 # Database Helpers
 # -----------------------------
 
-def get_current_timestamp():
-    """Get current timestamp as float"""
-    return time.time()
-
-def generate_title(text, max_len=MAX_TITLE_LENGTH):
-    """Generate a title from text"""
-    if not text or not isinstance(text, str):
-        return "New Chat"
-    
-    # Clean the text
-    text = str(text).strip().split("\n")[0]
-    text = text.replace("#", "").replace("*", "").replace("`", "").strip()
-    
-    if len(text) > max_len:
-        return text[:max_len].strip() + "..."
-    return text if text else "New Chat"
-
-def load_threads_from_db():
-    """Load all threads from database"""
-    threads = {}
-    
-    try:
-        conn = sqlite3.connect(DB_PATH)
-        cursor = conn.cursor()
-        
-        # Check if checkpoints table exists
-        cursor.execute("SELECT name FROM sqlite_master WHERE type='table'")
-        tables = [table[0] for table in cursor.fetchall()]
-        
-        if 'checkpoints' not in tables:
-            conn.close()
-            return threads
-        
-        # Check columns in checkpoints table
-        cursor.execute("PRAGMA table_info(checkpoints)")
-        columns = cursor.fetchall()
-        column_names = [col[1] for col in columns]
-        
-        # Get thread_ids
-        thread_ids = []
-        
-        if 'thread_id' in column_names:
-            cursor.execute("SELECT DISTINCT thread_id FROM checkpoints")
-            thread_ids = [row[0] for row in cursor.fetchall()]
-        
-        for thread_id in thread_ids:
-            try:
-                # Get the earliest checkpoint for this thread
-                cursor.execute(
-                    "SELECT checkpoint FROM checkpoints WHERE thread_id = ? ORDER BY rowid ASC LIMIT 1",
-                    (thread_id,)
-                )
-                result = cursor.fetchone()
-                
-                title = "New Chat"
-                
-                if result:
-                    raw_data = result[0]
-                    
-                    # Handle byte data
-                    if isinstance(raw_data, bytes):
-                        try:
-                            raw_data = raw_data.decode('utf-8')
-                        except UnicodeDecodeError:
-                            raw_data = raw_data.decode('utf-8', errors='ignore')
-                    
-                    # Try to parse JSON and extract first human message
-                    try:
-                        data = json.loads(raw_data)
-                        
-                        # Look for messages in different possible locations
-                        messages_data = None
-                        if 'values' in data and 'messages' in data['values']:
-                            messages_data = data['values']['messages']
-                        elif 'channel_values' in data and 'messages' in data['channel_values']:
-                            messages_data = data['channel_values']['messages']
-                        elif 'messages' in data:
-                            messages_data = data['messages']
-                        
-                        if messages_data:
-                            # Convert to messages
-                            messages = messages_from_dict(messages_data)
-                            for msg in messages:
-                                if msg.type == "human" and msg.content:
-                                    title = generate_title(msg.content)
-                                    break
-                    except json.JSONDecodeError:
-                        # Try to extract title from raw string
-                        if isinstance(raw_data, str):
-                            if 'human' in raw_data.lower() or 'user' in raw_data.lower():
-                                lines = raw_data.split('\n')
-                                for line in lines:
-                                    if 'content' in line.lower() and len(line) > 20:
-                                        parts = line.split(':')
-                                        if len(parts) > 1:
-                                            potential_content = parts[-1].strip()
-                                            if len(potential_content) > 5:
-                                                title = generate_title(potential_content)
-                                                break
-                    except Exception as e:
-                        print(f"Error parsing checkpoint: {e}")
-                
-                # Get last activity timestamp
-                last_active = get_current_timestamp()
-                
-                # Try to get timestamp from rowid
-                cursor.execute(
-                    "SELECT MAX(rowid) FROM checkpoints WHERE thread_id = ?",
-                    (thread_id,)
-                )
-                max_rowid = cursor.fetchone()[0]
-                if max_rowid:
-                    last_active = float(max_rowid)
-                
-                threads[thread_id] = {
-                    "title": title,
-                    "last": last_active,
-                    "pinned": False
-                }
-                
-            except Exception as e:
-                print(f"Error loading thread {thread_id}: {e}")
-                continue
-        
-        conn.close()
-        
-    except sqlite3.Error as e:
-        print(f"Database error: {e}")
-    except Exception as e:
-        print(f"Unexpected error loading threads: {e}")
-    
-    return threads
+def load_history(thread_id, load_earlier=False):
+    """Displayed window of a thread's messages, cached in the session.
 
-def delete_thread_from_db(thread_id):
-    """Delete a thread from database"""
-    try:
-        conn = sqlite3.connect(DB_PATH)
-        cursor = conn.cursor()
-        cursor.execute("DELETE FROM checkpoints WHERE thread_id = ?", (thread_id,))
-        conn.commit()
-        conn.close()
-        return True
-    except sqlite3.Error as e:
-        print(f"Error deleting thread: {e}")
-        return False
-
-def save_thread_title(thread_id, title):
-    """Save thread title persistently"""
-    try:
-        conn = sqlite3.connect(DB_PATH)
-        cursor = conn.cursor()
-        
-        # Create titles table if not exists
-        cursor.execute("""
-            CREATE TABLE IF NOT EXISTS chat_titles (
-                thread_id TEXT PRIMARY KEY,
-                title TEXT,
-                updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-            )
-        """)
-        
-        # Insert or update title
-        cursor.execute("""
-            INSERT OR REPLACE INTO chat_titles (thread_id, title) 
-            VALUES (?, ?)
-        """, (thread_id, title))
-        
-        conn.commit()
-        conn.close()
-        return True
-    except sqlite3.Error as e:
-        print(f"Error saving title: {e}")
-        return False
-
-def save_thread_pin(thread_id, pinned):
-    """Save pinned state persistently"""
-    try:
-        conn = sqlite3.connect(DB_PATH)
-        cursor = conn.cursor()
-
-        cursor.execute("""
-            CREATE TABLE IF NOT EXISTS chat_pins (
-                thread_id TEXT PRIMARY KEY,
-                pinned INTEGER DEFAULT 0
+    The cache holds the active thread only and is refreshed when the thread's
+    index row changes (i.e. after a new checkpoint), so pin, rename and other
+    reruns do not touch the checkpoints at all.
+    """
+    cached = st.session_state.get("history")
+    with get_storage().pool_for(thread_id).connection() as conn:
+        version = thread_version(conn, thread_id)
+        if cached is None or cached["thread_id"] != thread_id or cached["version"] != version:
+            # Keep however many pages were already opened
+            limit = HISTORY_PAGE_SIZE
+            if cached is not None and cached["thread_id"] == thread_id:
+                limit = max(limit, len(cached["rows"]))
+            rows, has_more = load_messages(conn, thread_id, limit)
+            cached = {"thread_id": thread_id, "version": version, "rows": rows, "has_more": has_more}
+        if load_earlier and cached["has_more"] and cached["rows"]:
+            earlier, has_more = load_messages(
+                conn, thread_id, HISTORY_PAGE_SIZE, before=cached["rows"][0][0]
             )
-        """)
-
-        cursor.execute("""
-            INSERT OR REPLACE INTO chat_pins (thread_id, pinned)
-            VALUES (?, ?)
-        """, (thread_id, int(pinned)))
-
-        conn.commit()
-        conn.close()
-        return True
-    except sqlite3.Error as e:
-        print(f"Error saving pin state: {e}")
-        return False
-
-def load_thread_pins():
-    """Load pinned states"""
-    pins = {}
-    try:
-        conn = sqlite3.connect(DB_PATH)
-        cursor = conn.cursor()
-
-        cursor.execute("""
-            SELECT name FROM sqlite_master
-            WHERE type='table' AND name='chat_pins'
-        """)
-
-        if cursor.fetchone():
-            cursor.execute("SELECT thread_id, pinned FROM chat_pins")
-            for row in cursor.fetchall():
-                pins[row[0]] = bool(row[1])
-
-        conn.close()
-    except sqlite3.Error as e:
-        print(f"Error loading pins: {e}")
-
-    return pins
-
-def load_thread_titles():
-    """Load thread titles from persistent storage"""
-    titles = {}
-    try:
-        conn = sqlite3.connect(DB_PATH)
-        cursor = conn.cursor()
-        
-        # Check if titles table exists
-        cursor.execute("SELECT name FROM sqlite_master WHERE type='table' AND name='chat_titles'")
-        if cursor.fetchone():
-            cursor.execute("SELECT thread_id, title FROM chat_titles")
-            for row in cursor.fetchall():
-                titles[row[0]] = row[1]
-        
-        conn.close()
-    except sqlite3.Error as e:
-        print(f"Error loading titles: {e}")
-    
-    return titles
+            cached = dict(cached, rows=earlier + cached["rows"], has_more=has_more)
+    st.session_state.history = cached
+    return cached
 
 # -----------------------------
 # Custom CSS for Color Theme
@@ -375,21 +168,9 @@ if "initialized" not in st.session_state:
     st.session_state.current_thread = None
     st.session_state.initialized = True
     
-    # Load existing threads from database
+    # Load existing threads (titles and pins are kept in sync by the index)
     db_threads = load_threads_from_db()
     
-    # Load saved titles and pins
-    saved_titles = load_thread_titles()
-    saved_pins = load_thread_pins()
-    
-    # Merge saved titles with loaded threads
-    for thread_id in db_threads:
-        if thread_id in saved_titles and saved_titles[thread_id]:
-            db_threads[thread_id]["title"] = saved_titles[thread_id]
-
-        if thread_id in saved_pins:
-            db_threads[thread_id]["pinned"] = saved_pins[thread_id]
-    
     if db_threads:
         st.session_state.threads = db_threads
         # Set current thread to most recent
@@ -425,7 +206,36 @@ with st.sidebar:
         st.rerun()
     
     st.divider()
-    
+
+    # Search across every chat's messages
+    search_query = st.text_input(
+        "🔍 Search chats",
+        key="search_query",
+        placeholder="Search messages...",
+    )
+    if search_query.strip():
+        results = search_chats(search_query)
+        if not results:
+            st.caption("No matching messages")
+        for result in results:
+            thread_id = result["thread_id"]
+            icon = "📌 " if result["pinned"] else "💬 "
+            if st.button(
+                f"{icon}{result['title']}",
+                key=f"search_{thread_id}",
+                use_container_width=True,
+                type="primary" if st.session_state.current_thread == thread_id else "secondary"
+            ):
+                st.session_state.threads.setdefault(thread_id, {
+                    "title": result["title"],
+                    "last": result["last"] or get_current_timestamp(),
+                    "pinned": result["pinned"]
+                })
+                st.session_state.current_thread = thread_id
+                st.rerun()
+            st.caption(result["snippet"])
+        st.divider()
+
     # Chat History
     st.subheader("📜 Chat History")
     
@@ -469,7 +279,8 @@ with st.sidebar:
                     new_pin_state = not data["pinned"]
                     data["pinned"] = new_pin_state
                     st.session_state.threads[thread_id] = data
-                    save_thread_pin(thread_id, new_pin_state)
+                    # Written in the background; the session state is the UI's truth
+                    metadata_writer.set_pin(thread_id, new_pin_state)
                     st.rerun()
 
             with cols[2]:
@@ -481,30 +292,20 @@ with st.sidebar:
                     help="Delete chat"
                 ):
                     if len(st.session_state.threads) > 1:
-                        # Delete from database
-                        if delete_thread_from_db(thread_id):
-                            # Remove from session state
-                            if thread_id in st.session_state.threads:
-                                del st.session_state.threads[thread_id]
-                            
-                            # Delete from titles table
-                            try:
-                                conn = sqlite3.connect(DB_PATH)
-                                cursor = conn.cursor()
-                                cursor.execute("DELETE FROM chat_titles WHERE thread_id = ?", (thread_id,))
-                                cursor.execute("DELETE FROM chat_pins WHERE thread_id = ?", (thread_id,))
-                                conn.commit()
-                                conn.close()
-                            except sqlite3.Error as e:
-                                print(f"Error deleting metadata: {e}")
-                            
-                            # Set new current thread if needed
-                            if st.session_state.current_thread == thread_id:
-                                remaining = list(st.session_state.threads.keys())
-                                if remaining:
-                                    st.session_state.current_thread = remaining[0]
-                            
-                            st.rerun()
+                        # Delete from database (in the background)
+                        metadata_writer.delete(thread_id)
+
+                        # Remove from session state
+                        if thread_id in st.session_state.threads:
+                            del st.session_state.threads[thread_id]
+
+                        # Set new current thread if needed
+                        if st.session_state.current_thread == thread_id:
+                            remaining = list(st.session_state.threads.keys())
+                            if remaining:
+                                st.session_state.current_thread = remaining[0]
+
+                        st.rerun()
                     else:
                         st.warning("Cannot delete the only chat")
 
@@ -512,35 +313,34 @@ with st.sidebar:
 # Main Chat Area
 # -----------------------------
 
+@st.cache_resource(show_spinner="Starting chatbot...")
+def load_workflow():
+    """Compiled graph shared by every session and rerun of this process"""
+    return get_workflow()
+
+# Built after the sidebar so the thread list renders before the backend is up
+workflow = load_workflow()
+
 current_thread_id = st.session_state.current_thread
 current_thread_data = st.session_state.threads.get(current_thread_id, {})
 
 # Scrollable container for chat
 chat_container = st.container()
 
-with chat_container:
+with chat_container, timer("chatbot_ui_render_seconds", "Streamlit chat history render"):
     try:
-        # Get the conversation state from LangGraph
-        state = workflow.get_state(
-            config={"configurable": {"thread_id": current_thread_id}}
-        )
-
-        if state and hasattr(state, 'values') and 'messages' in state.values:
-            messages = state.values['messages']
+        history = load_history(current_thread_id)
 
-            # Display all messages - simplified without tracking
-            for msg in messages:
-                if msg.type == "human":
-                    with st.chat_message("user"):
-                        st.write(msg.content)
-                elif msg.type == "ai":
-                    with st.chat_message("assistant"):
-                        st.write(msg.content)
+        if history["has_more"]:
+            if st.button("⬆️ Load earlier messages", key="load_earlier"):
+                history = load_history(current_thread_id, load_earlier=True)
 
-            if not messages:
-                st.info("✨ Start a conversation by typing a message below!")
+        # Only the last pages are rendered; older messages stay on disk
+        for _, msg_type, content in history["rows"]:
+            with st.chat_message("user" if msg_type == "human" else "assistant"):
+                st.write(content)
 
-        else:
+        if not history["rows"]:
             st.info("✨ Start a conversation by typing a message below!")
 
     except Exception as e:
@@ -566,29 +366,52 @@ if user_input:
     # Display assistant response with streaming
     with chat_container:
         with st.chat_message("assistant"):
+            tool_placeholder = st.empty()
             response_placeholder = st.empty()
-            full_response = ""
+            renderer = StreamRenderer(
+                response_placeholder.markdown,
+                lambda lines: tool_placeholder.caption("  \n".join(lines)),
+            )
 
+            # Cancelled when this run is interrupted (a new message, switching
+            # threads) or when the turn's deadline passes
+            cancel_token = active_turns.start(current_thread_id)
             try:
-                # Stream response from LangGraph
-                for chunk, _ in workflow.stream(
+                # Stream response from LangGraph; only answer tokens are shown.
+                # Streamlit stops a run (rerun, thread switch, Stop) with a
+                # BaseException; closing() shuts the stream, and so cancels the
+                # turn, right then instead of whenever it is garbage-collected
+                with closing(guarded_stream(workflow.stream(
                     {"messages": [HumanMessage(content=user_input)]},
-                    config={"configurable": {"thread_id": current_thread_id}},
+                    config={"configurable": {"thread_id": current_thread_id, "cancel_token": cancel_token}},
                     stream_mode="messages",
-                ):
-                    if hasattr(chunk, 'content'):
-                        full_response += chunk.content
-                        response_placeholder.write(full_response)
-
-                # Update thread title if it's still "New Chat"
+                ), cancel_token)) as stream:
+                    for chunk, metadata in stream:
+                        renderer.feed(chunk, metadata)
+                renderer.finish()
+
+                if SHOW_STREAM_STATS:
+                    stats = renderer.stats()
+                    if stats["ttft_seconds"] is not None:
+                        rate = f" · {stats['tokens_per_second']:.0f} tok/s" if stats["tokens_per_second"] else ""
+                        st.caption(f"⏱️ first token {stats['ttft_seconds']:.2f}s{rate}")
+
+                # Update thread title if it's still "New Chat"; the index took
+                # the same title from the checkpoint, and only a user rename
+                # goes to chat_titles
                 if current_thread_data and current_thread_data.get("title") == "New Chat":
                     new_title = generate_title(user_input)
                     current_thread_data["title"] = new_title
                     st.session_state.threads[current_thread_id] = current_thread_data
-                    save_thread_title(current_thread_id, new_title)
                     # Note: Removed st.rerun() here to avoid interrupting flow
 
+            except TurnCancelled as e:
+                # Keep whatever was streamed before the stop
+                renderer.flush()
+                st.warning(f"⏹️ {e}")
             except Exception as e:
                 print(f"Error generating response: {e}")
                 st.error(f"Error generating response: {e}")
                 response_placeholder.write("Sorry, I encountered an error. Please try again.")
+            finally:
+                active_turns.finish(current_thread_id, cancel_token)
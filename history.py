@@ -0,0 +1,160 @@
+import os
+import time
+
+from langchain_core.messages import HumanMessage, SystemMessage
+from langgraph.constants import TAG_NOSTREAM
+
+from cancellation import cancellable_config, race, token_for
+from metrics import record_llm_call
+
+# Token-budgeted context for chat_node. The checkpoint keeps the full message
+# history for display; only the LLM prompt is bounded. Turns that fall out of
+# the budget are folded into a rolling summary stored in ChatState, and each
+# fold only summarizes the newly evicted turns on top of the previous summary.
+
+# Constants
+CONTEXT_TOKEN_BUDGET = int(os.getenv('CONTEXT_TOKEN_BUDGET', '6000'))
+SUMMARY_MAX_WORDS = 250
+# Per-message character cap when feeding evicted turns to the summarizer
+SUMMARY_SNIPPET_CHARS = 600
+CHARS_PER_TOKEN = 4
+MESSAGE_OVERHEAD_TOKENS = 4
+
+# -----------------------------
+# Token accounting
+# -----------------------------
+
+def estimate_tokens(message):
+    """Cheap token estimate (~4 chars per token) for one message"""
+    content = message.content
+    if not isinstance(content, str):
+        content = str(content)
+    chars = len(content)
+    for call in getattr(message, "tool_calls", None) or []:
+        chars += len(call.get("name", "")) + len(str(call.get("args", "")))
+    return chars // CHARS_PER_TOKEN + MESSAGE_OVERHEAD_TOKENS
+
+def plan_fold(messages, start, budget=CONTEXT_TOKEN_BUDGET):
+    """Index up to which messages should be folded into the summary.
+
+    Keeps the newest messages that fit in `budget`, then moves the cut forward
+    to the next human message so tool calls stay paired with their results.
+    Returns `start` when nothing needs folding.
+    """
+    total = 0
+    keep_from = len(messages)
+    for i in range(len(messages) - 1, start - 1, -1):
+        total += estimate_tokens(messages[i])
+        if total > budget:
+            break
+        keep_from = i
+
+    if keep_from <= start:
+        return start
+
+    human_indexes = [i for i in range(start, len(messages)) if messages[i].type == "human"]
+    if not human_indexes:
+        return start
+    for i in human_indexes:
+        if i >= keep_from:
+            return i
+    # Even the latest turn is over budget: keep at least that turn
+    return human_indexes[-1]
+
+# -----------------------------
+# Summarizer
+# -----------------------------
+
+def _render(message):
+    """One line of transcript for the summarizer prompt"""
+    content = message.content if isinstance(message.content, str) else str(message.content)
+    content = content.strip()
+    if len(content) > SUMMARY_SNIPPET_CHARS:
+        content = content[:SUMMARY_SNIPPET_CHARS] + "..."
+    if message.type == "human":
+        return f"User: {content}"
+    if message.type == "tool":
+        return f"Tool ({getattr(message, 'name', 'tool')}): {content}"
+    if not content and getattr(message, "tool_calls", None):
+        names = ", ".join(call["name"] for call in message.tool_calls)
+        return f"Assistant: [called {names}]"
+    return f"Assistant: {content}"
+
+def summary_prompt(previous_summary, evicted):
+    """Messages asking the LLM to extend the summary with the evicted turns"""
+    transcript = "\n".join(_render(m) for m in evicted)
+    return [
+        SystemMessage(content=(
+            "You maintain a running summary of a conversation between a user and an "
+            f"AI assistant. Keep it under {SUMMARY_MAX_WORDS} words. Preserve facts "
+            "about the user, decisions, open questions and any numbers or results "
+            "that may be referred to later. Reply with the updated summary only."
+        )),
+        HumanMessage(content=(
+            f"Current summary:\n{previous_summary or '(empty)'}\n\n"
+            f"New messages to fold in:\n{transcript}"
+        )),
+    ]
+
+class HistorySummarizer:
+    """Graph node that keeps `summary` / `summarized_count` up to date"""
+
+    def __init__(self, llm, budget=CONTEXT_TOKEN_BUDGET, scheduler=None):
+        # Summaries are internal; keep their tokens out of stream_mode="messages"
+        self.llm = llm.with_config(tags=[TAG_NOSTREAM])
+        self.budget = budget
+        # Optional llm_scheduler.LLMScheduler the calls go through
+        self.scheduler = scheduler
+
+    def _plan(self, state):
+        messages = state['messages']
+        start = state.get('summarized_count', 0)
+        cut = plan_fold(messages, start, self.budget)
+        if cut <= start:
+            return None
+        return cut, summary_prompt(state.get('summary', ''), messages[start:cut])
+
+    def node(self, state, config=None):
+        """Sync node: fold evicted turns into the rolling summary"""
+        plan = self._plan(state)
+        if plan is None:
+            return {}
+        cut, prompt = plan
+        token = token_for(config)
+        call_config = cancellable_config(config, token, "summarize")
+        started = time.perf_counter()
+        if self.scheduler is not None:
+            response = self.scheduler.invoke(self.llm, prompt, config=call_config, cancel=token)
+        else:
+            response = self.llm.invoke(prompt, call_config)
+        record_llm_call(response, time.perf_counter() - started, call="summary")
+        return {'summary': response.content, 'summarized_count': cut}
+
+    async def anode(self, state, config=None):
+        """Async node: fold evicted turns into the rolling summary"""
+        plan = self._plan(state)
+        if plan is None:
+            return {}
+        cut, prompt = plan
+        token = token_for(config)
+        started = time.perf_counter()
+        if self.scheduler is not None:
+            response = await self.scheduler.ainvoke(self.llm, prompt, config=config, cancel=token)
+        else:
+            response = await race(self.llm.ainvoke(prompt, config), token, "summarize")
+        record_llm_call(response, time.perf_counter() - started, call="summary")
+        return {'summary': response.content, 'summarized_count': cut}
+
+# -----------------------------
+# Context
+# -----------------------------
+
+def build_context(system_prompt, state):
+    """Prompt for chat_node: system prompt (+ summary), then unsummarized turns"""
+    summary = state.get('summary')
+    if summary:
+        system_prompt = SystemMessage(content=(
+            f"{system_prompt.content}\n"
+            f"Summary of the earlier conversation:\n{summary}"
+        ))
+    return [system_prompt] + state['messages'][state.get('summarized_count', 0):]
@@ -0,0 +1,377 @@
+import asyncio
+import heapq
+import itertools
+import os
+import random
+import threading
+import time
+
+from cancellation import CANCEL_POLL_SECONDS, TurnCancelled, race
+from history import CHARS_PER_TOKEN, estimate_tokens
+from metrics import registry
+
+# Client-side scheduling for every LLM call (chat_node and the summarizer), so
+# a traffic spike queues instead of turning into a burst of provider 429s that
+# fail everyone at once.
+#
+#   - at most LLM_MAX_CONCURRENCY calls are in flight; the rest wait in a
+#     priority queue where first turns (the last message is the user's) go
+#     ahead of follow-ups after tool calls
+#   - token buckets hold calls to LLM_RPM requests and LLM_TPM tokens per
+#     minute (0 = no limit); tokens are reserved from an estimate and
+#     corrected from the response's usage
+#   - retryable errors (429, 5xx, timeouts) are retried with exponential
+#     backoff and full jitter, without holding a slot while sleeping; a 429
+#     also empties the request bucket so other callers slow down with it
+#
+# The same scheduler serves threads (Streamlit, sync workflow) and the event
+# loop (server.py), so one process has one shared budget.
+#
+# With a `cancel` token (cancellation.py) a call gives up its place in the
+# queue and its sleeps as soon as the turn is cancelled; a cancelled call is
+# never retried or counted as a failure.
+
+# Constants
+LLM_MAX_CONCURRENCY = int(os.getenv('LLM_MAX_CONCURRENCY', '8'))
+LLM_RPM = float(os.getenv('LLM_RPM', '0'))
+LLM_TPM = float(os.getenv('LLM_TPM', '0'))
+LLM_MAX_RETRIES = int(os.getenv('LLM_MAX_RETRIES', '4'))
+LLM_BACKOFF_BASE = float(os.getenv('LLM_BACKOFF_BASE', '0.5'))
+LLM_BACKOFF_MAX = float(os.getenv('LLM_BACKOFF_MAX', '20'))
+# Seconds a call may wait for a slot before failing
+LLM_QUEUE_TIMEOUT = float(os.getenv('LLM_QUEUE_TIMEOUT', '60'))
+# Completion tokens reserved up front, before the real usage is known
+LLM_EXPECTED_OUTPUT_TOKENS = int(os.getenv('LLM_EXPECTED_OUTPUT_TOKENS', '500'))
+
+PRIORITY_INTERACTIVE = 0
+PRIORITY_FOLLOW_UP = 1
+PRIORITY_NAMES = {PRIORITY_INTERACTIVE: "interactive", PRIORITY_FOLLOW_UP: "follow_up"}
+
+RETRYABLE_STATUS = {408, 429, 500, 502, 503, 504}
+RETRYABLE_ERRORS = ("RateLimit", "ResourceExhausted", "TooManyRequests",
+                    "ServiceUnavailable", "DeadlineExceeded", "Timeout")
+
+class QueueTimeout(Exception):
+    """An LLM call waited longer than LLM_QUEUE_TIMEOUT for a slot"""
+
+def priority_for(messages):
+    """Follow-ups after tool results wait behind new user turns"""
+    last = messages[-1] if isinstance(messages, list) and messages else None
+    return PRIORITY_FOLLOW_UP if getattr(last, "type", None) == "tool" else PRIORITY_INTERACTIVE
+
+def estimate_prompt_tokens(messages):
+    if isinstance(messages, str):
+        return len(messages) // CHARS_PER_TOKEN
+    return sum(estimate_tokens(m) for m in messages)
+
+def _status(error):
+    for value in (getattr(error, "status_code", None), getattr(error, "code", None),
+                  getattr(getattr(error, "response", None), "status_code", None)):
+        if isinstance(value, int):
+            return value
+    return None
+
+def retry_reason(error):
+    """"rate_limit" or "error" for a retryable exception (or its causes), else None"""
+    seen = set()
+    while error is not None and id(error) not in seen:
+        seen.add(id(error))
+        status = _status(error)
+        names = " ".join(cls.__name__ for cls in type(error).__mro__)
+        if status == 429 or "RateLimit" in names or "ResourceExhausted" in names or "429" in str(error):
+            return "rate_limit"
+        if status in RETRYABLE_STATUS or any(name in names for name in RETRYABLE_ERRORS):
+            return "error"
+        error = error.__cause__ or error.__context__
+    return None
+
+# -----------------------------
+# Token bucket
+# -----------------------------
+
+class TokenBucket:
+    """`per_minute` units refilled continuously, holding at most a minute's worth.
+
+    reserve() debits right away (the balance may go negative) and returns how
+    long the caller has to wait, so reservations are honoured in order.
+    """
+
+    def __init__(self, per_minute, clock=time.monotonic):
+        self.capacity = per_minute
+        self.rate = per_minute / 60
+        self.clock = clock
+        self.tokens = per_minute
+        self.updated = clock()
+        self._lock = threading.Lock()
+
+    def _refill(self):
+        now = self.clock()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def reserve(self, amount):
+        """Debit `amount`; seconds until it is covered (0 when unlimited)"""
+        if self.rate <= 0:
+            return 0.0
+        with self._lock:
+            self._refill()
+            # A request bigger than the bucket must still get through eventually
+            self.tokens -= min(amount, self.capacity)
+            return 0.0 if self.tokens >= 0 else -self.tokens / self.rate
+
+    def refund(self, amount):
+        """Return (or, if negative, charge) units after the fact"""
+        if self.rate <= 0:
+            return
+        with self._lock:
+            self._refill()
+            self.tokens = min(self.capacity, self.tokens + amount)
+
+    def drain(self):
+        """Drop any burst allowance, e.g. after the provider said 429"""
+        if self.rate <= 0:
+            return
+        with self._lock:
+            self._refill()
+            self.tokens = min(self.tokens, 0)
+
+# -----------------------------
+# Scheduler
+# -----------------------------
+
+class _Waiter:
+    __slots__ = ("priority", "wake", "granted", "cancelled")
+
+    def __init__(self, priority, wake):
+        self.priority = priority
+        self.wake = wake
+        self.granted = False
+        self.cancelled = False
+
+class LLMScheduler:
+    """Priority queue, concurrency limit, rate limits and retries for LLM calls"""
+
+    def __init__(self, max_concurrency=LLM_MAX_CONCURRENCY, rpm=LLM_RPM, tpm=LLM_TPM,
+                 max_retries=LLM_MAX_RETRIES, backoff_base=LLM_BACKOFF_BASE,
+                 backoff_max=LLM_BACKOFF_MAX, queue_timeout=LLM_QUEUE_TIMEOUT,
+                 expected_output_tokens=LLM_EXPECTED_OUTPUT_TOKENS):
+        self.max_concurrency = max_concurrency
+        self.requests = TokenBucket(rpm)
+        self.tokens = TokenBucket(tpm)
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.queue_timeout = queue_timeout
+        self.expected_output_tokens = expected_output_tokens
+
+        self._lock = threading.Lock()
+        self._waiters = []
+        self._seq = itertools.count()
+        self.running = 0
+        self.queued = {priority: 0 for priority in PRIORITY_NAMES}
+        self.counts = {"calls": 0, "retries": 0, "throttled": 0, "failures": 0, "queue_timeouts": 0}
+
+    # Slots
+
+    def _enqueue(self, priority, wake):
+        """Take a free slot (returns None) or join the queue (returns the waiter)"""
+        with self._lock:
+            if self.running < self.max_concurrency and not any(self.queued.values()):
+                self.running += 1
+                return None
+            waiter = _Waiter(priority, wake)
+            heapq.heappush(self._waiters, (priority, next(self._seq), waiter))
+            self.queued[priority] += 1
+            return waiter
+
+    def _release(self):
+        """Hand the slot to the best waiter, or free it"""
+        with self._lock:
+            while self._waiters:
+                _, _, waiter = heapq.heappop(self._waiters)
+                if waiter.cancelled:
+                    continue
+                waiter.granted = True
+                self.queued[waiter.priority] -= 1
+                waiter.wake()
+                return
+            self.running -= 1
+
+    def _abandon(self, waiter):
+        """Leave the queue; True if the slot was granted in the meantime"""
+        with self._lock:
+            if waiter.granted:
+                return True
+            waiter.cancelled = True
+            self.queued[waiter.priority] -= 1
+            return False
+
+    def _waited(self, priority, started):
+        registry.observe("chatbot_llm_queue_seconds", time.perf_counter() - started,
+                         "Time an LLM call waited for a slot", priority=PRIORITY_NAMES[priority])
+
+    def _timed_out(self, priority):
+        with self._lock:
+            self.counts["queue_timeouts"] += 1
+        registry.inc("chatbot_llm_queue_timeouts_total", 1, "LLM calls that never got a slot",
+                     priority=PRIORITY_NAMES[priority])
+        return QueueTimeout(f"LLM request queued for more than {self.queue_timeout}s")
+
+    def _wait_granted(self, event, cancel):
+        """Wait for a handed-over slot; False on queue timeout or cancellation"""
+        if cancel is None:
+            return event.wait(self.queue_timeout)
+        deadline = time.perf_counter() + self.queue_timeout
+        while not cancel.cancelled:
+            remaining = deadline - time.perf_counter()
+            if remaining <= 0:
+                return False
+            if event.wait(min(remaining, CANCEL_POLL_SECONDS)):
+                return True
+        return False
+
+    def _not_granted(self, priority, cancel):
+        if cancel is not None and cancel.cancelled:
+            return cancel.error("llm_queue")
+        return self._timed_out(priority)
+
+    def _acquire(self, priority, cancel=None):
+        started = time.perf_counter()
+        event = threading.Event()
+        waiter = self._enqueue(priority, event.set)
+        if waiter is not None and not self._wait_granted(event, cancel):
+            if not self._abandon(waiter):
+                raise self._not_granted(priority, cancel)
+        self._waited(priority, started)
+
+    async def _aacquire(self, priority, cancel=None):
+        started = time.perf_counter()
+        loop = asyncio.get_running_loop()
+        granted = loop.create_future()
+
+        def wake():
+            loop.call_soon_threadsafe(lambda: granted.done() or granted.set_result(None))
+
+        waiter = self._enqueue(priority, wake)
+        if waiter is not None:
+            try:
+                await asyncio.wait_for(race(asyncio.shield(granted), cancel, "llm_queue"), self.queue_timeout)
+            except (asyncio.TimeoutError, TurnCancelled) as e:
+                if not self._abandon(waiter):
+                    if isinstance(e, TurnCancelled):
+                        raise
+                    raise self._timed_out(priority)
+            except asyncio.CancelledError:
+                if self._abandon(waiter):
+                    self._release()
+                raise
+        self._waited(priority, started)
+
+    # Rate limits and retries
+
+    def _throttle(self, estimate):
+        """Seconds to wait before sending, after reserving one request and `estimate` tokens"""
+        delay = max(self.requests.reserve(1), self.tokens.reserve(estimate))
+        if delay:
+            with self._lock:
+                self.counts["throttled"] += 1
+            registry.observe("chatbot_llm_throttle_seconds", delay,
+                             "Time an LLM call was held back by the rate limits")
+        return delay
+
+    def _settle(self, response, estimate):
+        usage = getattr(response, "usage_metadata", None) or {}
+        if usage.get("total_tokens") is not None:
+            self.tokens.refund(estimate - usage["total_tokens"])
+
+    def _backoff(self, error, attempt):
+        """Seconds to sleep before retrying `error`, or None to give up"""
+        reason = retry_reason(error)
+        if reason is None or attempt >= self.max_retries:
+            with self._lock:
+                self.counts["failures"] += 1
+            registry.inc("chatbot_llm_failures_total", 1, "LLM calls failed after retries",
+                         reason=reason or "fatal")
+            return None
+        if reason == "rate_limit":
+            self.requests.drain()
+        with self._lock:
+            self.counts["retries"] += 1
+        registry.inc("chatbot_llm_retries_total", 1, "LLM call retries", reason=reason)
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * 2 ** attempt))
+
+    def _prepare(self, messages, priority):
+        with self._lock:
+            self.counts["calls"] += 1
+        priority = priority_for(messages) if priority is None else priority
+        return priority, estimate_prompt_tokens(messages) + self.expected_output_tokens
+
+    # Entry points
+
+    def _sleep(self, seconds, cancel):
+        if cancel is None:
+            time.sleep(seconds)
+        elif cancel.sleep(seconds):
+            raise cancel.error("llm")
+
+    async def _asleep(self, seconds, cancel):
+        if cancel is None:
+            await asyncio.sleep(seconds)
+        elif await cancel.asleep(seconds):
+            raise cancel.error("llm")
+
+    def invoke(self, model, messages, priority=None, config=None, cancel=None):
+        """model.invoke(messages, config) once a slot and the rate limits allow, with retries"""
+        priority, estimate = self._prepare(messages, priority)
+        for attempt in itertools.count():
+            self._acquire(priority, cancel)
+            try:
+                self._sleep(self._throttle(estimate), cancel)
+                response = model.invoke(messages, config)
+            except TurnCancelled:
+                raise
+            except Exception as e:
+                error = e
+            else:
+                self._settle(response, estimate)
+                return response
+            finally:
+                self._release()
+            delay = self._backoff(error, attempt)
+            if delay is None:
+                raise error
+            self._sleep(delay, cancel)
+
+    async def ainvoke(self, model, messages, priority=None, config=None, cancel=None):
+        """Async invoke(): waits on the event loop instead of blocking it"""
+        priority, estimate = self._prepare(messages, priority)
+        for attempt in itertools.count():
+            await self._aacquire(priority, cancel)
+            try:
+                await self._asleep(self._throttle(estimate), cancel)
+                response = await race(model.ainvoke(messages, config), cancel, "llm")
+            except TurnCancelled:
+                raise
+            except Exception as e:
+                error = e
+            else:
+                self._settle(response, estimate)
+                return response
+            finally:
+                self._release()
+            delay = self._backoff(error, attempt)
+            if delay is None:
+                raise error
+            await self._asleep(delay, cancel)
+
+    def stats(self):
+        with self._lock:
+            return {
+                "running": self.running,
+                "queued": sum(self.queued.values()),
+                **{f"queued_{PRIORITY_NAMES[p]}": n for p, n in self.queued.items()},
+                **self.counts,
+            }
+
+# Shared by the sync and async workflows
+llm_scheduler = LLMScheduler()
@@ -0,0 +1,204 @@
+import atexit
+import os
+import sqlite3
+import threading
+import time
+
+from chat_store import write_pin, write_title
+from db import delete_thread_rows
+from metrics import registry
+from storage import get_storage
+
+# Write-behind queue for sidebar metadata (pin, rename, delete). The
+# Streamlit script updates st.session_state right away and hands the write to
+# a background worker, so a click never waits on the SQLite write lock held
+# by another session's checkpoint.
+#
+#   - Mutations are keyed by (thread_id, kind) and coalesced: toggling a pin
+#     five times writes the last state once, and a delete drops whatever was
+#     still queued for the thread.
+#   - After a short linger (WRITE_BEHIND_DELAY) everything queued is written
+#     with one transaction per storage shard. A failed batch (e.g. the lock
+#     was still busy after busy_timeout) is queued again behind newer values
+#     and retried after WRITE_BEHIND_RETRY seconds.
+#   - close() (registered with atexit) flushes what is left on shutdown.
+#
+# The HTTP server keeps the synchronous chat_store helpers: its clients need
+# the outcome of each request.
+
+# Constants
+WRITE_BEHIND_DELAY = float(os.getenv('WRITE_BEHIND_DELAY', '0.05'))
+WRITE_BEHIND_RETRY = float(os.getenv('WRITE_BEHIND_RETRY', '1'))
+# Seconds close() waits for the queue to drain at shutdown
+WRITE_BEHIND_FLUSH_TIMEOUT = float(os.getenv('WRITE_BEHIND_FLUSH_TIMEOUT', '10'))
+
+OPERATIONS = {
+    "title": write_title,
+    "pin": write_pin,
+    "delete": lambda conn, thread_id, _: delete_thread_rows(conn, thread_id),
+}
+
+class MetadataWriter:
+    """Background worker batching and coalescing thread metadata writes"""
+
+    def __init__(self, storage=None, delay=WRITE_BEHIND_DELAY, retry=WRITE_BEHIND_RETRY):
+        self.storage = storage
+        self.delay = delay
+        self.retry = retry
+        self._pending = {}   # (thread_id, kind) -> value, oldest first
+        self._in_flight = 0
+        self._thread = None
+        self._closed = False
+        self._cond = threading.Condition()
+        self.counts = {"queued": 0, "coalesced": 0, "written": 0, "batches": 0, "failures": 0}
+
+    # Queueing
+
+    def submit(self, kind, thread_id, value=None):
+        """Queue one mutation; returns immediately"""
+        if kind not in OPERATIONS:
+            raise ValueError(f"Unknown metadata operation: {kind}")
+        with self._cond:
+            if kind == "delete":
+                # Nothing still queued for the thread matters any more
+                for key in [key for key in self._pending if key[0] == thread_id]:
+                    del self._pending[key]
+                    self.counts["coalesced"] += 1
+            key = (thread_id, kind)
+            if key in self._pending:
+                del self._pending[key]
+                self.counts["coalesced"] += 1
+            self._pending[key] = value
+            self.counts["queued"] += 1
+            if self._closed:
+                # Shutting down: no worker left to hand this to
+                batch, self._pending = self._pending, {}
+            else:
+                batch = None
+                self._start()
+                self._cond.notify_all()
+        if batch:
+            self._write(batch)
+
+    def set_title(self, thread_id, title):
+        self.submit("title", thread_id, title)
+
+    def set_pin(self, thread_id, pinned):
+        self.submit("pin", thread_id, bool(pinned))
+
+    def delete(self, thread_id):
+        self.submit("delete", thread_id)
+
+    # Worker
+
+    def _start(self):
+        """Start the worker on first use; caller holds the condition"""
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="metadata-writer", daemon=True)
+            self._thread.start()
+            atexit.register(self.close)
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while not self._pending and not self._closed:
+                    self._cond.wait()
+                if not self._pending:
+                    return
+            # Let a burst of clicks collect into one batch
+            time.sleep(self.delay)
+            with self._cond:
+                batch, self._pending = self._pending, {}
+                self._in_flight = len(batch)
+            failed = self._write(batch)
+            with self._cond:
+                self._in_flight = 0
+                if failed:
+                    self._requeue(failed)
+                self._cond.notify_all()
+                if failed and not self._closed:
+                    self._cond.wait(self.retry)
+                elif failed:
+                    return   # closing: give up rather than retry forever
+
+    def _requeue(self, failed):
+        """Put failed writes back ahead of newer ones, unless superseded; caller holds the condition"""
+        requeued = {
+            key: value for key, value in failed.items()
+            if key not in self._pending and (key[0], "delete") not in self._pending
+        }
+        requeued.update(self._pending)
+        self._pending = requeued
+
+    def _write(self, batch):
+        """One transaction per shard; returns the mutations that failed"""
+        storage = self.storage or get_storage()
+        shards = {}
+        for key, value in batch.items():
+            pool = storage.pool_for(key[0])
+            shards.setdefault(id(pool), (pool, {}))[1][key] = value
+
+        failed = {}
+        for pool, mutations in shards.values():
+            started = time.perf_counter()
+            try:
+                with pool.transaction() as conn:
+                    for (thread_id, kind), value in mutations.items():
+                        OPERATIONS[kind](conn, thread_id, value)
+            except sqlite3.Error as e:
+                print(f"Error writing thread metadata: {e}")
+                failed.update(mutations)
+                with self._cond:
+                    self.counts["failures"] += 1
+                registry.inc("chatbot_metadata_write_failures_total", 1,
+                             "Metadata batches that failed and were queued again")
+                continue
+            with self._cond:
+                self.counts["written"] += len(mutations)
+                self.counts["batches"] += 1
+            registry.observe("chatbot_metadata_flush_seconds", time.perf_counter() - started,
+                             "Time to write one batch of queued metadata mutations")
+        return failed
+
+    # Flushing
+
+    def flush(self, timeout=WRITE_BEHIND_FLUSH_TIMEOUT):
+        """Wait until everything queued so far is written; False on timeout"""
+        deadline = time.monotonic() + timeout
+        with self._cond:
+            while self._pending or self._in_flight:
+                if self._thread is None or not self._thread.is_alive():
+                    return False
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return False
+                self._cond.wait(remaining)
+            return True
+
+    def close(self, timeout=WRITE_BEHIND_FLUSH_TIMEOUT):
+        """Flush and stop the worker; later submits are written synchronously"""
+        flushed = self.flush(timeout)
+        with self._cond:
+            self._closed = True
+            leftover = {} if flushed else self._pending
+            if leftover:
+                self._pending = {}
+            thread = self._thread
+            self._cond.notify_all()
+        if thread is not None:
+            thread.join(timeout)
+        if leftover:
+            # Last attempt on the caller's thread so nothing is silently dropped
+            self._write(leftover)
+
+    def stats(self):
+        with self._cond:
+            return {
+                "depth": len(self._pending) + self._in_flight,
+                **self.counts,
+            }
+
+# Shared by every Streamlit session of the process
+metadata_writer = MetadataWriter()
+
+registry.register_collector("chatbot_metadata_writer", metadata_writer.stats)
@@ -0,0 +1,280 @@
+import bisect
+import inspect
+import json
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# In-process metrics: counters and fixed-bucket histograms, exported in
+# Prometheus text format or as JSON, plus optional per-turn trace spans.
+# Recording is a dict lookup, a bisect and a few additions under a lock, so it
+# stays on in production. Spans are only built when CHATBOT_TRACE is set.
+
+# Constants
+LATENCY_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+TOKEN_BUCKETS = (16, 64, 256, 1024, 4096, 16384, 65536)
+TRACE_ENABLED = os.getenv('CHATBOT_TRACE', '') not in ('', '0', 'false')
+
+trace_logger = logging.getLogger("chatbot.trace")
+
+def _label_key(labels):
+    return tuple(sorted(labels.items()))
+
+def _format_labels(key, extra=()):
+    pairs = list(key) + list(extra)
+    if not pairs:
+        return ""
+    body = ",".join(f'{k}="{str(v)}"' for k, v in pairs)
+    return "{" + body + "}"
+
+# -----------------------------
+# Metric types
+# -----------------------------
+
+class Counter:
+    def __init__(self, name, help_text):
+        self.name = name
+        self.help = help_text
+        self.values = {}
+
+    def inc(self, key, amount=1):
+        self.values[key] = self.values.get(key, 0) + amount
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        for key, value in sorted(self.values.items()):
+            lines.append(f"{self.name}{_format_labels(key)} {value}")
+        return lines
+
+    def snapshot(self):
+        return [{"labels": dict(k), "value": v} for k, v in sorted(self.values.items())]
+
+class Histogram:
+    def __init__(self, name, help_text, buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.help = help_text
+        self.buckets = tuple(buckets)
+        # key -> [bucket counts..., +Inf count, sum]
+        self.series = {}
+
+    def observe(self, key, value):
+        series = self.series.get(key)
+        if series is None:
+            series = self.series[key] = [0] * (len(self.buckets) + 1) + [0.0]
+        series[bisect.bisect_left(self.buckets, value)] += 1
+        series[-1] += value
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        for key, series in sorted(self.series.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets + ("+Inf",), series[:-1]):
+                cumulative += count
+                lines.append(f"{self.name}_bucket{_format_labels(key, [('le', bound)])} {cumulative}")
+            lines.append(f"{self.name}_sum{_format_labels(key)} {series[-1]}")
+            lines.append(f"{self.name}_count{_format_labels(key)} {cumulative}")
+        return lines
+
+    def snapshot(self):
+        result = []
+        for key, series in sorted(self.series.items()):
+            count = sum(series[:-1])
+            result.append({
+                "labels": dict(key),
+                "count": count,
+                "sum": series[-1],
+                "mean": series[-1] / count if count else 0.0,
+                "buckets": dict(zip([str(b) for b in self.buckets] + ["+Inf"], series[:-1])),
+            })
+        return result
+
+# -----------------------------
+# Registry
+# -----------------------------
+
+class Registry:
+    """Holds every metric plus gauge collectors for existing stats objects"""
+
+    def __init__(self):
+        self._metrics = {}
+        self._collectors = {}
+        self._lock = threading.Lock()
+
+    def _get(self, cls, name, help_text, **kwargs):
+        metric = self._metrics.get(name)
+        if metric is None:
+            metric = self._metrics[name] = cls(name, help_text, **kwargs)
+        return metric
+
+    def inc(self, name, amount=1, help_text="", **labels):
+        with self._lock:
+            self._get(Counter, name, help_text).inc(_label_key(labels), amount)
+
+    def observe(self, name, value, help_text="", buckets=LATENCY_BUCKETS, **labels):
+        with self._lock:
+            self._get(Histogram, name, help_text, buckets=buckets).observe(_label_key(labels), value)
+
+    def register_collector(self, name, collect):
+        """Expose `collect()` -> {field: number} as gauges named <name>_<field>"""
+        self._collectors[name] = collect
+
+    def _collected(self):
+        gauges = {}
+        for name, collect in list(self._collectors.items()):
+            try:
+                values = collect()
+            except Exception as e:
+                print(f"Error collecting {name} metrics: {e}")
+                continue
+            for field, value in values.items():
+                if isinstance(value, (int, float)) and not isinstance(value, bool):
+                    gauges[f"{name}_{field}"] = value
+        return gauges
+
+    def render_prometheus(self):
+        """Prometheus text exposition format (version 0.0.4)"""
+        with self._lock:
+            lines = []
+            for metric in self._metrics.values():
+                lines.extend(metric.render())
+        for name, value in sorted(self._collected().items()):
+            lines.append(f"# TYPE {name} gauge")
+            lines.append(f"{name} {value}")
+        return "\n".join(lines) + "\n"
+
+    def snapshot(self):
+        """All metrics as a JSON-serialisable dict"""
+        with self._lock:
+            data = {name: metric.snapshot() for name, metric in self._metrics.items()}
+        data["gauges"] = self._collected()
+        return data
+
+    def to_json(self):
+        return json.dumps(self.snapshot())
+
+    def reset(self):
+        with self._lock:
+            self._metrics.clear()
+
+registry = Registry()
+
+# -----------------------------
+# Recording helpers
+# -----------------------------
+
+@contextmanager
+def timer(name, help_text="", **labels):
+    """Observe the duration of the block in seconds"""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        registry.observe(name, time.perf_counter() - started, help_text, **labels)
+
+def record_llm_call(response, seconds, call="chat"):
+    """Latency plus prompt / completion token counts of one LLM response"""
+    registry.observe("chatbot_llm_seconds", seconds, "LLM call latency", call=call)
+    usage = getattr(response, "usage_metadata", None) or {}
+    for kind, field in (("prompt", "input_tokens"), ("completion", "output_tokens")):
+        if usage.get(field) is not None:
+            registry.observe(
+                "chatbot_llm_tokens", usage[field], "Tokens per LLM call",
+                buckets=TOKEN_BUCKETS, call=call, kind=kind,
+            )
+            registry.inc("chatbot_llm_tokens_total", usage[field], "Tokens used", call=call, kind=kind)
+
+def record_tool_call(tool, seconds, outcome="ok"):
+    registry.observe("chatbot_tool_seconds", seconds, "Tool call latency", tool=tool, outcome=outcome)
+
+def record_checkpoint_op(op, seconds):
+    registry.observe("chatbot_checkpoint_seconds", seconds, "Checkpointer operation latency", op=op)
+
+# -----------------------------
+# Trace spans
+# -----------------------------
+
+def emit_span(name, started, duration, config=None, **attributes):
+    """Log one structured span (JSON) for the current turn, if tracing is on"""
+    if not TRACE_ENABLED:
+        return
+    configurable = (config or {}).get("configurable", {})
+    metadata = (config or {}).get("metadata", {})
+    trace_logger.info(json.dumps({
+        "trace_id": configurable.get("thread_id"),
+        "step": metadata.get("langgraph_step"),
+        "span": name,
+        "start": started,
+        "duration_ms": round(duration * 1000, 3),
+        **attributes,
+    }, default=str))
+
+def instrument_node(name, fn):
+    """Wrap a sync or async graph node with latency, error and span recording"""
+    wants_config = "config" in inspect.signature(fn).parameters
+
+    def finish(started_wall, started, config, error=None):
+        duration = time.perf_counter() - started
+        registry.observe("chatbot_node_seconds", duration, "Graph node latency", node=name)
+        if error is not None:
+            registry.inc("chatbot_node_errors_total", 1, "Graph node failures",
+                         node=name, error=type(error).__name__)
+        emit_span(name, started_wall, duration, config,
+                  error=type(error).__name__ if error else None)
+
+    # No functools.wraps: LangGraph inspects the signature to decide whether
+    # to pass `config`, and the wrapper always wants it.
+    if inspect.iscoroutinefunction(fn):
+        async def async_node(state, config):
+            started_wall, started = time.time(), time.perf_counter()
+            try:
+                result = await (fn(state, config) if wants_config else fn(state))
+            except BaseException as e:
+                finish(started_wall, started, config, e)
+                raise
+            finish(started_wall, started, config)
+            return result
+        async_node.__name__ = name
+        return async_node
+
+    def node(state, config):
+        started_wall, started = time.time(), time.perf_counter()
+        try:
+            result = fn(state, config) if wants_config else fn(state)
+        except BaseException as e:
+            finish(started_wall, started, config, e)
+            raise
+        finish(started_wall, started, config)
+        return result
+    node.__name__ = name
+    return node
+
+# -----------------------------
+# Export endpoint
+# -----------------------------
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.startswith("/metrics.json"):
+            body, content_type = registry.to_json().encode(), "application/json"
+        elif self.path.startswith("/metrics"):
+            body, content_type = registry.render_prometheus().encode(), "text/plain; version=0.0.4"
+        else:
+            self.send_error(404)
+            return
+        self.send_response(200)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+def start_http_server(port, host="0.0.0.0"):
+    """Serve /metrics (Prometheus) and /metrics.json on a daemon thread"""
+    server = ThreadingHTTPServer((host, port), _MetricsHandler)
+    threading.Thread(target=server.serve_forever, name="metrics-http", daemon=True).start()
+    return server
@@ -0,0 +1,94 @@
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+from cache import TTLCache
+
+# AlphaVantage quote fetching shared by the sync and async stock tools.
+# Point ALPHAVANTAGE_BASE_URL at a local stub server to exercise the cache
+# without touching the real (rate-limited) API.
+
+# Constants
+ALPHAVANTAGE_BASE_URL = os.getenv('ALPHAVANTAGE_BASE_URL', 'https://www.alphavantage.co/query')
+QUOTE_CACHE_TTL = float(os.getenv('QUOTE_CACHE_TTL', '60'))
+QUOTE_CACHE_SIZE = int(os.getenv('QUOTE_CACHE_SIZE', '256'))
+MAX_SYMBOLS_PER_CALL = 10
+REQUEST_TIMEOUT = 10
+
+# Error payloads are never cached so a transient failure is retried next time
+quote_cache = TTLCache(
+    ttl=QUOTE_CACHE_TTL,
+    maxsize=QUOTE_CACHE_SIZE,
+    should_cache=lambda data: "error" not in data,
+)
+
+# One pooled session so repeated lookups reuse the TLS connection
+session = requests.Session()
+
+def normalize_symbol(symbol):
+    """Upper-cased symbol, or None if it is invalid"""
+    symbol = (symbol or '').strip()
+    if not symbol or not symbol.replace('.', '').isalnum() or len(symbol) > 10:
+        return None
+    return symbol.upper()
+
+def parse_symbols(symbols):
+    """Split "AAPL, MSFT TSLA" (or a list) into unique symbols, keeping order"""
+    if isinstance(symbols, str):
+        symbols = symbols.replace(',', ' ').split()
+    return list(dict.fromkeys(normalize_symbol(s) or s for s in symbols))
+
+def quote_url(symbol):
+    """AlphaVantage GLOBAL_QUOTE url for a symbol, or None if it is invalid"""
+    symbol = normalize_symbol(symbol)
+    if symbol is None:
+        return None
+
+    # Get API key from environment
+    api_key = os.getenv('ALPHAVANTAGE_API_KEY', 'KSN55W3NLCMWS51O')
+
+    return f'{ALPHAVANTAGE_BASE_URL}?function=GLOBAL_QUOTE&symbol={symbol}&apikey={api_key}'
+
+def check_quote_payload(data):
+    """Map AlphaVantage error payloads to the tool's error shape.
+
+    Rate-limit replies ({"Note": ...}, {"Information": ...}) and anything
+    without a quote become errors too, so they are never cached.
+    """
+    if not isinstance(data, dict):
+        return {"error": "Unexpected response from the quote API"}
+    for key in ("Error Message", "Note", "Information"):
+        if key in data:
+            return {"error": data[key]}
+    if not data.get("Global Quote"):
+        return {"error": "No quote available for this symbol"}
+    return data
+
+def _fetch_quote_uncached(symbol):
+    """One HTTP round trip for one symbol"""
+    try:
+        r = session.get(quote_url(symbol), timeout=REQUEST_TIMEOUT)
+        r.raise_for_status()
+        return check_quote_payload(r.json())
+    except requests.RequestException as e:
+        return {"error": f"API request failed: {str(e)}"}
+
+def fetch_quote(symbol):
+    """Cached quote for one symbol; concurrent lookups share one request"""
+    symbol = normalize_symbol(symbol)
+    if symbol is None:
+        return {"error": "Invalid stock symbol"}
+    return quote_cache.get_or_load(symbol, lambda: _fetch_quote_uncached(symbol))
+
+def fetch_quotes(symbols):
+    """Cached quotes for several symbols, fetched concurrently.
+
+    Returns {symbol: payload} in the order the symbols were given.
+    """
+    symbols = parse_symbols(symbols)[:MAX_SYMBOLS_PER_CALL]
+    if len(symbols) <= 1:
+        return {s: fetch_quote(s) for s in symbols}
+    with ThreadPoolExecutor(max_workers=len(symbols)) as pool:
+        results = pool.map(fetch_quote, symbols)
+    return dict(zip(symbols, results))
@@ -0,0 +1,264 @@
+import argparse
+import hashlib
+import os
+import re
+import sqlite3
+import threading
+import time
+
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, AIMessageChunk
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+
+import db
+from metrics import registry
+
+# Opt-in cache of answers to stateless questions ("explain X", "roadmap for
+# Y"), which repeat across users and otherwise cost a full Gemini call each.
+# Only first turns are eligible (the thread holds just the user's message),
+# and only plain answers are stored: replies with tool calls, empty replies
+# and oversized ones are not. The key is the normalized question plus the
+# system prompt and model name, so a prompt or model change starts afresh.
+#
+# Hits are replayed inside chat_node through ReplayChatModel, which streams
+# the stored text word by word, so stream_mode="messages" consumers see the
+# same chat_node tokens as for a live answer.
+#
+# Usage:
+#     RESPONSE_CACHE=1 streamlit run frontend_fixed.py
+#     python response_cache.py --stats
+#     python response_cache.py --purge            # drop every entry
+#     python response_cache.py --purge --expired  # drop expired entries only
+
+# Constants
+RESPONSE_CACHE_ENABLED = os.getenv('RESPONSE_CACHE', '') not in ('', '0', 'false')
+RESPONSE_CACHE_DB = os.getenv('RESPONSE_CACHE_DB', 'response_cache.db')
+RESPONSE_CACHE_TTL = float(os.getenv('RESPONSE_CACHE_TTL', str(7 * 24 * 3600)))
+RESPONSE_CACHE_MAX_ENTRIES = int(os.getenv('RESPONSE_CACHE_MAX_ENTRIES', '10000'))
+# Longer answers are not worth the space (and are rarely reused verbatim)
+RESPONSE_CACHE_MAX_CHARS = int(os.getenv('RESPONSE_CACHE_MAX_CHARS', '20000'))
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS response_cache (
+    key TEXT PRIMARY KEY,
+    model TEXT,
+    question TEXT,
+    answer TEXT,
+    created_at REAL,
+    last_used REAL,
+    hits INTEGER DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS idx_response_cache_last_used ON response_cache (last_used);
+"""
+
+def normalize_question(text):
+    """Case, whitespace and trailing punctuation do not change the question"""
+    text = " ".join(text.casefold().split())
+    return re.sub(r"[\s?!.]+$", "", text)
+
+def model_name(llm):
+    return getattr(llm, "model", None) or getattr(llm, "model_name", None) or llm._llm_type
+
+def first_turn_question(state):
+    """The user's text when this is the thread's first, plain-text turn, else None"""
+    messages = state['messages']
+    if len(messages) != 1 or state.get('summary'):
+        return None
+    message = messages[0]
+    if message.type != "human" or not isinstance(message.content, str):
+        return None
+    return message.content if message.content.strip() else None
+
+def cacheable(response):
+    """Plain text answers only: no tool calls, nothing empty or oversized"""
+    content = response.content
+    return (
+        not getattr(response, "tool_calls", None)
+        and isinstance(content, str)
+        and 0 < len(content.strip())
+        and len(content) <= RESPONSE_CACHE_MAX_CHARS
+    )
+
+# -----------------------------
+# Replay model
+# -----------------------------
+
+class ReplayChatModel(BaseChatModel):
+    """Chat model that "generates" a stored answer, streaming it word by word"""
+
+    text: str
+
+    @property
+    def _llm_type(self):
+        return "response-cache"
+
+    def _message(self):
+        return AIMessage(content=self.text, response_metadata={"response_cache": "hit"})
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs):
+        return ChatResult(generations=[ChatGeneration(message=self._message())])
+
+    def _stream(self, messages, stop=None, run_manager=None, **kwargs):
+        for token in re.findall(r"\s*\S+", self.text):
+            chunk = ChatGenerationChunk(message=AIMessageChunk(content=token))
+            if run_manager:
+                run_manager.on_llm_new_token(chunk.text, chunk=chunk)
+            yield chunk
+        yield ChatGenerationChunk(message=AIMessageChunk(
+            content="", response_metadata={"response_cache": "hit"}
+        ))
+
+# -----------------------------
+# Store
+# -----------------------------
+
+class ResponseCache:
+    """SQLite-backed answer cache with a TTL and an LRU entry limit"""
+
+    def __init__(self, model, system_prompt, path=RESPONSE_CACHE_DB,
+                 ttl=RESPONSE_CACHE_TTL, max_entries=RESPONSE_CACHE_MAX_ENTRIES):
+        self.model = model
+        self.system_prompt = system_prompt
+        self.path = path
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self.stores = 0
+        self._conn = None
+        self._lock = threading.Lock()
+
+    def _connection(self):
+        """One connection, serialized by the lock; caller holds the lock"""
+        if self._conn is None:
+            self._conn = db.configure(sqlite3.connect(
+                self.path, timeout=db.DB_BUSY_TIMEOUT, check_same_thread=False
+            ))
+            self._conn.executescript(SCHEMA)
+        return self._conn
+
+    def key_for(self, question):
+        digest = hashlib.sha256()
+        for part in (normalize_question(question), self.system_prompt, self.model):
+            digest.update(part.encode("utf-8"))
+            digest.update(b"\0")
+        return digest.hexdigest()
+
+    def get(self, question):
+        """Cached answer text for a question, or None"""
+        key = self.key_for(question)
+        now = time.time()
+        try:
+            with self._lock:
+                conn = self._connection()
+                row = conn.execute(
+                    "SELECT answer FROM response_cache WHERE key = ? AND created_at > ?",
+                    (key, now - self.ttl),
+                ).fetchone()
+                if row is not None:
+                    with conn:
+                        conn.execute(
+                            "UPDATE response_cache SET hits = hits + 1, last_used = ? WHERE key = ?",
+                            (now, key),
+                        )
+                    self.hits += 1
+                else:
+                    self.misses += 1
+        except sqlite3.Error as e:
+            print(f"Error reading response cache: {e}")
+            return None
+        registry.inc("chatbot_response_cache_total", 1, "Response cache lookups",
+                     outcome="hit" if row is not None else "miss")
+        return row[0] if row is not None else None
+
+    def put(self, question, response):
+        """Store an answer if it is cacheable; evicts the least recently used"""
+        if not cacheable(response):
+            return False
+        now = time.time()
+        try:
+            with self._lock:
+                conn = self._connection()
+                with conn:
+                    conn.execute("""
+                        INSERT OR REPLACE INTO response_cache
+                            (key, model, question, answer, created_at, last_used, hits)
+                        VALUES (?, ?, ?, ?, ?, ?, 0)
+                    """, (self.key_for(question), self.model, question, response.content, now, now))
+                    conn.execute("""
+                        DELETE FROM response_cache WHERE key IN (
+                            SELECT key FROM response_cache ORDER BY last_used
+                            LIMIT max(0, (SELECT COUNT(*) FROM response_cache) - ?)
+                        )
+                    """, (self.max_entries,))
+                self.stores += 1
+        except sqlite3.Error as e:
+            print(f"Error writing response cache: {e}")
+            return False
+        return True
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "stores": self.stores,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+            }
+
+# -----------------------------
+# Admin
+# -----------------------------
+
+def purge(path=RESPONSE_CACHE_DB, ttl=RESPONSE_CACHE_TTL, expired_only=False):
+    """Delete every entry (or only expired ones); returns the number removed"""
+    conn = db.configure(sqlite3.connect(path, timeout=db.DB_BUSY_TIMEOUT))
+    try:
+        conn.executescript(SCHEMA)
+        with conn:
+            if expired_only:
+                removed = conn.execute(
+                    "DELETE FROM response_cache WHERE created_at <= ?", (time.time() - ttl,)
+                ).rowcount
+            else:
+                removed = conn.execute("DELETE FROM response_cache").rowcount
+        conn.execute("PRAGMA wal_checkpoint(TRUNCATE)").fetchall()
+        return removed
+    finally:
+        conn.close()
+
+def summary(path=RESPONSE_CACHE_DB):
+    conn = db.configure(sqlite3.connect(path, timeout=db.DB_BUSY_TIMEOUT))
+    try:
+        conn.executescript(SCHEMA)
+        entries, hits, chars = conn.execute(
+            "SELECT COUNT(*), COALESCE(SUM(hits), 0), COALESCE(SUM(LENGTH(answer)), 0) FROM response_cache"
+        ).fetchone()
+        top = conn.execute(
+            "SELECT hits, question FROM response_cache ORDER BY hits DESC LIMIT 10"
+        ).fetchall()
+    finally:
+        conn.close()
+    return {"entries": entries, "hits": hits, "answer_chars": chars, "top": top}
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Inspect or purge the LLM response cache")
+    parser.add_argument("--db", default=RESPONSE_CACHE_DB, help="cache database path")
+    parser.add_argument("--purge", action="store_true", help="delete cached answers")
+    parser.add_argument("--expired", action="store_true", help="with --purge: only expired entries")
+    parser.add_argument("--ttl", type=float, default=RESPONSE_CACHE_TTL, help="TTL in seconds for --expired")
+    parser.add_argument("--stats", action="store_true", help="print entry counts and top questions")
+    args = parser.parse_args(argv)
+
+    if args.purge:
+        removed = purge(args.db, args.ttl, args.expired)
+        print(f"Removed {removed} cached answers")
+    if args.stats or not args.purge:
+        report = summary(args.db)
+        print(f"{report['entries']} entries, {report['hits']} hits, {report['answer_chars']} answer chars")
+        for hits, question in report["top"]:
+            print(f"  {hits:6d}  {question[:80]}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,172 @@
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+
+from typing import Any, Literal
+
+from langchain_core.tools import BaseTool
+from pydantic import BaseModel, Field, PrivateAttr
+
+from cache import TTLCache
+
+# Result cache in front of DuckDuckGo. Near-identical queries from different
+# threads ("latest AI news", "Latest  AI news?") map to one key, concurrent
+# identical queries share a single upstream fetch, and results can optionally
+# be persisted to SQLite so they survive restarts.
+
+# Constants
+SEARCH_CACHE_TTL = float(os.getenv('SEARCH_CACHE_TTL', '900'))
+SEARCH_CACHE_SIZE = int(os.getenv('SEARCH_CACHE_SIZE', '512'))
+# Path of the on-disk cache; empty disables persistence
+SEARCH_CACHE_DB = os.getenv('SEARCH_CACHE_DB', '')
+
+def normalize_query(query):
+    """Case-fold, collapse whitespace and drop surrounding punctuation"""
+    query = re.sub(r"\s+", " ", str(query)).strip().lower()
+    return query.strip(" .,!?;:'\"")
+
+# -----------------------------
+# Cache
+# -----------------------------
+
+class SearchCache:
+    """In-memory TTL/LRU cache with optional write-through SQLite storage"""
+
+    def __init__(self, ttl=SEARCH_CACHE_TTL, maxsize=SEARCH_CACHE_SIZE, db_path=SEARCH_CACHE_DB):
+        self.ttl = ttl
+        self.memory = TTLCache(ttl=ttl, maxsize=maxsize)
+        self.db_path = db_path
+        self._conn = None
+        self._db_lock = threading.Lock()
+
+    def _db(self):
+        """Lazily opened connection to the on-disk cache, or None"""
+        if not self.db_path:
+            return None
+        if self._conn is None:
+            self._conn = sqlite3.connect(self.db_path, check_same_thread=False)
+            self._conn.execute("""
+                CREATE TABLE IF NOT EXISTS search_cache (
+                    key TEXT PRIMARY KEY,
+                    value TEXT,
+                    expires_at REAL
+                )
+            """)
+            self._conn.commit()
+        return self._conn
+
+    def _read_disk(self, key):
+        try:
+            with self._db_lock:
+                conn = self._db()
+                if conn is None:
+                    return None
+                row = conn.execute(
+                    "SELECT value FROM search_cache WHERE key = ? AND expires_at > ?",
+                    (key, time.time()),
+                ).fetchone()
+            return tuple(json.loads(row[0])) if row else None
+        except (sqlite3.Error, ValueError) as e:
+            print(f"Error reading search cache: {e}")
+            return None
+
+    def _write_disk(self, key, value):
+        try:
+            with self._db_lock:
+                conn = self._db()
+                if conn is None:
+                    return
+                conn.execute(
+                    "INSERT OR REPLACE INTO search_cache (key, value, expires_at) VALUES (?, ?, ?)",
+                    (key, json.dumps(value), time.time() + self.ttl),
+                )
+                conn.commit()
+        except (sqlite3.Error, TypeError) as e:
+            print(f"Error writing search cache: {e}")
+
+    def get_or_fetch(self, key, fetch):
+        """Cached value for key; misses check disk, then call fetch once"""
+        def load():
+            value = self._read_disk(key)
+            if value is None:
+                value = fetch()
+                self._write_disk(key, value)
+            return value
+        return self.memory.get_or_load(key, load)
+
+    def purge_expired(self):
+        """Delete expired rows from the on-disk cache"""
+        with self._db_lock:
+            conn = self._db()
+            if conn is None:
+                return 0
+            deleted = conn.execute(
+                "DELETE FROM search_cache WHERE expires_at <= ?", (time.time(),)
+            ).rowcount
+            conn.commit()
+            return deleted
+
+    def stats(self):
+        return self.memory.stats()
+
+search_cache = SearchCache()
+
+# -----------------------------
+# Tool
+# -----------------------------
+
+class SearchInput(BaseModel):
+    query: str = Field(description="search query to look up")
+
+class CachedDuckDuckGoSearchResults(BaseTool):
+    """DuckDuckGo results tool served from `search_cache`.
+
+    Same name, schema and output as DuckDuckGoSearchResults, so tool binding
+    and routing are unaffected, but langchain_community and the DuckDuckGo
+    client are only imported and built on the first search that misses the
+    cache.
+    """
+
+    name: str = "duckduckgo_results_json"
+    description: str = (
+        "A wrapper around Duck Duck Go Search. "
+        "Useful for when you need to answer questions about current events. "
+        "Input should be a search query."
+    )
+    args_schema: type[BaseModel] = SearchInput
+    response_format: Literal["content_and_artifact"] = "content_and_artifact"
+    region: str = "wt-wt"
+    backend: str = "text"
+    max_results: int = 4
+    output_format: Literal["string", "json", "list"] = "string"
+
+    _client: Any = PrivateAttr(default=None)
+    _client_lock: Any = PrivateAttr(default_factory=threading.Lock)
+
+    def _get_client(self):
+        if self._client is None:
+            with self._client_lock:
+                if self._client is None:
+                    from langchain_community.tools import DuckDuckGoSearchResults
+                    from langchain_community.utilities import DuckDuckGoSearchAPIWrapper
+                    self._client = DuckDuckGoSearchResults(
+                        api_wrapper=DuckDuckGoSearchAPIWrapper(region=self.region),
+                        backend=self.backend,
+                        num_results=self.max_results,
+                        output_format=self.output_format,
+                    )
+        return self._client
+
+    def _run(self, query, run_manager=None):
+        key = "|".join([
+            self.region,
+            self.backend,
+            str(self.max_results),
+            self.output_format,
+            normalize_query(query),
+        ])
+        fetch = lambda: self._get_client()._run(query)
+        return search_cache.get_or_fetch(key, fetch)
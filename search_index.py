@@ -0,0 +1,159 @@
+import re
+import sqlite3
+
+from thread_index import DISPLAY_TYPES
+
+# Full-text search over every thread's messages. message_search is an FTS5
+# index over the human/AI rows of thread_messages, kept current by triggers,
+# so checkpoint writes (sync or async) update it with no extra code and a
+# query never decodes a checkpoint.
+#
+# Each FTS row id packs the thread and the message position:
+#     rowid = search_threads.id * MAX_MESSAGES + idx
+# search_threads gives every thread a stable integer id (thread_index's
+# implicit rowid can be renumbered by VACUUM), so a message row is updated or
+# removed by rowid and a deleted thread is dropped with one rowid range.
+
+# Constants
+MAX_MESSAGES = 1 << 20
+SEARCH_PAGE_SIZE = 20
+SNIPPET_TOKENS = 12
+# Matches fetched per requested thread before keeping the best hit of each
+SEARCH_OVERFETCH = 5
+
+_display = ", ".join(f"'{t}'" for t in DISPLAY_TYPES)
+
+# INSERT OR REPLACE on thread_messages does not fire DELETE triggers, so the
+# insert trigger replaces the FTS row itself. It also overrides any OR IGNORE
+# inside the trigger (that would renumber the thread), hence NOT EXISTS.
+SEARCH_SCHEMA = f"""
+CREATE TABLE IF NOT EXISTS search_threads (
+    id INTEGER PRIMARY KEY,
+    thread_id TEXT NOT NULL UNIQUE
+);
+CREATE VIRTUAL TABLE IF NOT EXISTS message_search USING fts5(
+    content, tokenize = 'porter unicode61', prefix = '2 3'
+);
+CREATE TRIGGER IF NOT EXISTS message_search_insert
+AFTER INSERT ON thread_messages
+BEGIN
+    INSERT INTO search_threads (thread_id) SELECT new.thread_id
+    WHERE NOT EXISTS (SELECT 1 FROM search_threads WHERE thread_id = new.thread_id);
+    DELETE FROM message_search WHERE rowid =
+        (SELECT id FROM search_threads WHERE thread_id = new.thread_id) * {MAX_MESSAGES} + new.idx;
+    INSERT INTO message_search (rowid, content)
+    SELECT id * {MAX_MESSAGES} + new.idx, new.content FROM search_threads
+    WHERE thread_id = new.thread_id
+      AND new.type IN ({_display}) AND new.content != '' AND new.idx < {MAX_MESSAGES};
+END;
+CREATE TRIGGER IF NOT EXISTS message_search_delete
+AFTER DELETE ON thread_messages
+BEGIN
+    DELETE FROM message_search WHERE rowid =
+        (SELECT id FROM search_threads WHERE thread_id = old.thread_id) * {MAX_MESSAGES} + old.idx;
+END;
+CREATE TRIGGER IF NOT EXISTS message_search_thread_delete
+AFTER DELETE ON thread_index
+BEGIN
+    DELETE FROM message_search WHERE rowid >=
+        (SELECT id FROM search_threads WHERE thread_id = old.thread_id) * {MAX_MESSAGES}
+      AND rowid <
+        (SELECT id + 1 FROM search_threads WHERE thread_id = old.thread_id) * {MAX_MESSAGES};
+    DELETE FROM search_threads WHERE thread_id = old.thread_id;
+END;
+"""
+
+# Index the messages written before the search index existed
+BACKFILL_SQL = f"""
+INSERT OR IGNORE INTO search_threads (thread_id)
+SELECT DISTINCT thread_id FROM thread_messages;
+INSERT INTO message_search (rowid, content)
+SELECT s.id * {MAX_MESSAGES} + m.idx, m.content
+FROM thread_messages AS m JOIN search_threads AS s ON s.thread_id = m.thread_id
+WHERE m.type IN ({_display}) AND m.content != '' AND m.idx < {MAX_MESSAGES};
+"""
+
+SEARCH_INDEX_EXISTS_SQL = "SELECT 1 FROM sqlite_master WHERE name = 'message_search'"
+# Created and backfilled in one transaction so a crash cannot leave it half built
+SEARCH_INDEX_SCRIPT = f"BEGIN IMMEDIATE;\n{SEARCH_SCHEMA}\n{BACKFILL_SQL}\nCOMMIT;"
+
+def ensure_search_index(conn):
+    """Create and backfill the search index if missing; False without FTS5"""
+    if conn.execute(SEARCH_INDEX_EXISTS_SQL).fetchone():
+        return True
+    try:
+        conn.executescript(SEARCH_INDEX_SCRIPT)
+    except sqlite3.OperationalError as e:
+        if conn.in_transaction:
+            conn.rollback()
+        print(f"Full-text search disabled: {e}")
+        return False
+    return True
+
+# -----------------------------
+# Queries
+# -----------------------------
+
+def match_expression(query):
+    """FTS5 query for free text: every word must match, the last as a prefix.
+
+    Words are quoted so user input can never be parsed as FTS5 syntax.
+    """
+    words = re.findall(r"\w+", query or "")
+    if not words:
+        return None
+    terms = [f'"{w}"' for w in words]
+    terms[-1] += "*"
+    return " ".join(terms)
+
+def search_threads(conn, query, limit=SEARCH_PAGE_SIZE):
+    """Threads whose messages match `query`, best first.
+
+    Returns dicts with thread_id, title, pinned, last, idx and rank (bm25,
+    lower is better) of the best matching message, and a snippet with the
+    matched words in **bold**.
+    """
+    expression = match_expression(query)
+    if expression is None:
+        return []
+    rows = conn.execute(f"""
+        SELECT rowid, rank, snippet(message_search, 0, '**', '**', '…', {SNIPPET_TOKENS})
+        FROM message_search
+        WHERE message_search MATCH ?
+        ORDER BY rank
+        LIMIT ?
+    """, (expression, limit * SEARCH_OVERFETCH)).fetchall()
+
+    # Keep the best-ranked message of each thread
+    best = {}
+    for rowid, rank, snippet in rows:
+        thread_key = rowid // MAX_MESSAGES
+        if thread_key not in best:
+            best[thread_key] = (rowid % MAX_MESSAGES, rank, snippet)
+            if len(best) == limit:
+                break
+    if not best:
+        return []
+
+    placeholders = ", ".join("?" for _ in best)
+    threads = {row[0]: row[1:] for row in conn.execute(f"""
+        SELECT s.id, s.thread_id, t.title, t.pinned, t.last_active
+        FROM search_threads AS s JOIN thread_index AS t ON t.thread_id = s.thread_id
+        WHERE s.id IN ({placeholders})
+    """, list(best))}
+
+    results = []
+    for thread_key, (idx, rank, snippet) in best.items():
+        if thread_key not in threads:
+            continue
+        thread_id, title, pinned, last_active = threads[thread_key]
+        results.append({
+            "thread_id": thread_id,
+            "title": title or "New Chat",
+            "pinned": bool(pinned),
+            "last": last_active,
+            "idx": idx,
+            "rank": rank,
+            "snippet": snippet,
+        })
+    return results
@@ -0,0 +1,292 @@
+import asyncio
+import json
+import os
+import time
+from contextlib import asynccontextmanager
+
+from starlette.applications import Starlette
+from starlette.concurrency import run_in_threadpool
+from starlette.responses import JSONResponse, PlainTextResponse, StreamingResponse
+from starlette.routing import Route
+
+import chat_store
+from cancellation import active_turns
+from chatbot_backend_async import aclose, astream, get_async_workflow
+from metrics import registry
+from search_index import SEARCH_PAGE_SIZE
+from stream_render import answer_text, tool_event
+
+# Headless HTTP front end for the async workflow: thread CRUD on the same
+# tables as the Streamlit app (via chat_store) and a chat endpoint streaming
+# the answer as Server-Sent Events.
+#
+# Admission control: at most SERVER_MAX_TURNS turns run at once and at most
+# SERVER_MAX_QUEUED wait for a slot; beyond that, or after SERVER_QUEUE_TIMEOUT
+# seconds of waiting, a turn is refused with 503 + Retry-After. A thread runs
+# one turn at a time (409 otherwise). On shutdown new turns are refused and
+# running ones get SERVER_SHUTDOWN_GRACE seconds to finish.
+#
+# Usage:
+#     uvicorn server:app --port 8000
+#     CHATBOT_FAKE_LLM=0.2 uvicorn server:app --port 8000   # stubbed model for load tests
+#
+#     curl -N -X POST localhost:8000/threads/<id>/chat -d '{"message": "hi"}'
+#     curl -X POST localhost:8000/threads/<id>/cancel      # stop that turn
+#     curl 'localhost:8000/search?q=state+graph'
+
+# Constants
+SERVER_MAX_TURNS = int(os.getenv('SERVER_MAX_TURNS', '16'))
+SERVER_MAX_QUEUED = int(os.getenv('SERVER_MAX_QUEUED', '64'))
+SERVER_QUEUE_TIMEOUT = float(os.getenv('SERVER_QUEUE_TIMEOUT', '10'))
+SERVER_SHUTDOWN_GRACE = float(os.getenv('SERVER_SHUTDOWN_GRACE', '30'))
+MESSAGES_PAGE_SIZE = 50
+MAX_MESSAGE_CHARS = 20000
+
+def error(status, message, **headers):
+    return JSONResponse({"error": message}, status_code=status, headers=headers or None)
+
+def sse(event, data):
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+# -----------------------------
+# Admission control
+# -----------------------------
+
+class Busy(Exception):
+    """A turn that cannot be admitted; `status` is the HTTP status to return"""
+
+    def __init__(self, message, status=503):
+        super().__init__(message)
+        self.status = status
+
+class TurnLimiter:
+    """Bounded concurrency with a bounded wait queue and one turn per thread"""
+
+    def __init__(self, max_turns=SERVER_MAX_TURNS, max_queued=SERVER_MAX_QUEUED,
+                 queue_timeout=SERVER_QUEUE_TIMEOUT):
+        self.max_queued = max_queued
+        self.queue_timeout = queue_timeout
+        self.semaphore = asyncio.Semaphore(max_turns)
+        self.queued = 0
+        self.running = 0
+        self.active_threads = set()
+        self.draining = False
+        self.idle = asyncio.Event()
+        self.idle.set()
+
+    async def acquire(self, thread_id):
+        if self.draining:
+            raise Busy("Server is shutting down")
+        if thread_id in self.active_threads:
+            raise Busy("A turn is already running for this thread", status=409)
+        if self.queued >= self.max_queued:
+            registry.inc("chatbot_server_rejected_total", 1, "Turns refused", reason="queue_full")
+            raise Busy("Too many queued requests")
+
+        self.active_threads.add(thread_id)
+        self.queued += 1
+        started = time.perf_counter()
+        try:
+            await asyncio.wait_for(self.semaphore.acquire(), self.queue_timeout)
+        except asyncio.TimeoutError:
+            self.active_threads.discard(thread_id)
+            registry.inc("chatbot_server_rejected_total", 1, "Turns refused", reason="queue_timeout")
+            raise Busy("Timed out waiting for a free slot")
+        except BaseException:
+            # Cancelled while queued (client gone) or failed: the turn never ran
+            self.active_threads.discard(thread_id)
+            raise
+        finally:
+            self.queued -= 1
+        registry.observe("chatbot_server_queue_seconds", time.perf_counter() - started,
+                         "Time a turn waited for a slot")
+        self.running += 1
+        self.idle.clear()
+
+    def release(self, thread_id):
+        self.active_threads.discard(thread_id)
+        self.running -= 1
+        self.semaphore.release()
+        if not self.running:
+            self.idle.set()
+
+    async def drain(self, timeout):
+        """Refuse new turns and wait for running ones to finish"""
+        self.draining = True
+        try:
+            await asyncio.wait_for(self.idle.wait(), timeout)
+        except asyncio.TimeoutError:
+            print(f"Shutting down with {self.running} turns still running")
+
+    def stats(self):
+        return {"running": self.running, "queued": self.queued}
+
+limiter = TurnLimiter()
+registry.register_collector("chatbot_server", limiter.stats)
+
+class TurnStream(StreamingResponse):
+    """SSE response that frees its turn slot however the stream ends"""
+
+    def __init__(self, content, thread_id):
+        super().__init__(content, media_type="text/event-stream",
+                         headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+        self.thread_id = thread_id
+
+    async def __call__(self, scope, receive, send):
+        try:
+            await super().__call__(scope, receive, send)
+        finally:
+            limiter.release(self.thread_id)
+
+# -----------------------------
+# Threads
+# -----------------------------
+
+async def list_threads(request):
+    threads = await run_in_threadpool(chat_store.load_threads_from_db)
+    return JSONResponse([{"thread_id": tid, **data} for tid, data in threads.items()])
+
+async def create_thread(request):
+    body = await read_json(request)
+    thread = await run_in_threadpool(chat_store.create_thread, str(body.get("title") or "New Chat"))
+    if thread is None:
+        return error(500, "Could not create thread")
+    return JSONResponse(thread, status_code=201)
+
+async def update_thread(request):
+    thread_id = request.path_params["thread_id"]
+    body = await read_json(request)
+    if "title" in body:
+        title = str(body["title"]).strip()
+        if not title or not await run_in_threadpool(chat_store.save_thread_title, thread_id, title):
+            return error(400, "Could not rename thread")
+    if "pinned" in body:
+        if not await run_in_threadpool(chat_store.save_thread_pin, thread_id, bool(body["pinned"])):
+            return error(400, "Could not update pin state")
+    return JSONResponse({"thread_id": thread_id, **{k: body[k] for k in ("title", "pinned") if k in body}})
+
+async def delete_thread(request):
+    thread_id = request.path_params["thread_id"]
+    if thread_id in limiter.active_threads:
+        return error(409, "A turn is running for this thread")
+    if not await run_in_threadpool(chat_store.delete_thread_from_db, thread_id):
+        return error(500, "Could not delete thread")
+    return JSONResponse({"deleted": thread_id})
+
+async def thread_messages(request):
+    thread_id = request.path_params["thread_id"]
+    try:
+        limit = min(int(request.query_params.get("limit", MESSAGES_PAGE_SIZE)), 500)
+        before = request.query_params.get("before")
+        before = int(before) if before is not None else None
+    except ValueError:
+        return error(400, "limit and before must be integers")
+    rows, has_more = await run_in_threadpool(chat_store.load_thread_messages, thread_id, limit, before)
+    return JSONResponse({
+        "messages": [{"idx": idx, "type": t, "content": c} for idx, t, c in rows],
+        "has_more": has_more,
+    })
+
+async def search(request):
+    query = request.query_params.get("q", "")
+    try:
+        limit = min(int(request.query_params.get("limit", SEARCH_PAGE_SIZE)), 100)
+    except ValueError:
+        return error(400, "limit must be an integer")
+    results = await run_in_threadpool(chat_store.search_chats, query, limit)
+    return JSONResponse({"results": results})
+
+async def read_json(request):
+    try:
+        body = await request.json()
+    except ValueError:
+        return {}
+    return body if isinstance(body, dict) else {}
+
+# -----------------------------
+# Chat
+# -----------------------------
+
+async def chat_events(thread_id, message):
+    """SSE events for one turn: token*, tool*, then done or error"""
+    started = time.perf_counter()
+    first_token = None
+    try:
+        async for chunk, metadata in astream(message, thread_id):
+            text = answer_text(chunk, metadata)
+            if text:
+                if first_token is None:
+                    first_token = time.perf_counter() - started
+                    registry.observe("chatbot_stream_ttft_seconds", first_token,
+                                     "Time from request to first answer token")
+                yield sse("token", {"text": text})
+            line = tool_event(chunk, metadata)
+            if line is not None:
+                yield sse("tool", {"text": line})
+    except Exception as e:
+        print(f"Error generating response: {e}")
+        yield sse("error", {"error": str(e)})
+        return
+    yield sse("done", {
+        "ttft_seconds": first_token,
+        "seconds": time.perf_counter() - started,
+    })
+
+async def chat(request):
+    thread_id = request.path_params["thread_id"]
+    body = await read_json(request)
+    message = body.get("message")
+    if not isinstance(message, str) or not message.strip():
+        return error(400, "message is required")
+    if len(message) > MAX_MESSAGE_CHARS:
+        return error(413, "message is too long")
+
+    try:
+        await limiter.acquire(thread_id)
+    except Busy as e:
+        headers = {"Retry-After": "1"} if e.status == 503 else {}
+        return error(e.status, str(e), **headers)
+    return TurnStream(chat_events(thread_id, message), thread_id)
+
+async def cancel_turn(request):
+    """Stop the thread's running turn (its stream ends with an error event)"""
+    thread_id = request.path_params["thread_id"]
+    if not active_turns.cancel(thread_id):
+        return error(404, "No turn is running for this thread")
+    return JSONResponse({"thread_id": thread_id, "cancelled": True})
+
+# -----------------------------
+# Service
+# -----------------------------
+
+async def healthz(request):
+    status = 503 if limiter.draining else 200
+    return JSONResponse({"status": "draining" if limiter.draining else "ok", **limiter.stats()},
+                        status_code=status)
+
+async def metrics(request):
+    return PlainTextResponse(registry.render_prometheus(), media_type="text/plain; version=0.0.4")
+
+@asynccontextmanager
+async def lifespan(app):
+    # Build the graph before the first request instead of during it
+    await get_async_workflow()
+    yield
+    await limiter.drain(SERVER_SHUTDOWN_GRACE)
+    await aclose()
+
+app = Starlette(
+    routes=[
+        Route("/threads", list_threads, methods=["GET"]),
+        Route("/threads", create_thread, methods=["POST"]),
+        Route("/threads/{thread_id}", update_thread, methods=["PATCH"]),
+        Route("/threads/{thread_id}", delete_thread, methods=["DELETE"]),
+        Route("/threads/{thread_id}/messages", thread_messages, methods=["GET"]),
+        Route("/threads/{thread_id}/chat", chat, methods=["POST"]),
+        Route("/threads/{thread_id}/cancel", cancel_turn, methods=["POST"]),
+        Route("/search", search, methods=["GET"]),
+        Route("/healthz", healthz, methods=["GET"]),
+        Route("/metrics", metrics, methods=["GET"]),
+    ],
+    lifespan=lifespan,
+)
@@ -0,0 +1,253 @@
+import asyncio
+import os
+import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from fast_path import TICKER, match_quote
+from metrics import registry
+from quotes import parse_symbols, quote_cache
+from search_cache import normalize_query
+
+# Speculative tool prefetch. Messages that obviously need a tool ("TSLA
+# stock today?", "latest AI news") normally cost chat_node -> tools ->
+# chat_node strictly in sequence. With SPECULATIVE_TOOLS=1 a cheap local
+# classifier guesses the `stock` / search call from the user's message and
+# starts it alongside the turn's first chat_node call:
+#
+#   - if the model asks for that tool with matching arguments (symbols as a
+#     set, search queries ignoring case, punctuation and leading phrasing
+#     such as "what's the" / "tell me"), the tools node takes the prefetched
+#     result instead of calling the tool again;
+#   - otherwise the prefetch is discarded once the model has answered.
+#
+# Stock calls are only guessed from a cashtag ("$NVDA") or the fast path's
+# ticker pattern ("AAPL price"); other capitalised words next to a stock cue
+# ("price of TSLA today") only when their quotes are already cached, so
+# "buy shares in IT or HR" never costs a lookup.
+#
+# Hits, misses and the tool latency hidden behind the LLM call are exported
+# as metrics. A miss only costs one wasted (usually cached) lookup.
+
+# Constants
+SPECULATION_ENABLED = os.getenv('SPECULATIVE_TOOLS', '') not in ('', '0', 'false')
+# Worker threads for sync prefetches, separate from the tool node's pool so
+# speculative work never delays real tool calls
+SPECULATION_MAX_WORKERS = int(os.getenv('SPECULATION_MAX_WORKERS', '4'))
+# Prefetches of turns that never reached the tools node are dropped after this
+SPECULATION_MAX_AGE = 300
+SPECULATIVE_CALL_ID = "speculative"
+# More symbols than this rarely come back as one matching call
+MAX_SPECULATIVE_SYMBOLS = 3
+
+SEARCH_TOOL = "duckduckgo_results_json"
+
+# Capitalised words that are not worth a quote lookup
+NOT_TICKERS = {
+    "A", "I", "AI", "AM", "PM", "OK", "US", "USA", "UK", "EU", "UN",
+    "CEO", "CFO", "CTO", "IPO", "ETF", "GDP", "API", "USD", "EUR", "FAQ",
+}
+TICKER_RE = re.compile(r"(?<![\w$.])" + TICKER + r"(?![\w.])")
+CASHTAG_RE = re.compile(r"\$([A-Z]{1,5}(?:\.[A-Z])?)(?![\w.])")
+STOCK_CUE_RE = re.compile(r"\b(?:stocks?|shares?|prices?|quotes?|trading|ticker)\b", re.IGNORECASE)
+NEWS_RE = re.compile(
+    r"\b(?:latest|recent|breaking|today'?s|current|this week'?s)\s+(?:[\w-]+\s+){0,3}?"
+    r"(?:news|headlines|updates?)\b"
+    r"|\b(?:news|headlines)\s+(?:about|on|from|for)\b",
+    re.IGNORECASE,
+)
+# Phrasing the model drops when it turns a question into a search query
+QUERY_PREFIX_RE = re.compile(
+    r"^(?:(?:please|can you|could you|tell me|show me|give me|find|search for|search|look up"
+    r"|what(?:'s| is| are)|any|the)\s+)+"
+)
+
+def match_tickers(text):
+    """Symbols a stock question mentions ("$NVDA", "AAPL price"), else [].
+
+    Capitalised words next to a stock cue ("TSLA stock today?") count only
+    if every one of them already has a cached quote.
+    """
+    symbol = match_quote(text)
+    if symbol:
+        return [symbol]
+    symbols = parse_symbols(CASHTAG_RE.findall(text))
+    if not symbols and STOCK_CUE_RE.search(text):
+        symbols = parse_symbols([s for s in TICKER_RE.findall(text) if s not in NOT_TICKERS])
+        if not all(symbol in quote_cache for symbol in symbols):
+            return []
+    return symbols if len(symbols) <= MAX_SPECULATIVE_SYMBOLS else []
+
+def search_key(query):
+    """Normalised search query: "What's the latest AI news?" -> "latest ai news\""""
+    return QUERY_PREFIX_RE.sub("", normalize_query(query))
+
+def match_news(text):
+    """Likely search query for a "latest news"-style request, else None"""
+    if not NEWS_RE.search(text):
+        return None
+    return search_key(text) or None
+
+def predict_tool_calls(text):
+    """[(tool_name, args)] the model is likely to request for a user message"""
+    predictions = []
+    symbols = match_tickers(text)
+    if symbols:
+        predictions.append(("stock", {"symbols": ", ".join(symbols)}))
+    query = match_news(text)
+    if query:
+        predictions.append((SEARCH_TOOL, {"query": query}))
+    return predictions
+
+# Argument normalisation used to decide whether a tool call matches a prefetch
+ARG_KEYS = {
+    "symbols": lambda value: frozenset(parse_symbols(value)),
+    "query": search_key,
+}
+
+def call_key(name, args):
+    """Hashable identity of a tool call, insensitive to formatting differences"""
+    return name, tuple(sorted(
+        ((arg, ARG_KEYS.get(arg, lambda value: value)(value)) for arg, value in args.items()),
+        key=lambda item: item[0],
+    ))
+
+# -----------------------------
+# Prefetcher
+# -----------------------------
+
+class _Speculation:
+    __slots__ = ("name", "key", "future", "started")
+
+    def __init__(self, name, key, future, started):
+        self.name = name
+        self.key = key
+        self.future = future
+        self.started = started
+
+class SpeculativePrefetcher:
+    """Starts predicted tool calls next to chat_node and hands them to the tools node"""
+
+    def __init__(self, tools, max_workers=SPECULATION_MAX_WORKERS):
+        self.tools_by_name = {t.name: t for t in tools}
+        self.max_workers = max_workers
+        self._pool = None
+        self._pending = {}   # thread_id -> [_Speculation]
+        self._lock = threading.Lock()
+        self.counts = {"started": 0, "hits": 0, "misses": 0, "saved_seconds": 0.0}
+
+    def _thread_id(self, config):
+        thread_id = ((config or {}).get("configurable") or {}).get("thread_id")
+        return None if thread_id is None else str(thread_id)
+
+    def _predict(self, state, config):
+        """Predicted calls for the turn's first chat_node call, else []"""
+        last = state['messages'][-1]
+        if last.type != "human" or not isinstance(last.content, str) or self._thread_id(config) is None:
+            return []
+        return [(name, args) for name, args in predict_tool_calls(last.content) if name in self.tools_by_name]
+
+    def _tool_call(self, name, args):
+        return {"name": name, "args": args, "id": SPECULATIVE_CALL_ID, "type": "tool_call"}
+
+    def _run(self, name, args):
+        """Tool call in a worker thread; returns (ToolMessage, finished_at)"""
+        result = self.tools_by_name[name].invoke(self._tool_call(name, args))
+        return result, time.perf_counter()
+
+    async def _arun(self, name, args):
+        result = await self.tools_by_name[name].ainvoke(self._tool_call(name, args))
+        return result, time.perf_counter()
+
+    def start(self, state, config):
+        """Sync build: start the predicted calls on the prefetch pool"""
+        predictions = self._predict(state, config)
+        if not predictions:
+            return
+        if self._pool is None:
+            with self._lock:
+                if self._pool is None:
+                    self._pool = ThreadPoolExecutor(max_workers=self.max_workers,
+                                                    thread_name_prefix="speculative-tool")
+        self._track(config, [
+            _Speculation(name, call_key(name, args), self._pool.submit(self._run, name, args),
+                         time.perf_counter())
+            for name, args in predictions
+        ])
+
+    def astart(self, state, config):
+        """Async build: start the predicted calls as tasks on the running loop"""
+        predictions = self._predict(state, config)
+        if not predictions:
+            return
+        self._track(config, [
+            _Speculation(name, call_key(name, args), asyncio.ensure_future(self._arun(name, args)),
+                         time.perf_counter())
+            for name, args in predictions
+        ])
+
+    def _track(self, config, speculations):
+        thread_id = self._thread_id(config)
+        stale_before = time.perf_counter() - SPECULATION_MAX_AGE
+        with self._lock:
+            dropped = self._pending.pop(thread_id, [])
+            for key in [key for key, pending in self._pending.items() if pending[0].started < stale_before]:
+                dropped.extend(self._pending.pop(key))
+            self._pending[thread_id] = speculations
+            self.counts["started"] += len(speculations)
+        self._drop(dropped)
+
+    def claim(self, config, calls):
+        """Prefetch matching each tool call (or None); the rest are discarded"""
+        with self._lock:
+            pending = self._pending.pop(self._thread_id(config), [])
+        claimed = []
+        for call in calls:
+            key = call_key(call["name"], call.get("args") or {})
+            match = next((s for s in pending if s.key == key), None)
+            if match is not None:
+                pending.remove(match)
+                self._count(match, "hit")
+            claimed.append(match)
+        self._drop(pending)
+        return claimed
+
+    def discard(self, config):
+        """Drop a turn's prefetches, e.g. when the model answered without tools"""
+        with self._lock:
+            pending = self._pending.pop(self._thread_id(config), [])
+        self._drop(pending)
+
+    def use(self, speculation, call, result, finished, tool_started):
+        """(ToolMessage for `call`, wait in the tools node) from a prefetched result"""
+        duration = finished - speculation.started
+        saved = max(0.0, min(duration, tool_started - speculation.started))
+        with self._lock:
+            self.counts["saved_seconds"] += saved
+        registry.observe("chatbot_speculation_saved_seconds", saved,
+                         "Tool latency hidden behind the first LLM call", tool=speculation.name)
+        return result.model_copy(update={"tool_call_id": call["id"]}), max(0.0, finished - tool_started)
+
+    def _drop(self, speculations):
+        for speculation in speculations:
+            self._count(speculation, "miss")
+            future = speculation.future
+            if not future.cancel() and future.done() and not future.cancelled():
+                # Nobody will read it; retrieving it keeps asyncio from warning
+                future.exception()
+
+    def _count(self, speculation, outcome):
+        with self._lock:
+            self.counts["hits" if outcome == "hit" else "misses"] += 1
+        registry.inc("chatbot_speculative_tool_calls_total", 1,
+                     "Speculative tool prefetches by outcome", tool=speculation.name, outcome=outcome)
+
+    def stats(self):
+        with self._lock:
+            decided = self.counts["hits"] + self.counts["misses"]
+            return {
+                **self.counts,
+                "pending": sum(len(pending) for pending in self._pending.values()),
+                "hit_rate": self.counts["hits"] / decided if decided else 0.0,
+            }
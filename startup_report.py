@@ -0,0 +1,126 @@
+import argparse
+import json
+import os
+import sqlite3
+import subprocess
+import sys
+import time
+import uuid
+
+# Startup budget report: how long a fresh process takes to import the backend,
+# build the workflow and stream the first token of a turn, plus the slowest
+# imports from `python -X importtime`. Every run measures a cold child process,
+# since that is what a new Streamlit worker pays.
+#
+# Usage (from the repository root):
+#     python startup_report.py              # real Gemini model, chatbot.db
+#     python startup_report.py --fake       # offline: fake model, in-memory db
+#     python startup_report.py --output startup.json
+
+DEFAULT_PROMPT = "Explain how a state graph works"
+
+def parse_importtime(stderr, top):
+    """Slowest modules by self time from `-X importtime` output"""
+    modules = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:"):
+            continue
+        try:
+            self_us, cumulative_us, name = line[len("import time:"):].split("|")
+            modules.append({
+                "module": name.strip(),
+                "self_ms": int(self_us) / 1000,
+                "cumulative_ms": int(cumulative_us) / 1000,
+            })
+        except ValueError:
+            continue  # header line
+    modules.sort(key=lambda m: m["self_ms"], reverse=True)
+    return modules[:top]
+
+# -----------------------------
+# Child process
+# -----------------------------
+
+def measure(fake, prompt):
+    """Phase timings of one cold start, in seconds"""
+    report = {}
+
+    started = time.perf_counter()
+    import chatbot_backend_fixed
+    from langchain_core.messages import HumanMessage
+    report["import_seconds"] = time.perf_counter() - started
+
+    started = time.perf_counter()
+    if fake:
+        from benchmarks import fakes
+        from benchmarks.run import build_offline_workflow
+        conn = sqlite3.connect(":memory:", check_same_thread=False)
+        workflow = build_offline_workflow(conn, fakes.FakeChatModel())
+    else:
+        workflow = chatbot_backend_fixed.get_workflow()
+    report["build_seconds"] = time.perf_counter() - started
+
+    thread_id = f"startup-report-{uuid.uuid4()}"
+    first_token = None
+    started = time.perf_counter()
+    for chunk, metadata in workflow.stream(
+        {"messages": [HumanMessage(content=prompt)]},
+        config={"configurable": {"thread_id": thread_id}},
+        stream_mode="messages",
+    ):
+        if first_token is None and chunk.content and metadata.get("langgraph_node") == "chat_node":
+            first_token = time.perf_counter() - started
+    report["first_token_seconds"] = first_token
+    report["turn_seconds"] = time.perf_counter() - started
+
+    if not fake:
+        # Keep the measurement thread out of the sidebar
+        from chat_store import delete_thread_from_db
+        delete_thread_from_db(thread_id)
+    return report
+
+# -----------------------------
+# Report
+# -----------------------------
+
+def run_child(fake, prompt):
+    command = [sys.executable, "-X", "importtime", os.path.abspath(__file__), "--child", "--prompt", prompt]
+    if fake:
+        command.append("--fake")
+    started = time.perf_counter()
+    done = subprocess.run(command, capture_output=True, text=True, cwd=os.path.dirname(os.path.abspath(__file__)))
+    elapsed = time.perf_counter() - started
+    if done.returncode != 0:
+        raise RuntimeError(done.stderr.strip().splitlines()[-1] if done.stderr.strip() else "child failed")
+    return json.loads(done.stdout.strip().splitlines()[-1]), done.stderr, elapsed
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Import-time and first-token latency report")
+    parser.add_argument("--fake", action="store_true", help="use the offline fake model")
+    parser.add_argument("--prompt", default=DEFAULT_PROMPT, help="first user message")
+    parser.add_argument("--top", type=int, default=15, help="slowest imports to list")
+    parser.add_argument("--output", default=None, help="write JSON report here")
+    parser.add_argument("--child", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    if args.child:
+        print(json.dumps(measure(args.fake, args.prompt)))
+        return
+
+    phases, importtime, process_seconds = run_child(args.fake, args.prompt)
+    report = {
+        "mode": "fake" if args.fake else "gemini",
+        "process_seconds": process_seconds,
+        **phases,
+        "slowest_imports": parse_importtime(importtime, args.top),
+    }
+
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(text)
+    else:
+        print(text)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,392 @@
+import abc
+import argparse
+import glob
+import heapq
+import importlib
+import itertools
+import json
+import os
+import re
+import sqlite3
+import threading
+import zlib
+from pathlib import Path
+
+from langgraph.checkpoint.base import BaseCheckpointSaver
+
+import db
+from db import DB_BUSY_TIMEOUT, DB_PATH, PRAGMAS, THREAD_TABLES, get_pool
+from thread_index import backfill_thread_index
+
+# Where checkpoints and thread metadata live. Everything about a thread (its
+# checkpoints, writes, index row, messages, title and pin) is stored in one
+# shard chosen by a stable hash of thread_id, so app processes writing
+# different threads mostly hit different SQLite files instead of queueing on
+# a single writer lock. Listings (sidebar, search) fan out to every shard and
+# merge the results.
+#
+# DB_SHARDS=1 (the default) keeps the single chatbot.db. With N > 1 the files
+# are chatbot-00-of-N.db ... ; the count is part of the name, so changing it
+# never misroutes threads. Instead the app refuses to start while files of
+# another layout still hold threads; move them with the app stopped:
+#
+#     python storage.py                  # show the layouts on disk
+#     python storage.py --reshard        # move every thread into DB_SHARDS files
+#
+# Only SQLite is supported. CHATBOT_STORAGE ("sqlite", or "module:factory"
+# for another Storage subclass) can change how the SQLite files are laid
+# out and opened, but not the database engine: the thread metadata
+# (chat_store.py, thread_index.py, search_index.py) is SQLite SQL, including
+# FTS5 MATCH, run on the sqlite3 connections of the backend's pools.
+
+# Constants
+DB_SHARDS = max(1, int(os.getenv('DB_SHARDS', '1')))
+CHATBOT_STORAGE = os.getenv('CHATBOT_STORAGE', 'sqlite')
+
+def shard_paths(db_path=DB_PATH, shards=DB_SHARDS):
+    """Database files of a shard layout, in shard order"""
+    if shards <= 1:
+        return [db_path]
+    root, ext = os.path.splitext(db_path)
+    return [f"{root}-{i:02d}-of-{shards:02d}{ext}" for i in range(shards)]
+
+def shard_index(thread_id, shards):
+    """Shard of a thread; crc32 is stable across processes, unlike hash()"""
+    return zlib.crc32(str(thread_id).encode("utf-8")) % shards
+
+def _thread_id(config):
+    return config["configurable"]["thread_id"]
+
+def _checkpoint_order(checkpoint_tuple):
+    # Checkpoint ids are time-ordered (uuid6), like SqliteSaver's own ORDER BY
+    return checkpoint_tuple.config["configurable"]["checkpoint_id"]
+
+# -----------------------------
+# Checkpointer
+# -----------------------------
+
+class ShardedSaver(BaseCheckpointSaver):
+    """Checkpointer over one saver per shard.
+
+    Thread-scoped calls go to the thread's shard; list() without a thread
+    merges every shard newest first.
+    """
+
+    def __init__(self, shards):
+        super().__init__(serde=shards[0].serde)
+        self.shards = list(shards)
+
+    def shard(self, thread_id):
+        return self.shards[shard_index(thread_id, len(self.shards))]
+
+    @property
+    def config_specs(self):
+        return self.shards[0].config_specs
+
+    def with_allowlist(self, extra_allowlist):
+        return ShardedSaver([saver.with_allowlist(extra_allowlist) for saver in self.shards])
+
+    def get_next_version(self, current, channel):
+        return self.shards[0].get_next_version(current, channel)
+
+    # Sync
+
+    def get_tuple(self, config):
+        return self.shard(_thread_id(config)).get_tuple(config)
+
+    def list(self, config, *, filter=None, before=None, limit=None):
+        if config and config.get("configurable", {}).get("thread_id") is not None:
+            yield from self.shard(_thread_id(config)).list(
+                config, filter=filter, before=before, limit=limit
+            )
+            return
+        merged = heapq.merge(
+            *(saver.list(config, filter=filter, before=before, limit=limit) for saver in self.shards),
+            key=_checkpoint_order, reverse=True,
+        )
+        yield from itertools.islice(merged, limit)
+
+    def put(self, config, checkpoint, metadata, new_versions):
+        return self.shard(_thread_id(config)).put(config, checkpoint, metadata, new_versions)
+
+    def put_writes(self, config, writes, task_id, task_path=""):
+        return self.shard(_thread_id(config)).put_writes(config, writes, task_id, task_path)
+
+    def delete_thread(self, thread_id):
+        return self.shard(thread_id).delete_thread(thread_id)
+
+    # Async
+
+    async def aget_tuple(self, config):
+        return await self.shard(_thread_id(config)).aget_tuple(config)
+
+    async def alist(self, config, *, filter=None, before=None, limit=None):
+        if config and config.get("configurable", {}).get("thread_id") is not None:
+            async for item in self.shard(_thread_id(config)).alist(
+                config, filter=filter, before=before, limit=limit
+            ):
+                yield item
+            return
+        results = []
+        for saver in self.shards:
+            results.append([item async for item in saver.alist(
+                config, filter=filter, before=before, limit=limit
+            )])
+        merged = heapq.merge(*results, key=_checkpoint_order, reverse=True)
+        for item in itertools.islice(merged, limit):
+            yield item
+
+    async def aput(self, config, checkpoint, metadata, new_versions):
+        return await self.shard(_thread_id(config)).aput(config, checkpoint, metadata, new_versions)
+
+    async def aput_writes(self, config, writes, task_id, task_path=""):
+        return await self.shard(_thread_id(config)).aput_writes(config, writes, task_id, task_path)
+
+    async def adelete_thread(self, thread_id):
+        return await self.shard(thread_id).adelete_thread(thread_id)
+
+def sharded(savers):
+    """One saver as is, several behind a ShardedSaver"""
+    return savers[0] if len(savers) == 1 else ShardedSaver(savers)
+
+def shard_savers(checkpointer):
+    """The per-shard savers behind a checkpointer"""
+    return list(getattr(checkpointer, "shards", [checkpointer]))
+
+# -----------------------------
+# Backends
+# -----------------------------
+
+class Storage(abc.ABC):
+    """How the SQLite storage is split into files and opened.
+
+    The app reaches storage only through the checkpointers below and, per
+    thread, a pool whose connection() / transaction() context managers run
+    chat_store's metadata SQL on sqlite3 connections. Listings call every
+    pool in pools().
+    """
+
+    @abc.abstractmethod
+    def checkpointer(self):
+        """Checkpointer for the sync workflow"""
+
+    @abc.abstractmethod
+    async def async_checkpointer(self):
+        """Checkpointer for the async workflow, opened in the running loop"""
+
+    @abc.abstractmethod
+    def pool_for(self, thread_id):
+        """Pool holding this thread's metadata"""
+
+    @abc.abstractmethod
+    def pools(self):
+        """Every pool, in shard order"""
+
+    def start_compaction(self, interval):
+        """Start the backend's retention job, if it has one"""
+
+class SqliteStorage(Storage):
+    """Threads sharded across `shards` SQLite files (one file when shards=1)"""
+
+    def __init__(self, db_path=DB_PATH, shards=DB_SHARDS, check_layout=True):
+        if check_layout:
+            ensure_single_layout(db_path, shards)
+        self.paths = shard_paths(db_path, shards)
+
+    def path_for(self, thread_id):
+        return self.paths[shard_index(thread_id, len(self.paths))]
+
+    def pool_for(self, thread_id):
+        return get_pool(self.path_for(thread_id))
+
+    def pools(self):
+        return [get_pool(path) for path in self.paths]
+
+    def checkpointer(self):
+        from chatbot_backend_fixed import IndexedSqliteSaver
+
+        savers = []
+        for path in self.paths:
+            # Dedicated connection (SqliteSaver serializes access with its own
+            # lock), configured like the pooled ones
+            saver = IndexedSqliteSaver(conn=db.connect(path))
+            # Index threads written before thread_index existed (no-op afterwards)
+            backfill_thread_index(saver)
+            savers.append(saver)
+        return sharded(savers)
+
+    async def async_checkpointer(self):
+        import aiosqlite
+        from chatbot_backend_async import IndexedAsyncSqliteSaver
+
+        savers = []
+        for path in self.paths:
+            conn = await aiosqlite.connect(path, timeout=DB_BUSY_TIMEOUT)
+            for pragma in PRAGMAS:
+                await conn.execute(pragma)
+            saver = IndexedAsyncSqliteSaver(conn)
+            await saver.setup()
+            savers.append(saver)
+        return sharded(savers)
+
+    def start_compaction(self, interval):
+        from compaction import start_background_compaction
+
+        for path in self.paths:
+            start_background_compaction(path, interval)
+
+BACKENDS = {
+    "sqlite": SqliteStorage,
+}
+
+# -----------------------------
+# Shard layouts
+# -----------------------------
+
+SHARD_NAME_RE = re.compile(r"-(\d{2,})-of-(\d{2,})$")
+
+class StorageLayoutError(RuntimeError):
+    """Threads are stored under a shard layout other than the configured one"""
+
+def layout_files(db_path=DB_PATH):
+    """{shard count: paths} of every layout with files next to db_path"""
+    root, ext = os.path.splitext(db_path)
+    layouts = {}
+    if os.path.exists(db_path):
+        layouts[1] = [db_path]
+    for path in glob.glob(f"{glob.escape(root)}-*-of-*{ext}"):
+        match = SHARD_NAME_RE.search(path[:len(path) - len(ext)])
+        if match:
+            layouts.setdefault(int(match.group(2)), []).append(path)
+    return {shards: sorted(paths) for shards, paths in layouts.items()}
+
+def has_threads(path):
+    """True if the file holds checkpoints or indexed threads (opened read-only)"""
+    try:
+        conn = sqlite3.connect(Path(path).resolve().as_uri() + "?mode=ro", uri=True)
+    except sqlite3.Error:
+        return False
+    try:
+        tables = {row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE type='table'")}
+        return any(
+            conn.execute(f"SELECT 1 FROM {table} LIMIT 1").fetchone()
+            for table in ("checkpoints", "thread_index") if table in tables
+        )
+    except sqlite3.Error:
+        return False
+    finally:
+        conn.close()
+
+def stranded_layouts(db_path=DB_PATH, shards=DB_SHARDS):
+    """{shard count: paths} of other layouts whose files still hold threads"""
+    stranded = {}
+    for count, paths in layout_files(db_path).items():
+        if count != shards:
+            paths = [path for path in paths if has_threads(path)]
+            if paths:
+                stranded[count] = paths
+    return stranded
+
+def ensure_single_layout(db_path=DB_PATH, shards=DB_SHARDS):
+    """Refuse to run while threads sit in files the current layout never reads"""
+    stranded = stranded_layouts(db_path, shards)
+    if stranded:
+        files = ", ".join(path for paths in stranded.values() for path in paths)
+        raise StorageLayoutError(
+            f"DB_SHARDS={shards}, but threads are stored in {files}. Stop the app and run "
+            f"`python storage.py --reshard` to move them (or set DB_SHARDS={min(stranded)})."
+        )
+
+def _move_threads(source, targets):
+    """Copy every thread of `source` into its shard among `targets`; returns the count"""
+    from langgraph.checkpoint.sqlite import SqliteSaver
+
+    conn = db.connect(source)
+    try:
+        existing = {row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE type='table'")}
+        tables = [table for table in THREAD_TABLES if table in existing]
+        thread_ids = sorted({
+            row[0] for table in tables for row in conn.execute(f"SELECT DISTINCT thread_id FROM {table}")
+        })
+    finally:
+        conn.close()
+
+    by_target = {}
+    for thread_id in thread_ids:
+        by_target.setdefault(targets[shard_index(thread_id, len(targets))], []).append(thread_id)
+    for target, ids in by_target.items():
+        conn = db.connect(target)
+        try:
+            SqliteSaver(conn).setup()
+            conn.execute("ATTACH DATABASE ? AS source", (source,))
+            with conn:
+                for table in tables:
+                    columns = ", ".join(row[1] for row in conn.execute(f"PRAGMA source.table_info({table})"))
+                    conn.execute(f"""
+                        INSERT OR REPLACE INTO main.{table} ({columns})
+                        SELECT {columns} FROM source.{table}
+                        WHERE thread_id IN (SELECT value FROM json_each(?))
+                    """, (json.dumps(ids),))
+            conn.execute("DETACH DATABASE source")
+        finally:
+            conn.close()
+    return len(thread_ids)
+
+def reshard(db_path=DB_PATH, shards=DB_SHARDS):
+    """Move the threads of every other layout into the `shards` layout.
+
+    Run with the app stopped. Each source file is renamed to *.resharded
+    once its threads are copied. Returns {source path: threads moved}.
+    """
+    targets = shard_paths(db_path, shards)
+    moved = {}
+    for count, paths in sorted(layout_files(db_path).items()):
+        if count == shards:
+            continue
+        for source in paths:
+            moved[source] = _move_threads(source, targets)
+            for suffix in ("", "-wal", "-shm"):
+                if os.path.exists(source + suffix):
+                    os.replace(source + suffix, source + ".resharded" + suffix)
+    return moved
+
+def load_backend(name=CHATBOT_STORAGE):
+    """Storage factory for a registered name or a "module:factory" path"""
+    if name in BACKENDS:
+        return BACKENDS[name]
+    module, sep, attr = name.partition(":")
+    if not sep:
+        raise ValueError(f"Unknown storage backend {name!r}; expected one of "
+                         f"{sorted(BACKENDS)} or 'module:factory'")
+    return getattr(importlib.import_module(module), attr)
+
+_storage = None
+_storage_lock = threading.Lock()
+
+def get_storage():
+    """Process-wide storage backend selected by CHATBOT_STORAGE"""
+    global _storage
+    with _storage_lock:
+        if _storage is None:
+            _storage = load_backend()()
+        return _storage
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Inspect or change the SQLite shard layout")
+    parser.add_argument("--db", default=DB_PATH, help="base database path")
+    parser.add_argument("--shards", type=int, default=DB_SHARDS, help="target shard count")
+    parser.add_argument("--reshard", action="store_true",
+                        help="move threads from every other layout into --shards files")
+    args = parser.parse_args(argv)
+
+    if args.reshard:
+        for source, count in reshard(args.db, max(1, args.shards)).items():
+            print(f"{source}: moved {count} threads (kept as {source}.resharded)")
+        return
+    for count, paths in sorted(layout_files(args.db).items()):
+        state = "current" if count == args.shards else "other layout"
+        for path in paths:
+            print(f"{path}: {count} shard(s), {state}, {'has threads' if has_threads(path) else 'empty'}")
+
+if __name__ == "__main__":
+    main()
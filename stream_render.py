@@ -0,0 +1,146 @@
+import os
+import time
+
+from metrics import registry
+from thread_index import message_text
+
+# Incremental renderer for `workflow.stream(..., stream_mode="messages")`.
+# Only answer tokens (chat_node chunks and fast_path replies) reach the
+# visible response; tool calls and tool results are reported separately as
+# progress lines. UI updates are batched: the answer is pushed to the
+# placeholder at most every STREAM_RENDER_INTERVAL seconds, or sooner once
+# STREAM_RENDER_CHARS characters are pending, so per-chunk work stays O(1)
+# instead of re-rendering the whole growing string for every token.
+
+# Constants
+STREAM_RENDER_INTERVAL = float(os.getenv('STREAM_RENDER_INTERVAL', '0.05'))
+STREAM_RENDER_CHARS = int(os.getenv('STREAM_RENDER_CHARS', '400'))
+ANSWER_NODES = ("chat_node", "fast_path")
+TOKENS_PER_SECOND_BUCKETS = (1, 5, 10, 20, 50, 100, 200, 500, 1000)
+
+def answer_text(chunk, metadata):
+    """Visible answer text carried by a streamed chunk, or "" """
+    if metadata.get("langgraph_node") not in ANSWER_NODES:
+        return ""
+    if getattr(chunk, "type", None) not in ("ai", "AIMessageChunk"):
+        return ""
+    return message_text(chunk)
+
+def tool_event(chunk, metadata):
+    """Progress line for a tool call or tool result, or None"""
+    if getattr(chunk, "type", None) == "tool":
+        latency = (chunk.response_metadata or {}).get("latency_ms")
+        took = f" in {latency / 1000:.1f}s" if latency is not None else ""
+        if getattr(chunk, "status", None) == "error":
+            return f"⚠️ `{chunk.name}` failed{took}"
+        return f"✅ `{chunk.name}` finished{took}"
+    if metadata.get("langgraph_node") == "chat_node":
+        for call in getattr(chunk, "tool_call_chunks", None) or []:
+            if call.get("name"):
+                return f"🔧 Calling `{call['name']}`…"
+    return None
+
+# -----------------------------
+# Renderer
+# -----------------------------
+
+class StreamRenderer:
+    """Feed (chunk, metadata) pairs; pushes batched answer text to `render`.
+
+    `render(text)` receives the full answer so far, `show_tools(lines)` the
+    list of tool progress lines whenever it changes.
+    """
+
+    def __init__(self, render, show_tools=None, interval=STREAM_RENDER_INTERVAL,
+                 max_pending=STREAM_RENDER_CHARS, clock=time.perf_counter):
+        self.render = render
+        self.show_tools = show_tools
+        self.interval = interval
+        self.max_pending = max_pending
+        self.clock = clock
+
+        self.parts = []
+        self.pending = 0
+        self.tool_lines = []
+        self.renders = 0
+        self.tokens = 0
+        self.usage_tokens = 0
+        self._message_id = None
+        self.started = clock()
+        self.first_token_at = None
+        self.last_token_at = None
+        self.last_render_at = self.started
+
+    @property
+    def text(self):
+        return "".join(self.parts)
+
+    def feed(self, chunk, metadata):
+        line = tool_event(chunk, metadata)
+        if line is not None:
+            self.tool_lines.append(line)
+            if self.show_tools:
+                self.show_tools(self.tool_lines)
+
+        # Usage often arrives on a trailing chunk without text
+        if metadata.get("langgraph_node") == "chat_node" and not getattr(chunk, "tool_call_chunks", None):
+            usage = getattr(chunk, "usage_metadata", None) or {}
+            self.usage_tokens += usage.get("output_tokens") or 0
+
+        text = answer_text(chunk, metadata)
+        if not text:
+            return
+        now = self.clock()
+        if self.first_token_at is None:
+            self.first_token_at = now
+        self.last_token_at = now
+        self.tokens += 1
+
+        # Text before a tool call and the answer after it are separate messages
+        message_id = getattr(chunk, "id", None)
+        if self.parts and message_id and self._message_id and message_id != self._message_id:
+            self.parts.append("\n\n")
+        self._message_id = message_id or self._message_id
+
+        self.parts.append(text)
+        self.pending += len(text)
+        if self.pending >= self.max_pending or now - self.last_render_at >= self.interval:
+            self.flush(now)
+
+    def flush(self, now=None):
+        if not self.pending:
+            return
+        # Collapse the parts so the next join only covers new chunks
+        text = self.text
+        self.parts = [text]
+        self.render(text)
+        self.pending = 0
+        self.renders += 1
+        self.last_render_at = self.clock() if now is None else now
+
+    def finish(self):
+        """Final flush; records time-to-first-token and throughput"""
+        self.flush()
+        stats = self.stats()
+        if stats["ttft_seconds"] is not None:
+            registry.observe("chatbot_stream_ttft_seconds", stats["ttft_seconds"],
+                             "Time from request to first answer token")
+        if stats["tokens_per_second"]:
+            registry.observe("chatbot_stream_tokens_per_second", stats["tokens_per_second"],
+                             "Answer streaming throughput", buckets=TOKENS_PER_SECOND_BUCKETS)
+        registry.observe("chatbot_stream_renders", self.renders, "UI updates per streamed answer",
+                         buckets=(1, 2, 5, 10, 20, 50, 100, 200))
+        return self.text
+
+    def stats(self):
+        # Providers that report usage give real token counts; else count chunks
+        tokens = self.usage_tokens or self.tokens
+        ttft = None if self.first_token_at is None else self.first_token_at - self.started
+        duration = (self.last_token_at - self.first_token_at) if self.first_token_at is not None else 0.0
+        return {
+            "ttft_seconds": ttft,
+            "tokens": tokens,
+            "tokens_per_second": tokens / duration if duration > 0 else None,
+            "chars": sum(len(p) for p in self.parts),
+            "renders": self.renders,
+        }
@@ -0,0 +1,60 @@
+import json
+import sys
+import threading
+import time
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from urllib.parse import parse_qs, urlparse
+
+import pytest
+
+# The modules live at the repository root, next to this directory
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+def global_quote(symbol, price="190.5500"):
+    return {"Global Quote": {"01. symbol": symbol, "05. price": price}}
+
+class StubAlphaVantage:
+    """Local GLOBAL_QUOTE endpoint counting requests per symbol.
+
+    `delay` seconds are added to every reply; `responses` overrides the
+    payload of a symbol (e.g. a rate-limit "Note").
+    """
+
+    def __init__(self):
+        self.requests = Counter()
+        self.delay = 0.0
+        self.responses = {}
+        self._lock = threading.Lock()
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                symbol = parse_qs(urlparse(self.path).query).get("symbol", [""])[0]
+                with stub._lock:
+                    stub.requests[symbol] += 1
+                time.sleep(stub.delay)
+                body = json.dumps(stub.responses.get(symbol, global_quote(symbol))).encode()
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.url = f"http://127.0.0.1:{self.server.server_port}/query"
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+@pytest.fixture
+def alphavantage():
+    stub = StubAlphaVantage()
+    yield stub
+    stub.close()
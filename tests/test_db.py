@@ -0,0 +1,31 @@
+import sqlite3
+import threading
+
+import pytest
+
+from db import ConnectionPool
+
+def test_exhausted_pool_fails_like_a_busy_database(tmp_path):
+    pool = ConnectionPool(str(tmp_path / "chatbot.db"), size=1, timeout=0.05)
+    holding = threading.Event()
+    release = threading.Event()
+
+    def hold():
+        with pool.connection():
+            holding.set()
+            release.wait(5)
+
+    holder = threading.Thread(target=hold)
+    holder.start()
+    holding.wait(5)
+    try:
+        with pytest.raises(sqlite3.OperationalError, match="connection pool exhausted"):
+            with pool.connection():
+                pass
+    finally:
+        release.set()
+        holder.join()
+
+    with pool.connection() as conn:
+        assert conn.execute("SELECT 1").fetchone() == (1,)
+    pool.close()
@@ -0,0 +1,220 @@
+import asyncio
+import threading
+import time
+
+import pytest
+from langchain_core.messages import AIMessage, HumanMessage, ToolMessage
+
+import llm_scheduler
+from benchmarks.fakes import FakeRateLimitError, RateLimitedChatModel
+from llm_scheduler import (
+    PRIORITY_FOLLOW_UP,
+    PRIORITY_INTERACTIVE,
+    LLMScheduler,
+    TokenBucket,
+    priority_for,
+)
+
+PROMPT = [HumanMessage(content="hello")]
+
+class Clock:
+    """Manually advanced stand-in for time.monotonic"""
+
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+class RecordingModel:
+    """Answers immediately and remembers the order of the prompts it saw"""
+
+    def __init__(self, usage=None):
+        self.seen = []
+        self.usage = usage
+        self._lock = threading.Lock()
+
+    def invoke(self, messages, config=None):
+        with self._lock:
+            self.seen.append(messages[-1].content)
+        return AIMessage(content="ok", usage_metadata=self.usage)
+
+class FailingModel:
+    def __init__(self, error):
+        self.error = error
+        self.calls = 0
+
+    def invoke(self, messages, config=None):
+        self.calls += 1
+        raise self.error
+
+@pytest.fixture
+def longest_backoff(monkeypatch):
+    """Full jitter always picks the upper bound, so backoffs are predictable"""
+    monkeypatch.setattr(llm_scheduler.random, "uniform", lambda low, high: high)
+
+# -----------------------------
+# Retries
+# -----------------------------
+
+def test_rate_limited_call_is_retried_until_the_quota_frees(longest_backoff):
+    model = RateLimitedChatModel(rpm=1, window=0.2)
+    scheduler = LLMScheduler(max_retries=5, backoff_base=0.05)
+
+    scheduler.invoke(model, PROMPT)
+    started = time.monotonic()
+    response = scheduler.invoke(model, PROMPT)
+
+    assert response.content.startswith("Answer:")
+    assert model.rejected >= 1
+    assert scheduler.stats()["retries"] == model.rejected
+    assert scheduler.stats()["failures"] == 0
+    assert time.monotonic() - started >= 0.05
+
+def test_backoff_doubles_per_attempt_and_is_capped(longest_backoff):
+    scheduler = LLMScheduler(backoff_base=0.5, backoff_max=3)
+    error = FakeRateLimitError("429")
+
+    assert [scheduler._backoff(error, attempt) for attempt in range(4)] == [0.5, 1.0, 2.0, 3]
+
+def test_rate_limit_empties_the_request_bucket():
+    scheduler = LLMScheduler(rpm=600)
+    assert scheduler.requests.tokens == 600
+
+    scheduler._backoff(FakeRateLimitError("429"), 0)
+
+    assert scheduler.requests.tokens <= 0
+
+def test_gives_up_after_max_retries(longest_backoff):
+    model = FailingModel(FakeRateLimitError("429 RESOURCE_EXHAUSTED"))
+    scheduler = LLMScheduler(max_retries=2, backoff_base=0.01)
+
+    with pytest.raises(FakeRateLimitError):
+        scheduler.invoke(model, PROMPT)
+
+    assert model.calls == 3
+    assert scheduler.stats()["retries"] == 2
+    assert scheduler.stats()["failures"] == 1
+    assert scheduler.stats()["running"] == 0
+
+def test_other_errors_are_not_retried():
+    model = FailingModel(ValueError("bad request"))
+    scheduler = LLMScheduler(backoff_base=0.01)
+
+    with pytest.raises(ValueError):
+        scheduler.invoke(model, PROMPT)
+
+    assert model.calls == 1
+    assert scheduler.stats()["retries"] == 0
+
+def test_async_rate_limited_call_is_retried(longest_backoff):
+    model = RateLimitedChatModel(rpm=1, window=0.2)
+    scheduler = LLMScheduler(max_retries=5, backoff_base=0.05)
+
+    async def calls():
+        await scheduler.ainvoke(model, PROMPT)
+        return await scheduler.ainvoke(model, PROMPT)
+
+    assert asyncio.run(calls()).content.startswith("Answer:")
+    assert model.rejected >= 1
+    assert scheduler.stats()["failures"] == 0
+
+# -----------------------------
+# Priorities
+# -----------------------------
+
+def test_follow_ups_wait_behind_new_turns():
+    assert priority_for(PROMPT) == PRIORITY_INTERACTIVE
+    assert priority_for([*PROMPT, ToolMessage(content="42", tool_call_id="1")]) == PRIORITY_FOLLOW_UP
+
+def test_queued_calls_are_served_by_priority_then_arrival():
+    model = RecordingModel()
+    scheduler = LLMScheduler(max_concurrency=1)
+    scheduler._acquire(PRIORITY_INTERACTIVE)   # hold the only slot
+
+    threads = []
+    for name, priority in (("follow-up 1", PRIORITY_FOLLOW_UP), ("follow-up 2", PRIORITY_FOLLOW_UP),
+                           ("turn 1", PRIORITY_INTERACTIVE), ("turn 2", PRIORITY_INTERACTIVE)):
+        thread = threading.Thread(target=scheduler.invoke,
+                                  args=(model, [HumanMessage(content=name)], priority))
+        thread.start()
+        threads.append(thread)
+        while scheduler.stats()["queued"] < len(threads):
+            time.sleep(0.005)
+
+    scheduler._release()
+    for thread in threads:
+        thread.join()
+
+    assert model.seen == ["turn 1", "turn 2", "follow-up 1", "follow-up 2"]
+    assert scheduler.stats()["running"] == 0
+
+def test_queue_timeout_frees_the_waiter():
+    scheduler = LLMScheduler(max_concurrency=1, queue_timeout=0.05)
+    scheduler._acquire(PRIORITY_INTERACTIVE)
+
+    with pytest.raises(llm_scheduler.QueueTimeout):
+        scheduler.invoke(RecordingModel(), PROMPT)
+
+    assert scheduler.stats()["queued"] == 0
+    assert scheduler.stats()["queue_timeouts"] == 1
+
+# -----------------------------
+# Token buckets
+# -----------------------------
+
+def test_bucket_allows_a_burst_then_spaces_requests():
+    clock = Clock()
+    bucket = TokenBucket(6, clock=clock)   # one unit every 10s
+
+    assert [bucket.reserve(1) for _ in range(6)] == [0.0] * 6
+    assert bucket.reserve(1) == pytest.approx(10)
+    assert bucket.reserve(1) == pytest.approx(20)
+
+    clock.now = 30
+    assert bucket.reserve(1) == pytest.approx(0)
+
+def test_bucket_refills_up_to_its_capacity():
+    clock = Clock()
+    bucket = TokenBucket(60, clock=clock)
+    bucket.reserve(60)
+
+    clock.now = 10
+    assert bucket.reserve(10) == 0.0
+    assert bucket.reserve(1) == pytest.approx(1)
+
+    clock.now = 3600
+    bucket.refund(0)
+    assert bucket.tokens == 60
+
+def test_oversized_reservation_waits_for_a_full_bucket():
+    bucket = TokenBucket(60, clock=Clock())
+
+    assert bucket.reserve(1000) == 0.0
+    assert bucket.reserve(1) == pytest.approx(1)
+
+def test_unlimited_bucket_never_waits():
+    bucket = TokenBucket(0)
+
+    assert bucket.reserve(10 ** 9) == 0.0
+
+def test_scheduler_holds_calls_to_the_request_limit(monkeypatch):
+    scheduler = LLMScheduler()
+    scheduler.requests = TokenBucket(3, clock=Clock())
+    sleeps = []
+    monkeypatch.setattr(scheduler, "_sleep", lambda seconds, cancel: sleeps.append(seconds))
+
+    for _ in range(5):
+        scheduler.invoke(RecordingModel(), PROMPT)
+
+    assert sleeps == [0.0, 0.0, 0.0, pytest.approx(20), pytest.approx(40)]
+    assert scheduler.stats()["throttled"] == 2
+
+def test_token_reservation_is_corrected_from_usage():
+    usage = {"input_tokens": 8, "output_tokens": 2, "total_tokens": 10}
+    scheduler = LLMScheduler(tpm=10_000, expected_output_tokens=500)
+    scheduler.tokens = TokenBucket(10_000, clock=Clock())
+
+    scheduler.invoke(RecordingModel(usage=usage), PROMPT)
+
+    assert scheduler.tokens.tokens == 10_000 - 10
@@ -0,0 +1,159 @@
+import asyncio
+import threading
+import time
+
+import pytest
+
+import chatbot_backend_async
+import quotes
+from cache import TTLCache
+
+@pytest.fixture
+def quote_cache(alphavantage, monkeypatch):
+    """Empty quote cache in front of the stub server, for both tool paths"""
+    def install(ttl=60.0, maxsize=256):
+        cache = TTLCache(ttl=ttl, maxsize=maxsize, should_cache=quotes.quote_cache.should_cache)
+        monkeypatch.setattr(quotes, "quote_cache", cache)
+        monkeypatch.setattr(chatbot_backend_async, "quote_cache", cache)
+        return cache
+    monkeypatch.setattr(quotes, "ALPHAVANTAGE_BASE_URL", alphavantage.url)
+    return install
+
+def run_async(coro):
+    """Run `coro` on a fresh loop with a fresh shared AsyncClient"""
+    async def main():
+        chatbot_backend_async._http_client = None
+        try:
+            return await coro
+        finally:
+            if chatbot_backend_async._http_client is not None:
+                await chatbot_backend_async._http_client.aclose()
+                chatbot_backend_async._http_client = None
+    return asyncio.run(main())
+
+# -----------------------------
+# Cache behaviour
+# -----------------------------
+
+def test_repeated_lookup_is_served_from_cache(alphavantage, quote_cache):
+    cache = quote_cache()
+    first = quotes.fetch_quote("aapl")
+    second = quotes.fetch_quote("AAPL")
+
+    assert first == second
+    assert first["Global Quote"]["05. price"] == "190.5500"
+    assert alphavantage.requests["AAPL"] == 1
+    assert cache.stats()["hits"] == 1
+    assert cache.stats()["misses"] == 1
+
+def test_entries_expire_after_ttl(alphavantage, quote_cache):
+    quote_cache(ttl=0.05)
+    quotes.fetch_quote("AAPL")
+    time.sleep(0.1)
+    quotes.fetch_quote("AAPL")
+
+    assert alphavantage.requests["AAPL"] == 2
+
+def test_least_recently_used_symbol_is_evicted(alphavantage, quote_cache):
+    cache = quote_cache(maxsize=2)
+    for symbol in ("AAPL", "MSFT", "AAPL", "TSLA"):
+        quotes.fetch_quote(symbol)
+
+    assert len(cache) == 2
+    quotes.fetch_quote("AAPL")
+    quotes.fetch_quote("MSFT")
+    assert alphavantage.requests["AAPL"] == 1
+    assert alphavantage.requests["MSFT"] == 2
+
+def test_concurrent_lookups_share_one_request(alphavantage, quote_cache):
+    cache = quote_cache()
+    alphavantage.delay = 0.2
+    results = []
+    threads = [
+        threading.Thread(target=lambda: results.append(quotes.fetch_quote("AAPL")))
+        for _ in range(8)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert len(results) == 8
+    assert alphavantage.requests["AAPL"] == 1
+    assert cache.stats()["coalesced"] == 7
+
+def test_several_symbols_in_one_call(alphavantage, quote_cache):
+    quote_cache()
+    result = quotes.fetch_quotes("AAPL, MSFT AAPL")
+
+    assert list(result) == ["AAPL", "MSFT"]
+    assert alphavantage.requests == {"AAPL": 1, "MSFT": 1}
+
+# -----------------------------
+# Error payloads
+# -----------------------------
+
+@pytest.mark.parametrize("payload", [
+    {"Note": "Thank you for using Alpha Vantage! Our standard API call frequency is 5 calls per minute."},
+    {"Information": "Our standard API rate limit is 25 requests per day."},
+    {"Error Message": "Invalid API call."},
+    {"Global Quote": {}},
+])
+def test_error_payloads_are_not_cached(alphavantage, quote_cache, payload):
+    cache = quote_cache()
+    alphavantage.responses["MSFT"] = payload
+
+    assert "error" in quotes.fetch_quote("MSFT")
+    assert "error" in quotes.fetch_quote("MSFT")
+    assert alphavantage.requests["MSFT"] == 2
+    assert len(cache) == 0
+
+def test_failed_request_is_an_error(quote_cache, monkeypatch):
+    quote_cache()
+    monkeypatch.setattr(quotes, "ALPHAVANTAGE_BASE_URL", "http://127.0.0.1:9/query")
+
+    assert quotes.fetch_quote("AAPL")["error"].startswith("API request failed")
+
+# -----------------------------
+# Async tool path
+# -----------------------------
+
+def test_async_lookups_share_one_request(alphavantage, quote_cache):
+    cache = quote_cache()
+    alphavantage.delay = 0.2
+
+    async def lookups():
+        return await asyncio.gather(*(chatbot_backend_async._afetch_quote("AAPL") for _ in range(8)))
+
+    results = run_async(lookups())
+
+    assert all(r == results[0] for r in results)
+    assert alphavantage.requests["AAPL"] == 1
+    assert cache.stats()["coalesced"] == 7
+    assert run_async(chatbot_backend_async._afetch_quote("AAPL")) == results[0]
+    assert alphavantage.requests["AAPL"] == 1
+
+def test_cancelled_async_lookup_does_not_fail_the_others(alphavantage, quote_cache):
+    quote_cache()
+    alphavantage.delay = 0.2
+
+    async def lookups():
+        first = asyncio.ensure_future(chatbot_backend_async._afetch_quote("AAPL"))
+        second = asyncio.ensure_future(chatbot_backend_async._afetch_quote("AAPL"))
+        await asyncio.sleep(0.05)
+        first.cancel()
+        return await second, first.cancelled()
+
+    result, cancelled = run_async(lookups())
+
+    assert cancelled
+    assert result["Global Quote"]["01. symbol"] == "AAPL"
+    assert alphavantage.requests["AAPL"] == 1
+
+def test_async_rate_limit_reply_is_not_cached(alphavantage, quote_cache):
+    quote_cache()
+    alphavantage.responses["AAPL"] = {"Note": "API call frequency exceeded"}
+
+    assert "error" in run_async(chatbot_backend_async._afetch_quote("AAPL"))
+    assert "error" in run_async(chatbot_backend_async._afetch_quote("AAPL"))
+    assert alphavantage.requests["AAPL"] == 2
@@ -0,0 +1,29 @@
+import pytest
+
+import speculation
+from cache import TTLCache
+
+@pytest.fixture
+def quote_cache(monkeypatch):
+    cache = TTLCache()
+    monkeypatch.setattr(speculation, "quote_cache", cache)
+    return cache
+
+@pytest.mark.parametrize("text, symbols", [
+    ("AAPL price", ["AAPL"]),
+    ("What is the price of BRK.B?", ["BRK.B"]),
+    ("How are $NVDA and $AMD doing today?", ["NVDA", "AMD"]),
+    ("buy shares in IT or HR", []),
+    ("Stock of LOVE", []),
+    ("What is the stock price of TSLA today?", []),
+    ("Explain how a state graph works", []),
+])
+def test_only_unambiguous_tickers_are_guessed(quote_cache, text, symbols):
+    assert speculation.match_tickers(text) == symbols
+
+def test_cue_word_tickers_need_a_warm_quote_cache(quote_cache):
+    quote_cache.set("TSLA", {"Global Quote": {"05. price": "250.00"}})
+
+    assert speculation.match_tickers("What is the stock price of TSLA today?") == ["TSLA"]
+    assert speculation.match_tickers("Is TSLA or GM stock cheaper?") == []
+    assert quote_cache.stats()["hits"] == 0
@@ -0,0 +1,37 @@
+import os
+import subprocess
+import sys
+from pathlib import Path
+
+import pytest
+
+from storage import SqliteStorage, Storage
+
+ROOT = Path(__file__).resolve().parent.parent
+
+def run_with_env(code, tmp_path, **env):
+    """Run `code` in a fresh interpreter, so module constants see `env`"""
+    return subprocess.run(
+        [sys.executable, "-c", code],
+        cwd=tmp_path, capture_output=True, text=True, timeout=60,
+        env={**os.environ, "PYTHONPATH": str(ROOT), "CHATBOT_FAKE_LLM": "0", **env},
+    )
+
+def test_conn_alias_is_the_first_shard_when_sharded(tmp_path):
+    result = run_with_env(
+        "from chatbot_backend_fixed import conn\n"
+        "print(conn.execute('PRAGMA database_list').fetchone()[2])",
+        tmp_path, DB_SHARDS="2", DB_PATH=str(tmp_path / "chatbot.db"),
+    )
+
+    assert result.returncode == 0, result.stderr
+    assert result.stdout.strip() == str(tmp_path / "chatbot-00-of-02.db")
+
+def test_storage_backends_must_implement_the_interface():
+    class Incomplete(Storage):
+        def pools(self):
+            return []
+
+    with pytest.raises(TypeError):
+        Incomplete()
+    assert issubclass(SqliteStorage, Storage)
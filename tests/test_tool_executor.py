@@ -0,0 +1,53 @@
+import asyncio
+import threading
+import time
+
+from langchain_core.messages import AIMessage
+from langchain_core.tools import tool
+
+from tool_executor import ConcurrentToolNode
+
+def tool_calls(*names):
+    return {"messages": [AIMessage(content="", tool_calls=[
+        {"name": name, "args": {"text": str(n)}, "id": f"call-{n}"} for n, name in enumerate(names)
+    ])]}
+
+@tool
+async def nap(text: str) -> str:
+    """Wait a moment, then echo the text."""
+    await asyncio.sleep(0.02)
+    return text
+
+def test_async_node_runs_on_several_event_loops():
+    node = ConcurrentToolNode([nap], max_workers=1)
+
+    for _ in range(2):
+        # Two calls on one worker make the second wait on the semaphore
+        result = asyncio.run(node.anode(tool_calls("nap", "nap")))
+        assert [m.status for m in result["messages"]] == ["success", "success"]
+
+def test_abandoned_calls_do_not_starve_later_calls():
+    release = threading.Event()
+
+    @tool
+    def hang(text: str) -> str:
+        """Block until the test ends."""
+        release.wait(10)
+        return text
+
+    @tool
+    def echo(text: str) -> str:
+        """Echo the text."""
+        return text
+
+    node = ConcurrentToolNode([hang, echo], max_workers=2, deadlines={"hang": 0.05, "echo": 1})
+    try:
+        first = node.node(tool_calls("hang", "hang"))
+        assert [m.status for m in first["messages"]] == ["error", "error"]
+
+        started = time.perf_counter()
+        second = node.node(tool_calls("echo"))
+        assert second["messages"][0].status == "success"
+        assert time.perf_counter() - started < 1
+    finally:
+        release.set()
@@ -0,0 +1,329 @@
+import time
+from datetime import datetime
+
+# Constants
+MAX_TITLE_LENGTH = 30
+# Message types the chat area renders
+DISPLAY_TYPES = ("human", "ai")
+
+# -----------------------------
+# Schema
+# -----------------------------
+
+# One row per thread so the sidebar can be loaded with a single indexed query
+# instead of decoding checkpoints. chat_titles / chat_pins remain the source of
+# truth for user edits and are mirrored into thread_index on every change.
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS thread_index (
+    thread_id TEXT PRIMARY KEY,
+    title TEXT,
+    created_at REAL,
+    last_active REAL,
+    pinned INTEGER DEFAULT 0,
+    message_count INTEGER DEFAULT 0,
+    title_set_by_user INTEGER DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS idx_thread_index_sidebar
+    ON thread_index (pinned DESC, last_active DESC);
+CREATE TABLE IF NOT EXISTS chat_titles (
+    thread_id TEXT PRIMARY KEY,
+    title TEXT,
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+CREATE TABLE IF NOT EXISTS chat_pins (
+    thread_id TEXT PRIMARY KEY,
+    pinned INTEGER DEFAULT 0
+);
+CREATE TABLE IF NOT EXISTS thread_messages (
+    thread_id TEXT NOT NULL,
+    idx INTEGER NOT NULL,
+    type TEXT,
+    content TEXT,
+    PRIMARY KEY (thread_id, idx)
+) WITHOUT ROWID;
+"""
+
+# thread_messages mirrors the text of the latest checkpoint's messages, one row
+# per message keyed by its position, so the chat area can read any window of
+# a long thread with a primary-key range scan instead of decoding the whole
+# checkpoint.
+
+# Columns added to thread_index after it first shipped, with the statements
+# that fill them in for existing rows
+ADDED_COLUMNS = (
+    ("title_set_by_user", "INTEGER DEFAULT 0", (
+        # Every title in chat_titles was typed by the user
+        "UPDATE thread_index SET title_set_by_user = 1"
+        " WHERE thread_id IN (SELECT thread_id FROM chat_titles)",
+    )),
+)
+TABLE_INFO_SQL = "PRAGMA table_info(thread_index)"
+
+def column_migrations(existing):
+    """Statements adding the ADDED_COLUMNS missing from `existing` column names"""
+    statements = []
+    for name, definition, fill in ADDED_COLUMNS:
+        if name not in existing:
+            statements.append(f"ALTER TABLE thread_index ADD COLUMN {name} {definition}")
+            statements.extend(fill)
+    return statements
+
+def ensure_thread_index(conn):
+    """Create the thread index (and metadata tables) if missing"""
+    conn.executescript(SCHEMA)
+    existing = {row[1] for row in conn.execute(TABLE_INFO_SQL)}
+    statements = column_migrations(existing)
+    if statements:
+        with conn:
+            for statement in statements:
+                conn.execute(statement)
+
+# -----------------------------
+# Titles
+# -----------------------------
+
+def generate_title(text, max_len=MAX_TITLE_LENGTH):
+    """Generate a title from text"""
+    if not text or not isinstance(text, str):
+        return "New Chat"
+
+    # Clean the text
+    text = str(text).strip().split("\n")[0]
+    text = text.replace("#", "").replace("*", "").replace("`", "").strip()
+
+    if len(text) > max_len:
+        return text[:max_len].strip() + "..."
+    return text if text else "New Chat"
+
+def title_from_messages(messages):
+    """Title for a thread: the first human message, cleaned"""
+    for msg in messages:
+        if getattr(msg, "type", None) == "human" and msg.content:
+            return generate_title(msg.content)
+    return "New Chat"
+
+def _parse_ts(ts):
+    """Convert a checkpoint ISO timestamp to epoch seconds"""
+    try:
+        return datetime.fromisoformat(ts).timestamp()
+    except (TypeError, ValueError):
+        return time.time()
+
+# -----------------------------
+# Writes
+# -----------------------------
+
+# A user-chosen title (title_set_by_user, even if it is "New Chat") is never
+# overwritten; the "New Chat" placeholder is replaced once the thread has a
+# human message.
+RECORD_CHECKPOINT_SQL = """
+    INSERT INTO thread_index
+        (thread_id, title, created_at, last_active, pinned, message_count)
+    VALUES (?, ?, ?, ?, 0, ?)
+    ON CONFLICT(thread_id) DO UPDATE SET
+        last_active = excluded.last_active,
+        message_count = excluded.message_count,
+        title = CASE
+            WHEN NOT thread_index.title_set_by_user
+                AND (thread_index.title IS NULL OR thread_index.title = 'New Chat')
+            THEN excluded.title
+            ELSE thread_index.title
+        END
+"""
+
+def record_checkpoint_params(thread_id, messages, ts=None):
+    """Parameters for RECORD_CHECKPOINT_SQL"""
+    now = _parse_ts(ts) if ts else time.time()
+    return (thread_id, title_from_messages(messages), now, now, len(messages))
+
+def message_text(msg):
+    """Displayable text of a message (list content is joined text parts)"""
+    content = getattr(msg, "content", "")
+    if isinstance(content, str):
+        return content
+    parts = []
+    for part in content or []:
+        if isinstance(part, str):
+            parts.append(part)
+        elif isinstance(part, dict) and part.get("type") == "text":
+            parts.append(part.get("text", ""))
+    return "".join(parts)
+
+# Messages only ever get appended in this graph, so each write inserts the
+# rows after the last stored index and trims anything past the new length.
+LAST_MESSAGE_IDX_SQL = "SELECT MAX(idx) FROM thread_messages WHERE thread_id = ?"
+INSERT_MESSAGES_SQL = """
+    INSERT OR REPLACE INTO thread_messages (thread_id, idx, type, content)
+    VALUES (?, ?, ?, ?)
+"""
+TRIM_MESSAGES_SQL = "DELETE FROM thread_messages WHERE thread_id = ? AND idx >= ?"
+
+def message_rows(thread_id, messages, last_idx):
+    """INSERT_MESSAGES_SQL rows for messages after `last_idx` (None: all)"""
+    start = 0 if last_idx is None else last_idx + 1
+    return [
+        (thread_id, idx, getattr(msg, "type", None), message_text(msg))
+        for idx, msg in enumerate(messages[start:], start)
+    ]
+
+def record_checkpoint(cursor, thread_id, messages, ts=None):
+    """Upsert the index row and append new message rows after a checkpoint write"""
+    cursor.execute(
+        RECORD_CHECKPOINT_SQL, record_checkpoint_params(thread_id, messages, ts)
+    )
+    last_idx = cursor.execute(LAST_MESSAGE_IDX_SQL, (thread_id,)).fetchone()[0]
+    cursor.executemany(INSERT_MESSAGES_SQL, message_rows(thread_id, messages, last_idx))
+    cursor.execute(TRIM_MESSAGES_SQL, (thread_id, len(messages)))
+
+async def arecord_checkpoint(conn, thread_id, messages, ts=None):
+    """record_checkpoint() on an aiosqlite connection (caller commits)"""
+    await conn.execute(RECORD_CHECKPOINT_SQL, record_checkpoint_params(thread_id, messages, ts))
+    async with conn.execute(LAST_MESSAGE_IDX_SQL, (thread_id,)) as cursor:
+        last_idx = (await cursor.fetchone())[0]
+    await conn.executemany(INSERT_MESSAGES_SQL, message_rows(thread_id, messages, last_idx))
+    await conn.execute(TRIM_MESSAGES_SQL, (thread_id, len(messages)))
+
+def set_title(cursor, thread_id, title):
+    """Mirror a saved title into the index"""
+    now = time.time()
+    cursor.execute("""
+        INSERT INTO thread_index (thread_id, title, created_at, last_active, title_set_by_user)
+        VALUES (?, ?, ?, ?, 1)
+        ON CONFLICT(thread_id) DO UPDATE SET title = excluded.title, title_set_by_user = 1
+    """, (thread_id, title, now, now))
+
+def set_pinned(cursor, thread_id, pinned):
+    """Mirror a saved pin state into the index"""
+    now = time.time()
+    cursor.execute("""
+        INSERT INTO thread_index (thread_id, title, created_at, last_active, pinned)
+        VALUES (?, 'New Chat', ?, ?, ?)
+        ON CONFLICT(thread_id) DO UPDATE SET pinned = excluded.pinned
+    """, (thread_id, now, now, int(pinned)))
+
+def remove_thread(cursor, thread_id):
+    """Drop a thread from the index"""
+    cursor.execute("DELETE FROM thread_index WHERE thread_id = ?", (thread_id,))
+    cursor.execute("DELETE FROM thread_messages WHERE thread_id = ?", (thread_id,))
+
+# -----------------------------
+# Reads
+# -----------------------------
+
+def load_thread_index(conn):
+    """Return (thread_id, title, last_active, pinned) rows in sidebar order"""
+    cursor = conn.execute("""
+        SELECT thread_id, title, last_active, pinned
+        FROM thread_index
+        ORDER BY pinned DESC, last_active DESC
+    """)
+    return cursor.fetchall()
+
+def thread_version(conn, thread_id):
+    """(message_count, last_active) of a thread; changes on every checkpoint"""
+    return conn.execute(
+        "SELECT message_count, last_active FROM thread_index WHERE thread_id = ?",
+        (thread_id,),
+    ).fetchone()
+
+def load_messages(conn, thread_id, limit, before=None):
+    """Up to `limit` displayable messages positioned before `before`.
+
+    Returns ((idx, type, content) rows oldest first, has_more).
+    """
+    placeholders = ", ".join("?" for _ in DISPLAY_TYPES)
+    rows = conn.execute(f"""
+        SELECT idx, type, content FROM thread_messages
+        WHERE thread_id = ? AND idx < ? AND type IN ({placeholders}) AND content != ''
+        ORDER BY idx DESC
+        LIMIT ?
+    """, (thread_id, before if before is not None else 2 ** 62, *DISPLAY_TYPES, limit + 1)).fetchall()
+    has_more = len(rows) > limit
+    return rows[:limit][::-1], has_more
+
+def first_human_message(conn, thread_id):
+    """Text of a thread's first user message, or None, without decoding checkpoints"""
+    row = conn.execute("""
+        SELECT content FROM thread_messages
+        WHERE thread_id = ? AND type = 'human'
+        ORDER BY idx
+        LIMIT 1
+    """, (thread_id,)).fetchone()
+    return row[0] if row else None
+
+# -----------------------------
+# Migration
+# -----------------------------
+
+MISSING_THREADS_SQL = """
+    SELECT DISTINCT thread_id FROM checkpoints
+    WHERE thread_id NOT IN (SELECT thread_id FROM thread_index)
+       OR thread_id NOT IN (SELECT thread_id FROM thread_messages)
+"""
+# Carry over titles and pins saved before the index existed
+CARRY_OVER_METADATA_SQL = """
+    UPDATE thread_index SET
+        title = COALESCE(
+            (SELECT title FROM chat_titles WHERE thread_id = ?), title),
+        title_set_by_user = EXISTS(
+            SELECT 1 FROM chat_titles WHERE thread_id = ?),
+        pinned = COALESCE(
+            (SELECT pinned FROM chat_pins WHERE thread_id = ?), pinned)
+    WHERE thread_id = ?
+"""
+
+def backfill_thread_index(saver):
+    """One-time migration: index threads that predate thread_index.
+
+    Only threads missing from the index or from thread_messages are decoded,
+    so after the first run this is a single anti-join query that returns no
+    rows.
+    """
+    conn = saver.conn
+    with saver.lock:
+        ensure_thread_index(conn)
+        tables = {row[0] for row in conn.execute(
+            "SELECT name FROM sqlite_master WHERE type='table'"
+        )}
+        if 'checkpoints' not in tables:
+            return 0
+        missing = [row[0] for row in conn.execute(MISSING_THREADS_SQL)]
+
+    indexed = 0
+    for thread_id in missing:
+        try:
+            latest = saver.get_tuple({"configurable": {"thread_id": thread_id}})
+            if latest is None:
+                continue
+            messages = latest.checkpoint.get("channel_values", {}).get("messages", [])
+            with saver.cursor() as cursor:
+                record_checkpoint(cursor, thread_id, messages, latest.checkpoint.get("ts"))
+                cursor.execute(CARRY_OVER_METADATA_SQL, (thread_id,) * 4)
+            indexed += 1
+        except Exception as e:
+            print(f"Error indexing thread {thread_id}: {e}")
+
+    return indexed
+
+async def abackfill_thread_index(saver):
+    """backfill_thread_index() for an AsyncSqliteSaver whose schema is set up"""
+    async with saver.lock:
+        async with saver.conn.execute(MISSING_THREADS_SQL) as cursor:
+            missing = [row[0] for row in await cursor.fetchall()]
+
+    indexed = 0
+    for thread_id in missing:
+        try:
+            latest = await saver.aget_tuple({"configurable": {"thread_id": thread_id}})
+            if latest is None:
+                continue
+            messages = latest.checkpoint.get("channel_values", {}).get("messages", [])
+            async with saver.lock:
+                await arecord_checkpoint(saver.conn, thread_id, messages, latest.checkpoint.get("ts"))
+                await saver.conn.execute(CARRY_OVER_METADATA_SQL, (thread_id,) * 4)
+                await saver.conn.commit()
+            indexed += 1
+        except Exception as e:
+            print(f"Error indexing thread {thread_id}: {e}")
+
+    return indexed
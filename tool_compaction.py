@@ -0,0 +1,225 @@
+import json
+import os
+import re
+import threading
+from urllib.parse import urlsplit, urlunsplit
+
+from history import CHARS_PER_TOKEN
+from metrics import registry
+
+# Post-tool compaction stage (the `compact_tools` node, between `tools` and
+# chat_node). Raw tool output is stored in the thread and re-sent to the
+# model on every later turn, so each new ToolMessage is rewritten in place
+# into a small typed JSON payload before chat_node first sees it:
+#
+#   stock                    {"symbol", "price", "change", "change_percent", "as_of"}
+#                            (keyed by symbol when several were requested)
+#   duckduckgo_results_json  top-k [{"title", "url", "snippet"}], deduplicated
+#                            by url and title, snippets cut at a word boundary
+#   anything else            truncated to TOOL_COMPACT_MAX_CHARS
+#
+# Error results are left alone. Bytes and estimated tokens saved are counted
+# per turn.
+
+# Constants
+TOOL_COMPACT_SEARCH_RESULTS = int(os.getenv('TOOL_COMPACT_SEARCH_RESULTS', '3'))
+TOOL_COMPACT_SNIPPET_CHARS = int(os.getenv('TOOL_COMPACT_SNIPPET_CHARS', '200'))
+TOOL_COMPACT_MAX_CHARS = int(os.getenv('TOOL_COMPACT_MAX_CHARS', '2000'))
+SAVED_BYTES_BUCKETS = (0, 64, 256, 1024, 4096, 16384, 65536)
+
+SEARCH_RESULT_RE = re.compile(
+    r"snippet: (?P<snippet>.*?), title: (?P<title>.*?), link: (?P<link>\S+?)[;,]?(?=\s+snippet: |\s*$)",
+    re.DOTALL,
+)
+
+def _dumps(payload):
+    return json.dumps(payload, ensure_ascii=False, separators=(",", ":"))
+
+def _number(value):
+    try:
+        return float(str(value).rstrip("%"))
+    except (TypeError, ValueError):
+        return None
+
+def clip(text, limit):
+    """Cut text at a word boundary to at most `limit` characters"""
+    text = " ".join(str(text).split())
+    if len(text) <= limit:
+        return text
+    cut = text[:limit].rsplit(" ", 1)[0] or text[:limit]
+    return cut.rstrip(" ,.;:") + "…"
+
+# -----------------------------
+# Quotes
+# -----------------------------
+
+def compact_quote(data):
+    """Typed quote from a GLOBAL_QUOTE payload; None if it is not one"""
+    quote = data.get("Global Quote") if isinstance(data, dict) else None
+    if not isinstance(quote, dict) or "05. price" not in quote:
+        return None
+    return {
+        "symbol": quote.get("01. symbol"),
+        "price": _number(quote.get("05. price")),
+        "change": _number(quote.get("09. change")),
+        "change_percent": _number(quote.get("10. change percent")),
+        "as_of": quote.get("07. latest trading day"),
+    }
+
+def compact_stock(content, artifact=None, limits=None):
+    data = json.loads(content)
+    if not isinstance(data, dict) or "error" in data:
+        return None
+    single = compact_quote(data)
+    if single is not None:
+        return _dumps(single)
+    # Several symbols: {symbol: payload}; errors per symbol are kept as they are
+    compacted = {}
+    for symbol, payload in data.items():
+        compacted[symbol] = compact_quote(payload) or payload
+    return _dumps(compacted)
+
+# -----------------------------
+# Search
+# -----------------------------
+
+def _canonical_url(url):
+    parts = urlsplit(url.strip())
+    return urlunsplit((parts.scheme.lower(), parts.netloc.lower().removeprefix("www."),
+                       parts.path.rstrip("/"), parts.query, ""))
+
+def search_results(content, artifact=None):
+    """[{title, url, snippet}] from the tool's artifact, or parsed from its text"""
+    if isinstance(artifact, list) and artifact and all(isinstance(r, dict) for r in artifact):
+        return [
+            {"title": r.get("title", ""), "url": r.get("link") or r.get("href", ""),
+             "snippet": r.get("snippet") or r.get("body", "")}
+            for r in artifact
+        ]
+    try:
+        parsed = json.loads(content)
+    except ValueError:
+        parsed = None
+    if isinstance(parsed, list):
+        return search_results(None, parsed)
+    return [
+        {"title": m["title"], "url": m["link"], "snippet": m["snippet"]}
+        for m in SEARCH_RESULT_RE.finditer(content)
+    ]
+
+def compact_search(content, artifact=None, limits=None):
+    top_k, snippet_chars = limits or (TOOL_COMPACT_SEARCH_RESULTS, TOOL_COMPACT_SNIPPET_CHARS)
+    results, urls, titles = [], set(), set()
+    for result in search_results(content, artifact):
+        url = _canonical_url(result["url"]) if result["url"] else ""
+        title = " ".join(result["title"].split()).casefold()
+        if (url and url in urls) or (title and title in titles):
+            continue
+        urls.add(url)
+        titles.add(title)
+        results.append({
+            "title": clip(result["title"], 120),
+            "url": result["url"],
+            "snippet": clip(result["snippet"], snippet_chars),
+        })
+        if len(results) == top_k:
+            break
+    return _dumps(results) if results else None
+
+COMPACTORS = {
+    "stock": compact_stock,
+    "duckduckgo_results_json": compact_search,
+}
+
+# -----------------------------
+# Node
+# -----------------------------
+
+class ToolCompactor:
+    """Graph node shrinking the ToolMessages added by the last `tools` step"""
+
+    def __init__(self, compactors=None, search_results=TOOL_COMPACT_SEARCH_RESULTS,
+                 snippet_chars=TOOL_COMPACT_SNIPPET_CHARS, max_chars=TOOL_COMPACT_MAX_CHARS):
+        self.compactors = COMPACTORS if compactors is None else compactors
+        self.search_limits = (search_results, snippet_chars)
+        self.max_chars = max_chars
+        self.totals = {"messages": 0, "compacted": 0, "bytes_in": 0, "bytes_out": 0}
+        self._lock = threading.Lock()
+
+    def compact_content(self, message):
+        """Compacted content for one ToolMessage, or None to keep it as is"""
+        content = message.content
+        if message.status == "error" or not isinstance(content, str):
+            return None
+        compactor = self.compactors.get(message.name)
+        compacted = None
+        if compactor is not None:
+            try:
+                compacted = compactor(content, message.artifact, self.search_limits)
+            except (ValueError, TypeError, AttributeError):
+                compacted = None  # unexpected shape: fall back to truncation
+        if compacted is None and len(content) > self.max_chars:
+            compacted = content[:self.max_chars] + "…[truncated]"
+        if compacted is None or len(compacted) >= len(content):
+            return None
+        return compacted
+
+    def _new_tool_messages(self, messages):
+        """ToolMessages after the last AI message (the latest tools step)"""
+        tail = []
+        for message in reversed(messages):
+            if message.type != "tool":
+                break
+            tail.append(message)
+        return tail[::-1]
+
+    def node(self, state):
+        """Replace this step's tool results (same ids) with compact payloads"""
+        updates = []
+        bytes_in = bytes_out = 0
+        tool_messages = self._new_tool_messages(state['messages'])
+        for message in tool_messages:
+            compacted = self.compact_content(message)
+            if compacted is None:
+                continue
+            before = len(message.content.encode("utf-8"))
+            after = len(compacted.encode("utf-8"))
+            bytes_in += before
+            bytes_out += after
+            updates.append(message.model_copy(update={
+                "content": compacted,
+                # The raw payload is not needed once compacted
+                "artifact": None,
+                "response_metadata": {**message.response_metadata, "compacted_from_bytes": before},
+            }))
+
+        saved = bytes_in - bytes_out
+        with self._lock:
+            self.totals["messages"] += len(tool_messages)
+            self.totals["compacted"] += len(updates)
+            self.totals["bytes_in"] += bytes_in
+            self.totals["bytes_out"] += bytes_out
+        if tool_messages:
+            registry.observe("chatbot_tool_compaction_saved_bytes", saved,
+                             "Tool output bytes removed per turn", buckets=SAVED_BYTES_BUCKETS)
+            registry.inc("chatbot_tool_compaction_saved_bytes_total", saved,
+                         "Tool output bytes removed by compaction")
+            registry.inc("chatbot_tool_compaction_saved_tokens_total", saved // CHARS_PER_TOKEN,
+                         "Estimated prompt tokens removed by compaction")
+        return {'messages': updates} if updates else {}
+
+    async def anode(self, state):
+        """Async node: compaction is pure CPU, so just run it"""
+        return self.node(state)
+
+    def stats(self):
+        with self._lock:
+            totals = dict(self.totals)
+        saved = totals["bytes_in"] - totals["bytes_out"]
+        return {
+            **totals,
+            "saved_bytes": saved,
+            "saved_tokens": saved // CHARS_PER_TOKEN,
+        }
+
+tool_compactor = ToolCompactor()
@@ -0,0 +1,291 @@
+import asyncio
+import json
+import os
+import threading
+import time
+import weakref
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+
+from langchain_core.messages import ToolMessage
+
+from cancellation import CANCEL_POLL_SECONDS, TurnCancelled, race, token_for
+from metrics import record_tool_call, registry
+
+# Replacement for ToolNode(tools_list): every tool call of the last AI message
+# runs concurrently on a bounded worker pool, each with its own deadline. A
+# call that misses its deadline or raises becomes an error ToolMessage, so one
+# slow search can no longer hold up the whole turn. When the turn's cancel
+# token fires (cancellation.py), calls still running are answered with
+# "cancelled" error ToolMessages and their results discarded. With a
+# `prefetcher` (speculation.py), calls that were already started speculatively
+# next to chat_node take the prefetched result instead of running again.
+#
+# A sync tool call cannot be interrupted: one that misses its deadline keeps
+# its worker thread until it returns. Once such abandoned calls hold half of
+# the workers, new calls go to a fresh pool and the old one is left to wind
+# down, so a hanging upstream cannot push later calls past their deadlines
+# (the stuck threads still exist until their calls return).
+
+# Constants
+TOOL_MAX_WORKERS = int(os.getenv('TOOL_MAX_WORKERS', '8'))
+TOOL_DEFAULT_DEADLINE = float(os.getenv('TOOL_DEFAULT_DEADLINE', '15'))
+
+def parse_deadlines(spec):
+    """Parse "stock=10,calculator=2" into {"stock": 10.0, "calculator": 2.0}"""
+    deadlines = {}
+    for item in (spec or '').split(','):
+        name, sep, seconds = item.partition('=')
+        if sep and name.strip():
+            try:
+                deadlines[name.strip()] = float(seconds)
+            except ValueError:
+                print(f"Ignoring invalid tool deadline: {item}")
+    return deadlines
+
+# Per-tool deadlines in seconds, e.g. TOOL_DEADLINES="stock=10,duckduckgo_results_json=8"
+TOOL_DEADLINES = parse_deadlines(os.getenv('TOOL_DEADLINES', ''))
+
+def error_message(call, error, latency):
+    """Structured error result for a tool call"""
+    return ToolMessage(
+        content=json.dumps({"error": error}),
+        tool_call_id=call["id"],
+        name=call["name"],
+        status="error",
+        response_metadata={"latency_ms": round(latency * 1000, 2)},
+    )
+
+# -----------------------------
+# Latency stats
+# -----------------------------
+
+class ToolStats:
+    """Per-tool call counts, latency totals, timeouts and errors"""
+
+    def __init__(self):
+        self._stats = {}
+        self._lock = threading.Lock()
+
+    def record(self, name, latency, outcome="ok"):
+        record_tool_call(name, latency, outcome)
+        with self._lock:
+            stats = self._stats.setdefault(name, {
+                "calls": 0, "total_seconds": 0.0, "max_seconds": 0.0,
+                "timeouts": 0, "errors": 0, "cancelled": 0,
+            })
+            stats["calls"] += 1
+            stats["total_seconds"] += latency
+            stats["max_seconds"] = max(stats["max_seconds"], latency)
+            if outcome == "timeout":
+                stats["timeouts"] += 1
+            elif outcome == "error":
+                stats["errors"] += 1
+            elif outcome == "cancelled":
+                stats["cancelled"] += 1
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                name: dict(stats, avg_seconds=stats["total_seconds"] / stats["calls"])
+                for name, stats in self._stats.items()
+            }
+
+# -----------------------------
+# Node
+# -----------------------------
+
+class ConcurrentToolNode:
+    """Graph node running the last AI message's tool calls concurrently.
+
+    The async node bounds concurrency with one semaphore per event loop, so
+    the same node can be driven from several loops (asyncio.run per request,
+    tests, a restarted server).
+    """
+
+    def __init__(self, tools, max_workers=TOOL_MAX_WORKERS,
+                 deadlines=None, default_deadline=TOOL_DEFAULT_DEADLINE, prefetcher=None):
+        self.tools_by_name = {t.name: t for t in tools}
+        self.prefetcher = prefetcher
+        self.deadlines = TOOL_DEADLINES if deadlines is None else deadlines
+        self.default_deadline = default_deadline
+        self.max_workers = max_workers
+        self.stats = ToolStats()
+        # Shared across turns so the total number of tool threads stays bounded
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="tool")
+        self._submitted = weakref.WeakSet()   # futures of the current pool
+        self._abandoned = set()                # of those, given up but still running
+        self._semaphores = weakref.WeakKeyDictionary()   # event loop -> Semaphore
+        self._lock = threading.Lock()
+
+    def deadline_for(self, name):
+        return self.deadlines.get(name, self.default_deadline)
+
+    def _tool_calls(self, state):
+        return getattr(state['messages'][-1], 'tool_calls', None) or []
+
+    def _claim(self, config, calls):
+        """Speculative prefetch for each call, or None"""
+        if self.prefetcher is None:
+            return [None] * len(calls)
+        return self.prefetcher.claim(config, calls)
+
+    def _finish(self, call, result, latency):
+        """Stamp latency on a tool result and record it"""
+        result.response_metadata = {**result.response_metadata, "latency_ms": round(latency * 1000, 2)}
+        self.stats.record(call["name"], latency, "error" if result.status == "error" else "ok")
+        return result
+
+    def _fail(self, call, error, started, outcome="error"):
+        latency = time.perf_counter() - started
+        self.stats.record(call["name"], latency, outcome)
+        return error_message(call, error, latency)
+
+    def _result(self, future, timeout, token):
+        """future.result(timeout), giving up with TurnCancelled when the token fires"""
+        if token is None:
+            return future.result(timeout=timeout)
+        deadline = time.perf_counter() + timeout
+        while True:
+            if token.cancelled and not future.done():
+                raise token.error("tools")
+            remaining = deadline - time.perf_counter()
+            try:
+                return future.result(timeout=max(0.0, min(remaining, CANCEL_POLL_SECONDS)))
+            except FutureTimeoutError:
+                if remaining <= CANCEL_POLL_SECONDS:
+                    raise
+
+    def _submit(self, call, config):
+        """Start a call on the pool, first replacing a pool clogged by abandoned calls"""
+        with self._lock:
+            if len(self._abandoned) >= max(1, self.max_workers // 2):
+                # The old pool's threads exit once their abandoned calls return
+                self._pool.shutdown(wait=False)
+                self._pool = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="tool")
+                self._submitted = weakref.WeakSet()
+                self._abandoned = set()
+                registry.inc("chatbot_tool_pool_replacements_total", 1,
+                             "Tool worker pools replaced because abandoned calls held their workers")
+            future = self._pool.submit(self._invoke, call, config)
+            self._submitted.add(future)
+        return future
+
+    def _abandon(self, future):
+        """Give up on a call; a worker still running it is counted against the pool"""
+        if future.cancel() or future.done():
+            return
+        with self._lock:
+            if future not in self._submitted:
+                return   # a speculative prefetch, or a call of an already replaced pool
+            abandoned = self._abandoned
+            abandoned.add(future)
+        future.add_done_callback(lambda done: self._release(abandoned, done))
+
+    def _release(self, abandoned, future):
+        with self._lock:
+            abandoned.discard(future)
+
+    def _semaphore(self):
+        """The running loop's semaphore (asyncio primitives are bound to one loop)"""
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            semaphore = self._semaphores.get(loop)
+            if semaphore is None:
+                semaphore = self._semaphores[loop] = asyncio.Semaphore(self.max_workers)
+            return semaphore
+
+    def _invoke(self, call, config=None):
+        """Run one tool call (in a worker thread); returns (result, latency)"""
+        started = time.perf_counter()
+        result = self.tools_by_name[call["name"]].invoke({**call, "type": "tool_call"}, config)
+        return result, time.perf_counter() - started
+
+    def node(self, state, config=None):
+        """Sync node: run the tool calls on the worker pool"""
+        calls = self._tool_calls(state)
+        token = token_for(config)
+        started = time.perf_counter()
+        speculations = self._claim(config, calls)
+        futures = []
+        for call, speculation in zip(calls, speculations):
+            if token is not None and token.cancelled:
+                futures.append(False)
+            elif speculation is not None:
+                futures.append(speculation.future)
+            elif call["name"] in self.tools_by_name:
+                futures.append(self._submit(call, config))
+            else:
+                futures.append(None)
+
+        results = []
+        for call, speculation, future in zip(calls, speculations, futures):
+            if future is False:
+                results.append(self._fail(call, str(token.error("tools")), started, "cancelled"))
+                continue
+            if future is None:
+                results.append(self._fail(call, f"Unknown tool: {call['name']}", started))
+                continue
+            deadline = self.deadline_for(call["name"])
+            remaining = max(0.0, started + deadline - time.perf_counter())
+            try:
+                value = self._result(future, remaining, token)
+                if speculation is not None:
+                    value = self.prefetcher.use(speculation, call, *value, started)
+                results.append(self._finish(call, *value))
+            except TurnCancelled as e:
+                self._abandon(future)
+                results.append(self._fail(call, str(e), started, "cancelled"))
+            except FutureTimeoutError:
+                # The worker thread cannot be interrupted; its result is discarded
+                self._abandon(future)
+                results.append(self._fail(
+                    call, f"Tool '{call['name']}' timed out after {deadline}s", started, "timeout"
+                ))
+            except Exception as e:
+                results.append(self._fail(call, str(e), started))
+
+        return {'messages': results}
+
+    async def _ainvoke(self, call, config, started, speculation=None):
+        deadline = self.deadline_for(call["name"])
+        token = token_for(config)
+        try:
+            if speculation is not None:
+                value = await asyncio.wait_for(
+                    race(speculation.future, token, "tools"),
+                    timeout=max(0.0, started + deadline - time.perf_counter()),
+                )
+                return self._finish(call, *self.prefetcher.use(speculation, call, *value, started))
+            async with self._semaphore():
+                if token is not None:
+                    token.check("tools")
+                call_started = time.perf_counter()
+                result = await asyncio.wait_for(
+                    race(self.tools_by_name[call["name"]].ainvoke({**call, "type": "tool_call"}, config),
+                         token, "tools"),
+                    timeout=max(0.0, started + deadline - time.perf_counter()),
+                )
+            return self._finish(call, result, time.perf_counter() - call_started)
+        except TurnCancelled as e:
+            return self._fail(call, str(e), started, "cancelled")
+        except asyncio.TimeoutError:
+            return self._fail(
+                call, f"Tool '{call['name']}' timed out after {deadline}s", started, "timeout"
+            )
+        except Exception as e:
+            return self._fail(call, str(e), started)
+
+    async def anode(self, state, config=None):
+        """Async node: run the tool calls as concurrent tasks"""
+        calls = self._tool_calls(state)
+        started = time.perf_counter()
+
+        async def run(call, speculation):
+            if call["name"] not in self.tools_by_name:
+                return self._fail(call, f"Unknown tool: {call['name']}", started)
+            return await self._ainvoke(call, config, started, speculation)
+
+        speculations = self._claim(config, calls)
+        return {'messages': list(await asyncio.gather(*(
+            run(call, speculation) for call, speculation in zip(calls, speculations)
+        )))}
@@ -0,0 +1,707 @@
+import argparse
+import importlib
+import json
+import os
+import re
+import shutil
+import sqlite3
+import threading
+import time
+import zlib
+from contextlib import contextmanager
+
+import numpy as np
+
+import db
+from metrics import registry
+from storage import get_storage
+from thread_index import DISPLAY_TYPES
+
+# Local vector index over past conversations, for retrieval-augmented answers
+# (the `past_conversations` tool). Everything stays on disk next to the app:
+# no embedding API, no vector database.
+#
+#   - Messages are embedded by a local embedder (HashingEmbedder by default:
+#     feature-hashed words and word bigrams) into L2-normalized float32
+#     vectors, so a dot product is the cosine similarity.
+#   - Vectors live in memory-mapped files under VECTOR_INDEX_DIR. New ones
+#     are appended to the tail file and searched by brute force; once the
+#     tail holds VECTOR_TAIL_MAX rows it is merged into the main file, which
+#     keeps rows grouped by inverted list (k-means centroids), so a query
+#     reads VECTOR_PROBES contiguous slices instead of every row.
+#   - meta.db maps vector rows to (thread_id, idx) in thread_messages and
+#     records how far each storage shard has been indexed; its write lock
+#     also serializes writers across processes.
+#
+# sync() picks up threads whose last_active moved since the previous sync and
+# embeds their messages past the last indexed idx. It also forgets threads
+# that were deleted: their rows stop matching at once, and their vectors are
+# left out of the files by the next merge (forced once VECTOR_TAIL_MAX rows
+# are waiting to be merged or dropped).
+#
+# Usage:
+#     VECTOR_INDEX=1 streamlit run frontend_fixed.py
+#     python vector_index.py --sync
+#     python vector_index.py --query "roadmap for learning rust"
+#     python vector_index.py --rebuild
+
+# Constants
+VECTOR_INDEX_DIR = os.getenv('VECTOR_INDEX_DIR', 'vector_index')
+VECTOR_EMBEDDER = os.getenv('VECTOR_EMBEDDER', 'hashing')
+VECTOR_DIM = int(os.getenv('VECTOR_DIM', '256'))
+VECTOR_LISTS = int(os.getenv('VECTOR_LISTS', '1024'))
+VECTOR_PROBES = int(os.getenv('VECTOR_PROBES', '16'))
+# Rows searched by brute force before they are merged into the lists
+VECTOR_TAIL_MAX = int(os.getenv('VECTOR_TAIL_MAX', '16384'))
+VECTOR_SYNC_INTERVAL = float(os.getenv('VECTOR_SYNC_INTERVAL', '60'))
+VECTOR_RESULTS = int(os.getenv('VECTOR_RESULTS', '5'))
+VECTOR_MIN_SCORE = float(os.getenv('VECTOR_MIN_SCORE', '0.2'))
+VECTOR_SYNC_BATCH = 1024
+# Threads active this many seconds before the last sync are checked again, so
+# a checkpoint committed late (its ts is taken before the write) is not missed
+VECTOR_SYNC_OVERLAP = 60
+VECTOR_MAX_CHARS = 2000
+SNIPPET_CHARS = 300
+# Matches fetched per requested result before keeping the best hit per thread
+VECTOR_OVERFETCH = 5
+KMEANS_ITERATIONS = 8
+KMEANS_SAMPLE_PER_LIST = 64
+ASSIGN_CHUNK = 65536
+SEARCH_SECONDS_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25)
+
+TOKEN_RE = re.compile(r"\w+")
+STOP_WORDS = frozenset("""
+    a about an and are as at be but by can could do does for from had has have how i if in
+    is it its me my of on or our so than that the their them then there these they this to
+    us was we were what when where which who why will with would you your
+""".split())
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS vector_rows (
+    row INTEGER PRIMARY KEY,
+    thread_id TEXT NOT NULL,
+    idx INTEGER NOT NULL,
+    UNIQUE (thread_id, idx)
+);
+CREATE TABLE IF NOT EXISTS vector_state (
+    key TEXT PRIMARY KEY,
+    value TEXT
+);
+"""
+
+_display = ", ".join("?" for _ in DISPLAY_TYPES)
+NEW_MESSAGES_SQL = f"""
+    SELECT idx, content FROM thread_messages
+    WHERE thread_id = ? AND idx > ? AND type IN ({_display}) AND content != ''
+    ORDER BY idx
+"""
+
+def normalize(vectors):
+    """Rows scaled to unit length (all-zero rows are left as they are)"""
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    norms[norms == 0] = 1
+    return (vectors / norms).astype(np.float32, copy=False)
+
+def top_k(scores, k):
+    """Positions of the k highest scores, best first"""
+    if len(scores) > k:
+        positions = np.argpartition(-scores, k - 1)[:k]
+    else:
+        positions = np.arange(len(scores))
+    return positions[np.argsort(-scores[positions], kind="stable")]
+
+# -----------------------------
+# Embedders
+# -----------------------------
+
+class HashingEmbedder:
+    """Feature-hashed bag of words and word bigrams; offline and stateless.
+
+    Each feature adds ±1 to one of `dim` buckets (crc32 picks both, stable
+    across processes) and the vector is L2-normalized. Any object with the
+    same `name`, `dim` and `embed(texts)` can replace it (VECTOR_EMBEDDER).
+    """
+
+    def __init__(self, dim=VECTOR_DIM):
+        self.dim = dim
+        self.name = f"hashing-{dim}"
+
+    def features(self, text):
+        words = [w for w in TOKEN_RE.findall(text[:VECTOR_MAX_CHARS].casefold()) if w not in STOP_WORDS]
+        return words + [f"{a} {b}" for a, b in zip(words, words[1:])]
+
+    def embed(self, texts):
+        """(len(texts), dim) float32 array of unit vectors"""
+        rows, cols, signs = [], [], []
+        for row, text in enumerate(texts):
+            for feature in self.features(text):
+                h = zlib.crc32(feature.encode("utf-8"))
+                rows.append(row)
+                cols.append(h % self.dim)
+                signs.append(1.0 if h & 0x80000000 else -1.0)
+        vectors = np.zeros((len(texts), self.dim), dtype=np.float32)
+        np.add.at(vectors, (rows, cols), signs)
+        return normalize(vectors)
+
+EMBEDDERS = {
+    "hashing": HashingEmbedder,
+}
+
+def load_embedder(name=VECTOR_EMBEDDER):
+    """Embedder for a registered name or a "module:factory" path"""
+    if name in EMBEDDERS:
+        return EMBEDDERS[name]()
+    module, sep, attr = name.partition(":")
+    if not sep:
+        raise ValueError(f"Unknown embedder {name!r}; expected one of "
+                         f"{sorted(EMBEDDERS)} or 'module:factory'")
+    return getattr(importlib.import_module(module), attr)()
+
+# -----------------------------
+# Inverted lists
+# -----------------------------
+
+def train_lists(sample, lists, iterations=KMEANS_ITERATIONS, seed=0):
+    """Spherical k-means centroids for `lists` inverted lists"""
+    rng = np.random.default_rng(seed)
+    lists = min(lists, len(sample))
+    centroids = sample[rng.choice(len(sample), lists, replace=False)].copy()
+    for _ in range(iterations):
+        labels = np.argmax(sample @ centroids.T, axis=1)
+        order = np.argsort(labels, kind="stable")
+        counts = np.bincount(labels, minlength=lists)
+        starts = np.concatenate(([0], np.cumsum(counts)[:-1]))
+        filled = counts > 0
+        sums = np.zeros_like(centroids)
+        sums[filled] = np.add.reduceat(sample[order], starts[filled])
+        # Lists that lost every point restart from a random sample row
+        empty = np.flatnonzero(~filled)
+        sums[empty] = sample[rng.choice(len(sample), len(empty), replace=False)]
+        centroids = normalize(sums)
+    return centroids
+
+def assign_lists(vectors, centroids):
+    """Nearest centroid of every row, computed in chunks"""
+    labels = np.empty(len(vectors), dtype=np.int32)
+    for start in range(0, len(vectors), ASSIGN_CHUNK):
+        chunk = np.asarray(vectors[start:start + ASSIGN_CHUNK])
+        labels[start:start + len(chunk)] = np.argmax(chunk @ centroids.T, axis=1)
+    return labels
+
+class _Segment:
+    """Main file: rows grouped by list; rows of list l are offsets[l]:offsets[l + 1]"""
+
+    def __init__(self, vectors, ids, centroids, offsets):
+        self.vectors = vectors
+        self.ids = ids
+        self.centroids = centroids
+        self.offsets = offsets
+
+# -----------------------------
+# Index
+# -----------------------------
+
+class VectorIndex:
+    """Memory-mapped vector index of thread messages, see the notes above"""
+
+    def __init__(self, path=VECTOR_INDEX_DIR, embedder=None, lists=VECTOR_LISTS,
+                 probes=VECTOR_PROBES, tail_max=VECTOR_TAIL_MAX):
+        self.path = path
+        self.embedder = embedder or load_embedder()
+        self.dim = self.embedder.dim
+        self.lists = lists
+        self.probes = probes
+        self.tail_max = tail_max
+        self.searches = 0
+        self.added = 0
+        self._conn = None
+        self._loaded = None
+        self._main = None
+        self._tail = np.empty((0, self.dim), dtype=np.float32)
+        self._tail_start = 0
+        self._lock = threading.RLock()
+        self._sync_lock = threading.Lock()
+
+    # Files and state
+
+    def _file(self, name):
+        return os.path.join(self.path, name)
+
+    def _connection(self):
+        """One meta.db connection, serialized by the lock; caller holds the lock"""
+        if self._conn is None:
+            os.makedirs(self.path, exist_ok=True)
+            conn = db.configure(sqlite3.connect(
+                self._file("meta.db"), timeout=db.DB_BUSY_TIMEOUT,
+                check_same_thread=False, isolation_level=None,
+            ))
+            conn.executescript(SCHEMA)
+            conn.execute(
+                "INSERT OR IGNORE INTO vector_state (key, value) VALUES ('embedder', ?)",
+                (self.embedder.name,),
+            )
+            built_with = conn.execute("SELECT value FROM vector_state WHERE key = 'embedder'").fetchone()[0]
+            if built_with != self.embedder.name:
+                conn.close()
+                raise ValueError(f"Vector index in {self.path} was built with {built_with}, not "
+                                 f"{self.embedder.name}; run python vector_index.py --rebuild")
+            self._conn = conn
+        return self._conn
+
+    def _state(self, conn):
+        state = dict(conn.execute("SELECT key, value FROM vector_state").fetchall())
+        return {
+            "generation": int(state.get("generation", 0)),
+            "tail_start": int(state.get("tail_start", 0)),
+            "tail_rows": int(state.get("tail_rows", 0)),
+            "trained_rows": int(state.get("trained_rows", 0)),
+            "dropped_rows": int(state.get("dropped_rows", 0)),
+            **{k: float(v) for k, v in state.items() if k.startswith("synced:")},
+        }
+
+    def _set_state(self, conn, **values):
+        conn.executemany(
+            "INSERT OR REPLACE INTO vector_state (key, value) VALUES (?, ?)",
+            [(key, str(value)) for key, value in values.items()],
+        )
+
+    @contextmanager
+    def _write(self):
+        """meta.db write transaction; BEGIN IMMEDIATE also locks out other processes"""
+        with self._lock:
+            conn = self._connection()
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                yield conn
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+            conn.execute("COMMIT")
+        self.refresh()
+
+    def _has_main(self, generation):
+        """False before the first merge, or when a merge found no rows left"""
+        return generation > 0 and os.path.exists(self._file(f"main-{generation}.npz"))
+
+    def _map(self, name, rows):
+        if rows == 0:
+            return np.empty((0, self.dim), dtype=np.float32)
+        return np.memmap(self._file(name), dtype=np.float32, mode="r", shape=(rows, self.dim))
+
+    def refresh(self):
+        """Re-map the files when this or another process has added rows"""
+        with self._lock:
+            state = self._state(self._connection())
+            loaded = (state["generation"], state["tail_rows"])
+            if loaded == self._loaded:
+                return
+            generation = state["generation"]
+            if self._loaded is None or self._loaded[0] != generation:
+                self._main = None
+                if self._has_main(generation):
+                    with np.load(self._file(f"main-{generation}.npz")) as meta:
+                        ids, centroids, offsets = meta["ids"], meta["centroids"], meta["offsets"]
+                    self._main = _Segment(
+                        self._map(f"main-{generation}.f32", len(ids)), ids, centroids, offsets
+                    )
+            self._tail = self._map(f"tail-{generation}.f32", state["tail_rows"])
+            self._tail_start = state["tail_start"]
+            self._loaded = loaded
+
+    # Writes
+
+    def add(self, vectors, keys, merge=True):
+        """Append unit vectors for (thread_id, idx) keys; keys already indexed are skipped.
+
+        With merge=False a full tail is left for a later merge() (bulk loads).
+        """
+        vectors = np.asarray(vectors, dtype=np.float32).reshape(-1, self.dim)
+        with self._write() as conn:
+            fresh = [
+                i for i, key in enumerate(keys)
+                if conn.execute(
+                    "SELECT 1 FROM vector_rows WHERE thread_id = ? AND idx = ?", key
+                ).fetchone() is None
+            ]
+            if not fresh:
+                return 0
+            state = self._state(conn)
+            first = state["tail_start"] + state["tail_rows"]
+            size = state["tail_rows"] * self.dim * 4
+            with open(self._file(f"tail-{state['generation']}.f32"), "a+b") as f:
+                # Drop bytes a crashed writer appended but never committed
+                f.truncate(size)
+                f.write(vectors[fresh].tobytes())
+                f.flush()
+                os.fsync(f.fileno())
+            conn.executemany(
+                "INSERT INTO vector_rows (row, thread_id, idx) VALUES (?, ?, ?)",
+                [(first + n, *keys[i]) for n, i in enumerate(fresh)],
+            )
+            tail_rows = state["tail_rows"] + len(fresh)
+            self._set_state(conn, tail_rows=tail_rows)
+            if merge and tail_rows >= self.tail_max:
+                self._merge(conn, dict(state, tail_rows=tail_rows))
+        self.added += len(fresh)
+        registry.inc("chatbot_vector_rows_added_total", len(fresh), "Messages added to the vector index")
+        return len(fresh)
+
+    def add_texts(self, texts, keys, merge=True):
+        return self.add(self.embedder.embed(texts), keys, merge) if texts else 0
+
+    def forget(self, thread_ids):
+        """Drop the rows of deleted threads; returns how many were dropped.
+
+        They stop matching right away; their vectors stay in the files until
+        the next merge rewrites them.
+        """
+        thread_ids = list(thread_ids)
+        if not thread_ids:
+            return 0
+        with self._write() as conn:
+            dropped = conn.execute(
+                "DELETE FROM vector_rows WHERE thread_id IN (SELECT value FROM json_each(?))",
+                (json.dumps(thread_ids),),
+            ).rowcount
+            if dropped:
+                self._set_state(conn, dropped_rows=self._state(conn)["dropped_rows"] + dropped)
+        if dropped:
+            registry.inc("chatbot_vector_rows_dropped_total", dropped,
+                         "Vector index rows dropped for deleted threads")
+        return dropped
+
+    def merge(self, force=False):
+        """Merge the tail (and drop forgotten rows) once VECTOR_TAIL_MAX rows wait, or with force any"""
+        with self._write() as conn:
+            state = self._state(conn)
+            if state["tail_rows"] + state["dropped_rows"] >= (1 if force else self.tail_max):
+                self._merge(conn, state)
+
+    def _live_rows(self, conn):
+        """Sorted rows that still map to a message (forget() removed the others)"""
+        return np.fromiter((row for row, in conn.execute("SELECT row FROM vector_rows ORDER BY row")),
+                           dtype=np.int64)
+
+    def _merge(self, conn, state):
+        """Fold the tail into the main file (retraining the lists when the index doubled).
+
+        Rows of forgotten threads are not copied into the new files.
+        """
+        generation = state["generation"]
+        main = self._main if self._loaded and self._loaded[0] == generation else None
+        if main is None and self._has_main(generation):
+            with np.load(self._file(f"main-{generation}.npz")) as meta:
+                main = _Segment(self._map(f"main-{generation}.f32", len(meta["ids"])),
+                                meta["ids"], meta["centroids"], meta["offsets"])
+        tail = self._map(f"tail-{generation}.f32", state["tail_rows"])
+        tail_ids = np.arange(state["tail_start"], state["tail_start"] + len(tail), dtype=np.int64)
+
+        sources = [(tail, tail_ids)]
+        if main is not None:
+            sources.insert(0, (main.vectors, main.ids))
+        live_rows = self._live_rows(conn)
+        keeps = [np.flatnonzero(np.isin(source_ids, live_rows)) for _, source_ids in sources]
+        total = sum(len(keep) for keep in keeps)
+        new = generation + 1
+        trained_rows = 0
+        if total:
+            retrained = self._write_main(new, sources, keeps, total, state, main)
+            trained_rows = total if retrained else state["trained_rows"]
+        open(self._file(f"tail-{new}.f32"), "wb").close()
+        self._set_state(conn, generation=new, tail_start=state["tail_start"] + len(tail),
+                        tail_rows=0, trained_rows=trained_rows, dropped_rows=0)
+        # Processes still mapping the old files keep reading them until they refresh
+        for name in (f"main-{generation}.f32", f"main-{generation}.npz", f"tail-{generation}.f32"):
+            if os.path.exists(self._file(name)):
+                os.remove(self._file(name))
+        registry.inc("chatbot_vector_merges_total", 1, "Vector index tail merges")
+
+    def _write_main(self, new, sources, keeps, total, state, main):
+        """Write main-{new} from the kept rows of every (vectors, ids) source.
+
+        Sources are [main, tail] or [tail]; returns True if the lists were retrained.
+        """
+        retrained = main is None or total >= 2 * state["trained_rows"]
+        if retrained:
+            rng = np.random.default_rng(total)
+            lists = min(self.lists, max(1, int(4 * total ** 0.5)))
+            per_source = lists * KMEANS_SAMPLE_PER_LIST * np.array([len(keep) for keep in keeps]) // total
+            sample = np.concatenate([
+                vectors[keep[np.sort(rng.choice(len(keep), min(len(keep), n), replace=False))]]
+                for (vectors, _), keep, n in zip(sources, keeps, per_source)
+            ])
+            centroids = train_lists(sample, lists)
+            labels = [assign_lists(vectors, centroids) for vectors, _ in sources]
+        else:
+            centroids = main.centroids
+            # Main rows are already grouped, so their labels come from the offsets
+            labels = [np.repeat(np.arange(len(centroids), dtype=np.int32), np.diff(main.offsets)),
+                      assign_lists(sources[-1][0], centroids)]
+
+        lists = len(centroids)
+        # Dropped rows go to one extra list past the end, which is never written
+        for label, keep in zip(labels, keeps):
+            dropped = np.ones(len(label), dtype=bool)
+            dropped[keep] = False
+            label[dropped] = lists
+        orders = [np.argsort(l, kind="stable") for l in labels]
+        bounds = [np.concatenate(([0], np.cumsum(np.bincount(l, minlength=lists + 1)))) for l in labels]
+        offsets = np.sum(bounds, axis=0)[:lists + 1]
+        ids = np.empty(total, dtype=np.int64)
+        with open(self._file(f"main-{new}.f32"), "wb") as f:
+            for l in range(lists):
+                for (vectors, source_ids), order, bound in zip(sources, orders, bounds):
+                    rows = order[bound[l]:bound[l + 1]]
+                    if not len(rows):
+                        continue
+                    if rows[-1] - rows[0] + 1 == len(rows):
+                        block = vectors[rows[0]:rows[-1] + 1]   # contiguous: no gather
+                    else:
+                        block = vectors[rows]
+                    f.write(np.ascontiguousarray(block).tobytes())
+            f.flush()
+            os.fsync(f.fileno())
+        for l in range(lists):
+            position = offsets[l]
+            for (_, source_ids), order, bound in zip(sources, orders, bounds):
+                rows = order[bound[l]:bound[l + 1]]
+                ids[position:position + len(rows)] = source_ids[rows]
+                position += len(rows)
+        np.savez(self._file(f"main-{new}.npz"), ids=ids, centroids=centroids, offsets=offsets)
+        return retrained
+
+    # Sync
+
+    def _last_indexed(self, thread_id):
+        with self._lock:
+            row = self._connection().execute(
+                "SELECT MAX(idx) FROM vector_rows WHERE thread_id = ?", (thread_id,)
+            ).fetchone()
+        return -1 if row[0] is None else row[0]
+
+    def _sync_pool(self, pool, key):
+        with self._lock:
+            since = self._state(self._connection()).get(key, 0.0)
+        with pool.connection() as conn:
+            threads = conn.execute(
+                "SELECT thread_id, last_active FROM thread_index WHERE last_active >= ? ORDER BY last_active",
+                (since - VECTOR_SYNC_OVERLAP,),
+            ).fetchall()
+        added, texts, keys, newest = 0, [], [], since
+        for thread_id, last_active in threads:
+            with pool.connection() as conn:
+                rows = conn.execute(
+                    NEW_MESSAGES_SQL, (thread_id, self._last_indexed(thread_id), *DISPLAY_TYPES)
+                ).fetchall()
+            for idx, content in rows:
+                texts.append(content)
+                keys.append((thread_id, idx))
+            if len(texts) >= VECTOR_SYNC_BATCH:
+                added += self.add_texts(texts, keys, merge=False)
+                texts, keys = [], []
+            newest = max(newest, last_active or 0.0)
+        added += self.add_texts(texts, keys, merge=False)
+        with self._write() as conn:
+            self._set_state(conn, **{key: newest})
+        return added
+
+    def _deleted_threads(self, storage):
+        """Indexed threads no longer in thread_index (deleted since they were indexed)"""
+        with self._lock:
+            indexed = [row[0] for row in self._connection().execute(
+                "SELECT DISTINCT thread_id FROM vector_rows"
+            )]
+        by_pool = {}
+        for thread_id in indexed:
+            pool = storage.pool_for(thread_id)
+            by_pool.setdefault(id(pool), (pool, []))[1].append(thread_id)
+        deleted = []
+        for pool, thread_ids in by_pool.values():
+            with pool.connection() as conn:
+                deleted += [row[0] for row in conn.execute(
+                    "SELECT value FROM json_each(?) WHERE value NOT IN (SELECT thread_id FROM thread_index)",
+                    (json.dumps(thread_ids),),
+                )]
+        return deleted
+
+    def sync(self, storage=None):
+        """Embed messages written since the last sync; returns the number added"""
+        storage = storage or get_storage()
+        with self._sync_lock:
+            added = sum(
+                self._sync_pool(pool, f"synced:{getattr(pool, 'db_path', i)}")
+                for i, pool in enumerate(storage.pools())
+            )
+            self.forget(self._deleted_threads(storage))
+            # One merge per sync, however large the backlog was
+            self.merge()
+            return added
+
+    # Search
+
+    def search_vectors(self, queries, k=VECTOR_RESULTS, probes=None):
+        """Top-k (rows, scores) arrays per query vector, best first"""
+        started = time.perf_counter()
+        self.refresh()
+        with self._lock:
+            main, tail, tail_start = self._main, self._tail, self._tail_start
+        queries = np.asarray(queries, dtype=np.float32).reshape(-1, self.dim)
+        found = [([], []) for _ in queries]
+
+        if len(tail):
+            scores = np.asarray(tail @ queries.T)
+            for q, (rows, values) in enumerate(found):
+                best = top_k(scores[:, q], k)
+                rows.append(best + tail_start)
+                values.append(scores[best, q])
+
+        if main is not None:
+            probes = min(probes or self.probes, len(main.centroids))
+            closest = queries @ main.centroids.T
+            if probes < len(main.centroids):
+                probed = np.argpartition(-closest, probes - 1, axis=1)[:, :probes]
+            else:
+                probed = np.broadcast_to(np.arange(probes), closest.shape)
+            # Each probed list is scored once against every query that probes it
+            pairs = sorted(zip(probed.ravel().tolist(), np.repeat(np.arange(len(queries)), probes).tolist()))
+            start = 0
+            while start < len(pairs):
+                l = pairs[start][0]
+                end = start
+                while end < len(pairs) and pairs[end][0] == l:
+                    end += 1
+                lo, hi = main.offsets[l], main.offsets[l + 1]
+                if hi > lo:
+                    group = [q for _, q in pairs[start:end]]
+                    scores = np.asarray(main.vectors[lo:hi] @ queries[group].T)
+                    for column, q in enumerate(group):
+                        best = top_k(scores[:, column], k)
+                        found[q][0].append(main.ids[lo + best])
+                        found[q][1].append(scores[best, column])
+                start = end
+
+        results = []
+        for rows, values in found:
+            rows = np.concatenate(rows) if rows else np.empty(0, dtype=np.int64)
+            values = np.concatenate(values) if values else np.empty(0, dtype=np.float32)
+            best = top_k(values, k)
+            results.append((rows[best], values[best]))
+
+        elapsed = time.perf_counter() - started
+        with self._lock:
+            self.searches += len(queries)
+        registry.observe("chatbot_vector_search_seconds", elapsed,
+                         "Vector index search latency per batch", buckets=SEARCH_SECONDS_BUCKETS)
+        return results
+
+    def search(self, texts, k=VECTOR_RESULTS, probes=None):
+        """search_vectors() for query texts"""
+        return self.search_vectors(self.embedder.embed(list(texts)), k, probes)
+
+    def keys(self, rows):
+        """{row: (thread_id, idx)} for vector rows"""
+        rows = [int(r) for r in rows]
+        if not rows:
+            return {}
+        with self._lock:
+            found = self._connection().execute(
+                f"SELECT row, thread_id, idx FROM vector_rows WHERE row IN ({', '.join('?' for _ in rows)})",
+                rows,
+            ).fetchall()
+        return {row: (thread_id, idx) for row, thread_id, idx in found}
+
+    def related(self, query, k=VECTOR_RESULTS, exclude_thread=None, min_score=VECTOR_MIN_SCORE,
+                storage=None):
+        """Best matching message of up to k other threads, as dicts, best first"""
+        storage = storage or get_storage()
+        (rows, scores), = self.search([query], k * VECTOR_OVERFETCH)
+        keys = self.keys(rows)
+        results, seen = [], set()
+        for row, score in zip(rows.tolist(), scores.tolist()):
+            if score < min_score or len(results) == k:
+                break
+            thread_id, idx = keys.get(row, (None, None))
+            if thread_id is None or thread_id == exclude_thread or thread_id in seen:
+                continue
+            with storage.pool_for(thread_id).connection() as conn:
+                found = conn.execute("""
+                    SELECT m.content, t.title, t.last_active
+                    FROM thread_messages m JOIN thread_index t USING (thread_id)
+                    WHERE m.thread_id = ? AND m.idx = ?
+                """, (thread_id, idx)).fetchone()
+            if found is None:
+                continue   # thread deleted (or trimmed) since it was indexed
+            seen.add(thread_id)
+            content, title, last_active = found
+            results.append({
+                "thread_id": thread_id,
+                "title": title or "New Chat",
+                "last": last_active,
+                "idx": idx,
+                "score": round(score, 3),
+                "text": content[:SNIPPET_CHARS] + ("…" if len(content) > SNIPPET_CHARS else ""),
+            })
+        return results
+
+    def stats(self):
+        with self._lock:
+            main_rows = len(self._main.ids) if self._main is not None else 0
+            return {
+                "rows": main_rows + len(self._tail),
+                "main_rows": main_rows,
+                "tail_rows": len(self._tail),
+                "lists": len(self._main.centroids) if self._main is not None else 0,
+                "added": self.added,
+                "searches": self.searches,
+            }
+
+    def close(self):
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+def start_background_sync(index, interval=VECTOR_SYNC_INTERVAL):
+    """Run index.sync() now and then every `interval` seconds on a daemon thread.
+
+    Returns a threading.Event; set it to stop the job.
+    """
+    stop = threading.Event()
+
+    def run():
+        while True:
+            try:
+                index.sync()
+            except (sqlite3.Error, OSError, ValueError) as e:
+                print(f"Error syncing vector index: {e}")
+            if stop.wait(interval):
+                return
+
+    threading.Thread(target=run, name="vector-index-sync", daemon=True).start()
+    return stop
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Build or query the local vector index")
+    parser.add_argument("--dir", default=VECTOR_INDEX_DIR, help="index directory")
+    parser.add_argument("--sync", action="store_true", help="index messages written since the last sync")
+    parser.add_argument("--rebuild", action="store_true", help="drop the index and index everything again")
+    parser.add_argument("--query", default=None, help="print the threads most similar to this text")
+    parser.add_argument("-k", type=int, default=VECTOR_RESULTS, help="results for --query")
+    args = parser.parse_args(argv)
+
+    if args.rebuild and os.path.isdir(args.dir):
+        shutil.rmtree(args.dir)
+    index = VectorIndex(args.dir)
+    if args.sync or args.rebuild:
+        started = time.perf_counter()
+        added = index.sync()
+        print(f"Indexed {added} messages in {time.perf_counter() - started:.1f}s")
+    if args.query:
+        for hit in index.related(args.query, args.k):
+            print(f"  {hit['score']:.3f}  {hit['title'][:30]:30}  {hit['text'][:80]!r}")
+    index.refresh()
+    print(index.stats())
+    index.close()
+
+if __name__ == "__main__":
+    main()